@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import runpy
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+from benchmarks.stub_coingecko import SyntheticMarket, StubCoinGeckoServer
+from benchmarks.stub_postgrest import StubPostgrestServer
+
+# Offline end-to-end benchmark of the ingest scripts
+# Runs add_new_coins and store_real_time_prices unmodified against the stub
+# CoinGecko and PostgREST servers (through COINGECKO_API_URL, SUPABASE_URL and a
+# temporary config in COINGECKO_DATA_CONFIG, so no real state file is touched)
+# and reports rows/sec, API calls per stored row and run time percentiles.
+#
+#   python -m benchmarks.run_benchmarks --coins 5000 --tracked 1000 --runs 10 --latency-ms 80 --throttle-rate 0.02
+
+def benchmark_config(directory, args):
+    """The project config with every state and log file moved to directory"""
+    from utils.config import load_config
+    config = load_config()
+    for key, value in list(config.items()):
+        if key.endswith('_file'):
+            config[key] = os.path.join(directory, os.path.basename(value))
+    config['log_directory'] = os.path.join(directory, 'logs')
+    config['metrics_directory'] = os.path.join(directory, 'metrics')
+    if not args.spool:
+        config.pop('write_spool_file', None)
+    if not args.cache:
+        config.pop('response_cache_file', None) # per process cache only, every run fetches
+    config['price_min_refresh_seconds'] = args.min_refresh
+    config['price_max_refresh_seconds'] = args.max_refresh
+    if args.max_run_time:
+        config['max_run_time_seconds'] = args.max_run_time
+    return config
+
+def measure(run_once, runs, coingecko, postgrest, between_runs = None, quiet = True):
+    """Run run_once runs times, returns per run seconds and the API calls, 429s and rows written over all runs"""
+    calls, throttled, rows = coingecko.api_calls(), coingecko.throttled, sum(postgrest.database.rows_written.values())
+    seconds, errors = [], 0
+    for run in range(runs):
+        if between_runs and run:
+            between_runs()
+        started = time.monotonic()
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+                run_once()
+        except Exception as exception:
+            errors += 1
+            print(f"Run {run + 1} failed: {exception}")
+        seconds.append(time.monotonic() - started)
+
+    return {
+        'seconds': seconds,
+        'errors': errors,
+        'api_calls': coingecko.api_calls() - calls,
+        'throttled': coingecko.throttled - throttled,
+        'rows': sum(postgrest.database.rows_written.values()) - rows
+    }
+
+def summarize(task, result, extra_seconds = 0.0):
+    seconds = np.array(result['seconds'])
+    total_seconds = float(seconds.sum()) + extra_seconds
+    rows = result['rows']
+    return {
+        'task': task,
+        'runs': len(seconds),
+        'errors': result['errors'],
+        'rows': rows,
+        'api_calls': result['api_calls'],
+        'throttled': result['throttled'],
+        'rows_per_second': rows / total_seconds if total_seconds else None,
+        'api_calls_per_row': result['api_calls'] / rows if rows else None,
+        'p50_run_seconds': float(np.percentile(seconds, 50)),
+        'p95_run_seconds': float(np.percentile(seconds, 95)),
+        'max_run_seconds': float(seconds.max())
+    }
+
+def bench_add_new_coins(args, market, coingecko, postgrest):
+    def run_once():
+        sys.argv = ['add_new_coins.py']
+        try:
+            runpy.run_module('recurring_tasks.add_new_coins', run_name='__main__')
+        except SystemExit:
+            pass # unchanged coin list
+
+    return summarize('add_new_coins', measure(run_once, args.runs, coingecko, postgrest,
+        between_runs = lambda: market.churn(args.churn, args.churn // 2, args.churn // 5), quiet = not args.verbose))
+
+def bench_store_real_time_prices(args, market, coingecko, postgrest):
+    from recurring_tasks.store_real_time_prices import RealTimePriceCollector
+    from utils.config import load_config
+
+    # Coins table as add_new_coins and an operator would leave it
+    database = postgrest.database
+    if not database.tables.get('coins'):
+        database.write('coins', [{'id': coin['id'], 'symbol': coin['symbol'], 'name': coin['name'], 'market_cap_rank': rank + 1}
+            for rank, coin in enumerate(market.coins_list())], None, 'merge-duplicates')
+    database.set_tracked(args.tracked)
+
+    collector = RealTimePriceCollector(load_config())
+    result = measure(collector.run, args.runs, coingecko, postgrest,
+        between_runs = (lambda: time.sleep(args.interval)) if args.interval else None, quiet = not args.verbose)
+
+    # Spooled rows reach the database in close(), count them and the drain time
+    rows = sum(database.rows_written.values())
+    started = time.monotonic()
+    collector.close()
+    result['rows'] += sum(database.rows_written.values()) - rows
+    return summarize('store_real_time_prices', result, extra_seconds = time.monotonic() - started)
+
+BENCHMARKS = {
+    'add_new_coins': bench_add_new_coins,
+    'store_real_time_prices': bench_store_real_time_prices
+}
+
+def print_report(results):
+    columns = [('task', '{}', 24), ('runs', '{}', 5), ('errors', '{}', 7), ('rows', '{}', 9), ('api_calls', '{}', 10),
+        ('throttled', '{}', 10), ('rows_per_second', '{:.1f}', 16), ('api_calls_per_row', '{:.4f}', 18),
+        ('p50_run_seconds', '{:.2f}', 16), ('p95_run_seconds', '{:.2f}', 16)]
+    print(''.join(name.ljust(width) for name, _, width in columns))
+    for result in results:
+        print(''.join(('-' if result[name] is None else form.format(result[name])).ljust(width) for name, form, width in columns))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ingest scripts against local stub servers")
+    parser.add_argument('--tasks', default=','.join(BENCHMARKS), help=f"comma separated tasks (default: {','.join(BENCHMARKS)})")
+    parser.add_argument('--runs', type=int, default=5, help="runs per task")
+    parser.add_argument('--coins', type=int, default=2000, help="coins in the synthetic universe")
+    parser.add_argument('--recorded', help="a recorded /coins/markets response (JSON list) to use as the universe")
+    parser.add_argument('--tracked', type=int, default=500, help="coins with track_prices")
+    parser.add_argument('--churn', type=int, default=20, help="coins listed between add_new_coins runs (half as many renamed, a fifth delisted)")
+    parser.add_argument('--update-seconds', type=float, default=0, help="seconds a coin's market data stays unchanged (last_updated included)")
+    parser.add_argument('--latency-ms', type=float, default=50, help="API response latency")
+    parser.add_argument('--jitter-ms', type=float, default=20, help="random extra API latency")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="share of API requests answered with 429")
+    parser.add_argument('--retry-after', type=float, default=1, help="Retry-After of the 429 responses (seconds)")
+    parser.add_argument('--db-latency-ms', type=float, default=5, help="database latency per request")
+    parser.add_argument('--db-row-latency-us', type=float, default=20, help="database latency per row written")
+    parser.add_argument('--plan', default='analyst', help="CoinGecko plan, sets the client side rate limit")
+    parser.add_argument('--min-refresh', type=float, default=1, help="price_min_refresh_seconds")
+    parser.add_argument('--max-refresh', type=float, default=30, help="price_max_refresh_seconds")
+    parser.add_argument('--max-run-time', type=float, help="max_run_time_seconds (default: config.json)")
+    parser.add_argument('--interval', type=float, default=0, help="seconds between store_real_time_prices runs")
+    parser.add_argument('--spool', action='store_true', help="write through the local write spool")
+    parser.add_argument('--cache', action='store_true', help="keep the response cache file between runs")
+    parser.add_argument('--verbose', action='store_true', help="show the scripts' output")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    recorded = None
+    if args.recorded:
+        with open(args.recorded, 'r') as file:
+            recorded = json.load(file)
+    market = SyntheticMarket(args.coins, recorded_markets = recorded, update_interval = args.update_seconds)
+    coingecko = StubCoinGeckoServer(market, args.latency_ms / 1000, args.jitter_ms / 1000, args.throttle_rate, args.retry_after).start()
+    postgrest = StubPostgrestServer(latency = args.db_latency_ms / 1000, row_latency = args.db_row_latency_us / 1e6).start()
+
+    with tempfile.TemporaryDirectory(prefix='coingecko_benchmark_') as directory:
+        config_file = os.path.join(directory, 'config.json')
+        with open(config_file, 'w') as file:
+            json.dump(benchmark_config(directory, args), file, indent=4)
+
+        os.environ.update({
+            'COINGECKO_DATA_CONFIG': config_file,
+            'COINGECKO_API_URL': coingecko.url,
+            'COINGECKO_API_KEY': 'benchmark',
+            'COINGECKO_API_PLAN': args.plan,
+            'SUPABASE_URL': postgrest.url,
+            'SUPABASE_KEY': 'benchmark.benchmark.benchmark'
+        })
+
+        results = []
+        try:
+            for task in args.tasks.replace(' ', '').split(','):
+                print(f"Benchmarking {task}, {args.runs} runs")
+                results.append(BENCHMARKS[task](args, market, coingecko, postgrest))
+        finally:
+            coingecko.stop()
+            postgrest.stop()
+
+    print()
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=4)
@@ -0,0 +1,239 @@
+import json
+import math
+import time
+import random
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from coingecko_api.endpoints import endpoint_name
+
+# Local stand-in for the CoinGecko API
+# Serves synthetic (or recorded) /coins/list, /coins/markets, /simple/price and
+# /coins/{id}/market_chart/range responses for a universe of coins, with a
+# configurable latency and share of 429 responses, and counts the requests
+# per endpoint so a benchmark can relate API calls to the rows stored.
+# Like CoinGecko, a coin's market data (and its last_updated) only changes every
+# update_interval seconds, requests in between get the same snapshot.
+
+class SyntheticMarket:
+    def __init__(self, coins = 2000, seed = 1, recorded_markets = None, update_interval = 0):
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__next_coin = 0
+        self.update_interval = update_interval
+        self.__snapshots = {} # coin_id -> (monotonic time, market data) of the last update
+
+        # A recorded /coins/markets response seeds the universe with real ids and prices
+        if recorded_markets:
+            self.coins = {coin['id']: dict(coin) for coin in recorded_markets}
+        else:
+            self.coins = {}
+            for _ in range(coins):
+                self.add_coin()
+        self.__rank()
+
+    def add_coin(self):
+        """Add a synthetic coin (a new listing), returns its id"""
+        coin_id = f'coin-{self.__next_coin:05d}'
+        self.__next_coin += 1
+        price = 10 ** self.__random.uniform(-6, 4)
+        self.coins[coin_id] = {
+            'id': coin_id,
+            'symbol': f'c{self.__next_coin}',
+            'name': f'Coin {self.__next_coin}',
+            'image': f'https://example.com/{coin_id}.png',
+            'current_price': price,
+            'market_cap': price * 10 ** self.__random.uniform(5, 9),
+            'total_volume': price * 10 ** self.__random.uniform(3, 8),
+            'circulating_supply': 10 ** self.__random.uniform(5, 9),
+            'total_supply': None,
+            'max_supply': None,
+            'fully_diluted_valuation': None,
+            'platforms': {'ethereum': f'0x{self.__random.getrandbits(160):040x}'} if self.__random.random() < 0.5 else {}
+        }
+        return coin_id
+
+    def churn(self, added = 10, renamed = 5, delisted = 2):
+        """Change the universe between runs: list, rename and delist a few coins"""
+        with self.__lock:
+            for _ in range(added):
+                self.add_coin()
+            for coin_id in self.__random.sample(sorted(self.coins), min(renamed, len(self.coins))):
+                self.coins[coin_id]['name'] += ' v2'
+            for coin_id in self.__random.sample(sorted(self.coins), min(delisted, len(self.coins))):
+                del self.coins[coin_id]
+            self.__rank()
+
+    def tick(self, coin):
+        """Current market data of a coin, prices move a little on every update"""
+        snapshot = self.__snapshots.get(coin['id'])
+        if snapshot and time.monotonic() - snapshot[0] < self.update_interval:
+            return dict(snapshot[1])
+
+        price = coin['current_price'] * math.exp(self.__random.gauss(0, 0.002))
+        coin['current_price'] = price
+        now = datetime.datetime.now(datetime.timezone.utc)
+        rank = self.ranks.get(coin['id'])
+        row = {
+            **{key: value for key, value in coin.items() if key != 'platforms'},
+            'market_cap_rank': rank,
+            'high_24h': price * 1.05,
+            'low_24h': price * 0.95,
+            'price_change_percentage_24h': self.__random.uniform(-10, 10),
+            'last_updated': now.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+        }
+        self.__snapshots[coin['id']] = (time.monotonic(), row)
+        return dict(row)
+
+    def coins_list(self, include_platform = False):
+        with self.__lock:
+            return [{'id': coin['id'], 'symbol': coin['symbol'], 'name': coin['name'],
+                **({'platforms': coin.get('platforms') or {}} if include_platform else {})} for coin in self.coins.values()]
+
+    def markets(self, vs_currency = 'usd', ids = None, per_page = 100, page = 1):
+        with self.__lock:
+            if ids:
+                selected = [coin_id for coin_id in ids if coin_id in self.coins]
+            else:
+                selected = self.ranked_ids[(page - 1) * per_page:page * per_page]
+            btc = 1 / 60000 if vs_currency == 'btc' else 1
+            rows = []
+            for coin_id in selected[:per_page]:
+                row = self.tick(self.coins[coin_id])
+                for key in ('current_price', 'market_cap', 'total_volume', 'high_24h', 'low_24h'):
+                    row[key] = row[key] * btc if row[key] is not None else None
+                rows.append(row)
+            return rows
+
+    def simple_price(self, ids, vs_currencies):
+        with self.__lock:
+            prices = {}
+            for coin_id in ids:
+                if coin_id not in self.coins:
+                    continue
+                row = self.tick(self.coins[coin_id])
+                last_updated = datetime.datetime.fromisoformat(row['last_updated'].replace('Z', '+00:00'))
+                prices[coin_id] = {'last_updated_at': int(last_updated.timestamp())}
+                for currency in vs_currencies:
+                    factor = 1 / 60000 if currency == 'btc' else 1
+                    prices[coin_id][currency] = row['current_price'] * factor
+                    prices[coin_id][f'{currency}_24h_vol'] = row['total_volume'] * factor
+                    prices[coin_id][f'{currency}_24h_change'] = row['price_change_percentage_24h']
+            return prices
+
+    def market_chart_range(self, coin_id, start, end):
+        """Hourly points for ranges up to 90 days, daily points beyond (the API's automatic granularity)"""
+        with self.__lock:
+            coin = self.coins.get(coin_id)
+        if coin is None:
+            return {'error': 'coin not found'}
+        step = 3600 if end - start <= 90 * 86400 else 86400
+        timestamps = range(int(math.ceil(start / step) * step), int(end), step)
+        price = coin['current_price']
+        return {
+            'prices': [[stamp * 1000, price * (1 + 0.01 * math.sin(stamp / 86400))] for stamp in timestamps],
+            'market_caps': [[stamp * 1000, coin['market_cap']] for stamp in timestamps],
+            'total_volumes': [[stamp * 1000, coin['total_volume']] for stamp in timestamps]
+        }
+
+    def __rank(self):
+        """Rank the coins by volume (market_cap_rank and the order of unfiltered /coins/markets pages)"""
+        self.ranked_ids = sorted(self.coins, key=lambda coin_id: -(self.coins[coin_id]['total_volume'] or 0))
+        self.ranks = {coin_id: rank + 1 for rank, coin_id in enumerate(self.ranked_ids)}
+
+class StubCoinGeckoServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, market, latency = 0.05, jitter = 0.02, throttle_rate = 0.0, retry_after = 1, port = 0):
+        super().__init__(('127.0.0.1', port), StubCoinGeckoHandler)
+        self.market = market
+        self.latency = latency # seconds per response
+        self.jitter = jitter # random extra seconds
+        self.throttle_rate = throttle_rate # share of requests answered with 429
+        self.retry_after = retry_after
+        self.requests = {} # endpoint -> requests answered
+        self.throttled = 0
+        self.__lock = threading.Lock()
+        self.__random = random.Random(2)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/api/v3/'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def api_calls(self):
+        with self.__lock:
+            return sum(self.requests.values())
+
+    def count(self, endpoint, throttled):
+        with self.__lock:
+            if throttled:
+                self.throttled += 1
+            else:
+                self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def should_throttle(self):
+        with self.__lock:
+            return self.__random.random() < self.throttle_rate
+
+    def delay(self):
+        with self.__lock:
+            jitter = self.__random.uniform(0, self.jitter)
+        time.sleep(self.latency + jitter)
+
+class StubCoinGeckoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        endpoint = endpoint_name(self.path)
+        server.delay()
+
+        if server.should_throttle():
+            server.count(endpoint, throttled=True)
+            self.__respond(429, {'status': {'error_code': 429, 'error_message': "You've exceeded the Rate Limit"}},
+                {'Retry-After': str(server.retry_after)})
+            return
+
+        market = server.market
+        ids = [coin_id for coin_id in params.get('ids', '').split(',') if coin_id]
+        if endpoint == 'ping':
+            body = {'gecko_says': '(V3) To the Moon!'}
+        elif endpoint == 'coins/list':
+            body = market.coins_list(params.get('include_platform') == 'true')
+        elif endpoint == 'coins/markets':
+            body = market.markets(params.get('vs_currency', 'usd'), ids, int(params.get('per_page', 100)), int(params.get('page', 1)))
+        elif endpoint == 'simple/price':
+            body = market.simple_price(ids, params.get('vs_currencies', 'usd').split(','))
+        elif endpoint == 'coins/{id}/market_chart/range':
+            coin_id = parts.path.rstrip('/').split('/')[-3]
+            body = market.market_chart_range(coin_id, float(params['from']), float(params['to']))
+        else:
+            self.__respond(404, {'error': f'{endpoint} is not stubbed'})
+            return
+
+        server.count(endpoint, throttled=False)
+        self.__respond(200, body)
+
+    def __respond(self, status, body, headers = None):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
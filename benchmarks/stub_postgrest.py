@@ -0,0 +1,200 @@
+import json
+import time
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+# Local stand-in for the Supabase (PostgREST) database
+# Speaks enough of the PostgREST protocol for the supabase client used by the
+# recurring tasks: inserts and upserts (merge or ignore duplicates, columns=),
+# selects with eq filters, order, offset and limit, and the coins_to_update()
+# and price_freshness() functions of custom_db_functions.sql. Tables live in
+# memory, latest_prices is maintained like the trigger of migration 003.
+# Every request waits latency seconds plus row_latency per row written.
+
+class StubDatabase:
+    PRIMARY_KEYS = {'coins': ('id',), 'latest_prices': ('coin_id', 'currency')}
+    DEFAULTS = {'coins': {'update_hourly': False, 'track_prices': False, 'archived': False, 'updated_at': None, 'market_cap_rank': None}}
+
+    def __init__(self):
+        self.tables = {} # table -> {primary key: row} or [rows] for tables without a primary key
+        self.rows_written = {} # table -> rows inserted or updated
+        self.lock = threading.Lock()
+
+    def write(self, table, rows, columns, resolution):
+        """Insert rows, resolution is None, 'merge-duplicates' or 'ignore-duplicates', returns the rows written"""
+        key_columns = self.PRIMARY_KEYS.get(table)
+        columns = columns or sorted({column for row in rows for column in row})
+        written = []
+        with self.lock:
+            if key_columns is None:
+                stored = self.tables.setdefault(table, [])
+                for row in rows:
+                    row = {column: row.get(column) for column in columns}
+                    stored.append(row)
+                    written.append(row)
+                    self.__update_latest_price(table, row)
+            else:
+                stored = self.tables.setdefault(table, {})
+                for row in rows:
+                    key = tuple(row.get(column) for column in key_columns)
+                    if key in stored:
+                        if resolution == 'ignore-duplicates':
+                            continue
+                        if resolution != 'merge-duplicates':
+                            raise ValueError(f'duplicate key value violates unique constraint "{table}_pkey"')
+                        stored[key].update({column: row.get(column) for column in columns})
+                    else:
+                        stored[key] = {**self.DEFAULTS.get(table, {}), **{column: row.get(column) for column in columns}}
+                    written.append(stored[key])
+            self.rows_written[table] = self.rows_written.get(table, 0) + len(written)
+        return written
+
+    def select(self, table, filters = None, order = None, offset = 0, limit = None):
+        with self.lock:
+            stored = self.tables.get(table, {})
+            rows = list(stored.values() if isinstance(stored, dict) else stored)
+        for column, value in (filters or {}).items():
+            rows = [row for row in rows if row.get(column) == value]
+        if order:
+            column, _, direction = order.partition('.')
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=direction == 'desc')
+        return rows[offset:offset + limit if limit is not None else None]
+
+    def set_tracked(self, count):
+        """Track prices of the count highest ranked coins (as an operator would)"""
+        with self.lock:
+            coins = sorted(self.tables.get('coins', {}).values(), key=lambda coin: (coin.get('market_cap_rank') is None, coin.get('market_cap_rank') or 0, coin['id']))
+            for index, coin in enumerate(coins):
+                coin['track_prices'] = index < count
+
+    def coins_to_update(self, p_limit):
+        """Coins with the oldest market data first, weighted by rank like coins_to_update()"""
+        now = datetime.datetime.utcnow()
+        def priority(coin):
+            if coin.get('updated_at') is None:
+                return float('-inf')
+            updated_at = datetime.datetime.fromisoformat(coin['updated_at'].replace('Z', '+00:00')).replace(tzinfo=None)
+            return (coin.get('market_cap_rank') or 100000) - (now - updated_at).total_seconds() / 60
+        with self.lock:
+            coins = sorted(self.tables.get('coins', {}).values(), key=priority)[:p_limit]
+            return [{key: coin.get(key) for key in ('id', 'update_hourly', 'updated_at', 'market_cap_rank')} for coin in coins]
+
+    def price_freshness(self):
+        with self.lock:
+            latest = self.tables.get('latest_prices', {})
+            rows = []
+            for coin in sorted(self.tables.get('coins', {}).values(), key=lambda coin: coin['id']):
+                if not coin.get('track_prices') or coin.get('archived'):
+                    continue
+                usd = latest.get((coin['id'], 'usd'), {})
+                btc = latest.get((coin['id'], 'btc'), {})
+                rows.append({
+                    'coin_id': coin['id'],
+                    'vol_24h': usd.get('vol_24h'),
+                    'price': usd.get('price'),
+                    'high_24h': usd.get('high_24h'),
+                    'low_24h': usd.get('low_24h'),
+                    'price_change_percentage_24h': usd.get('price_change_percentage_24h'),
+                    'usd_created_at': usd.get('created_at'),
+                    'btc_created_at': btc.get('created_at')
+                })
+            return rows
+
+    def __update_latest_price(self, table, row):
+        if not (table.startswith('continuous_') and table.endswith('_prices')):
+            return
+        currency = table[len('continuous_'):-len('_prices')]
+        latest = self.tables.setdefault('latest_prices', {})
+        key = (row.get('coin_id'), currency)
+        if key not in latest or (row.get('created_at') or '') >= (latest[key].get('created_at') or ''):
+            latest[key] = {**row, 'currency': currency}
+
+class StubPostgrestServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, database = None, latency = 0.005, row_latency = 0.00002, port = 0):
+        super().__init__(('127.0.0.1', port), StubPostgrestHandler)
+        self.database = database or StubDatabase()
+        self.latency = latency
+        self.row_latency = row_latency
+        self.requests = 0
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class StubPostgrestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path, params = self.__parse()
+        table = path.rsplit('/', 1)[-1]
+        filters = {}
+        for column, value in params.items():
+            if value.startswith('eq.'):
+                value = value[3:]
+                filters[column] = {'true': True, 'false': False}.get(value, value)
+        rows = self.server.database.select(table, filters, params.get('order'), int(params.get('offset', 0)),
+            int(params['limit']) if 'limit' in params else None)
+
+        columns = [column.strip() for column in params.get('select', '*').split(',')]
+        if columns != ['*']:
+            rows = [{column: row.get(column) for column in columns} for row in rows]
+        self.__respond(200, rows, delay = self.server.latency)
+
+    def do_POST(self):
+        path, params = self.__parse()
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'null')
+        database = self.server.database
+
+        if '/rpc/' in path:
+            function = path.rsplit('/', 1)[-1]
+            if function == 'coins_to_update':
+                rows = database.coins_to_update(body.get('p_limit', 2000))
+            elif function == 'price_freshness':
+                rows = database.price_freshness()
+            else:
+                self.__respond(404, {'code': 'PGRST202', 'message': f'Could not find the function {function}'})
+                return
+            offset = int(params.get('offset', 0))
+            rows = rows[offset:offset + int(params['limit'])] if 'limit' in params else rows[offset:]
+            self.__respond(200, rows, delay = self.server.latency)
+            return
+
+        rows = body if isinstance(body, list) else [body]
+        prefer = self.headers.get('Prefer', '')
+        resolution = next((part.split('=', 1)[1] for part in prefer.split(',') if part.strip().startswith('resolution=')), None)
+        columns = [column.strip('"') for column in params['columns'].split(',')] if 'columns' in params else None
+        try:
+            written = database.write(path.rsplit('/', 1)[-1], rows, columns, resolution)
+        except ValueError as exception:
+            self.__respond(409, {'code': '23505', 'message': str(exception), 'details': None, 'hint': None})
+            return
+        self.__respond(201, written, delay = self.server.latency + self.server.row_latency * len(rows))
+
+    def __parse(self):
+        parts = urlsplit(self.path)
+        self.server.requests += 1
+        return parts.path, dict(parse_qsl(parts.query))
+
+    def __respond(self, status, body, delay = 0):
+        time.sleep(delay)
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
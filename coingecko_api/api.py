@@ -1,10 +1,17 @@
 import json
+import hashlib
 import requests
 import time
 from urllib.parse import urlencode
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from datetime import timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from coingecko_api.rate_limiter import TokenBucketRateLimiter, retry_after_seconds
+from coingecko_api.endpoints import endpoint_name
+from coingecko_api.json_stream import iter_records, loads
+from coingecko_api.key_pool import ApiKey, ApiKeyPool
 
 # Docs for Public API users (Demo plan)
 # https://docs.coingecko.com/v3.0.1/reference/introduction
@@ -18,61 +25,134 @@ class CoinGeckoAPI:
     __ANALYST_PAUSE_TIME = 120 # 500 requests per minute   
     __DEMO_PAUSE_TIME = 2000 # 30 requests per minute 
     __PUBLIC_PAUSE_TIME = 5000 # 12 request per minute
+    TICKERS_PER_PAGE = 100 # /coins/{id}/tickers page size
 
-    def __init__(self, api_key, plan = 'public', retries = 5,):
+    def __init__(self, api_key, plan = 'public', retries = 5, rate_limit_state_file = None, rate_limiter = None, cache = None, metrics = None, api_base_url = None,
+            api_keys = None, key_pool = None):
         self.api_key = api_key
-        self.last_request_time = time.time()
         self.request_timeout = 30
         self.plan = plan
+        self.rate_limit_retries = 3
+        self.cache = cache # optional ResponseCache
+        self.metrics = metrics # optional MetricsRegistry (utils.metrics)
+        self.stream_chunk_size = 65536 # bytes read at a time by the stream_* methods
 
         # set pause time based on plan
+        self.pause_time = self.__pause_time(plan)
+
+        # Token bucket sized to the plan, shared with other processes if a state file is given
+        if rate_limiter:
+            self.rate_limiter = rate_limiter
+        else:
+            self.rate_limiter = TokenBucketRateLimiter(
+                self.pause_time,
+                state_file = rate_limit_state_file,
+                bucket_name = self.__bucket_name(api_key, plan)
+            )
+
+        # set base url based on api_key and plan (api_base_url overrides it, e.g. a proxy or the benchmark stub server)
+        self.api_base_url = self.__base_url(api_key, plan, api_base_url)
+
+        # Several keys (api_keys [(key, plan)], or a key_pool shared with another client): every request
+        # goes to the healthy key with the most headroom, the pool stands in for the rate limiter
+        self.key_pool = key_pool
+        if api_keys and not key_pool:
+            keys = list(api_keys)
+            if api_key and (api_key, plan) not in keys:
+                keys.insert(0, (api_key, plan))
+            self.key_pool = ApiKeyPool([ApiKey(
+                key,
+                key_plan,
+                self.__base_url(key, key_plan, api_base_url),
+                'x_cg_demo_api_key' if key_plan == 'demo' else 'x_cg_pro_api_key',
+                TokenBucketRateLimiter(self.__pause_time(key_plan), state_file = rate_limit_state_file, bucket_name = self.__bucket_name(key, key_plan))
+            ) for key, key_plan in keys])
+        if self.key_pool:
+            self.rate_limiter = self.key_pool
+
+        self.session = self._new_session(retries)
+
+    def _new_session(self, retries):
+        """requests session of the blocking client, retrying gateway errors"""
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(max_retries = Retry(total = retries, backoff_factor = 0.5, status_forcelist = [502, 503, 504])))
+        return session
+
+    @classmethod
+    def __pause_time(cls, plan):
         if plan == 'demo':
-            self.pause_time = self.__DEMO_PAUSE_TIME           
+            return cls.__DEMO_PAUSE_TIME
         elif plan == 'analyst':
-            self.pause_time = self.__ANALYST_PAUSE_TIME   
-        else:
-            self.pause_time = self.__PUBLIC_PAUSE_TIME  
+            return cls.__ANALYST_PAUSE_TIME
+        return cls.__PUBLIC_PAUSE_TIME
 
-        # set base url based on api_key and plan
+    @classmethod
+    def __base_url(cls, api_key, plan, api_base_url = None):
+        if api_base_url:
+            return api_base_url.rstrip('/') + '/'
         if api_key and plan != 'demo':
-            self.api_base_url = self.__PRO_API_URL_BASE
-        else:
-            self.api_base_url = self.__API_URL_BASE
-
-        self.session = requests.Session()
-        retries = Retry(total = retries, backoff_factor = 0.5, status_forcelist = [502, 503, 504])
-        self.session.mount('https://', HTTPAdapter(max_retries = retries))
-
-    def __request(self, url):
+            return cls.__PRO_API_URL_BASE
+        return cls.__API_URL_BASE
+
+    @staticmethod
+    def __bucket_name(api_key, plan):
+        """Name of the shared rate limit bucket, quota is per key (or per IP without a key)"""
+        if not api_key:
+            return plan
+        return '{0}:{1}'.format(plan, hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16])
+
+    # Transport hooks of the endpoint methods: _request, _request_stream and _iter_pages
+    # AsyncCoinGeckoAPI overrides them with coroutines and async generators
+    def _request(self, url):
         """Make a request to the CoinGecko API"""
         # print("Request URL: " + url)
 
-        # Pause between requests
-        current_time = time.time()
-        elapsed_time = (current_time - self.last_request_time) * 1000 
-        if elapsed_time < self.pause_time:
-            pause_time = round((self.pause_time - elapsed_time) / 1000)
-            # print(f"Sleeping for {pause_time} seconds")
-            time.sleep(pause_time)
-        self.last_request_time = current_time
-
-        # Make request, on error increase pause time
-        try:
-            response = self.session.get(url, timeout = self.request_timeout)
-        except requests.exceptions.RequestException:
-            self.pause_time *= 1.1
-            raise
+        # Serve fresh cached responses without spending rate budget, revalidate stale ones
+        cached = self.cache.get(url) if self.cache else None
+        if cached and cached.is_fresh():
+            self.cache.hits += 1
+            self.record_cache(url, 'hit')
+            return cached.content
+        headers = cached.validators() if cached else {}
+
+        # Wait for the rate limiter, on 429 back off (honoring Retry-After) and try again
+        # With a key pool every attempt goes to the key with the most headroom
+        for attempt in range(self.rate_limit_retries + 1):
+            url = self.route(url)
+            wait_time = self.rate_limiter_for(url).reserve()
+            if wait_time > 0:
+                time.sleep(wait_time)
+            started = time.monotonic()
+            response = self.session.get(url, headers = headers, timeout = self.request_timeout)
+            self.record_request(url, response.status_code, time.monotonic() - started, wait_time, len(response.content))
+
+            if not self.is_rejected(response.status_code):
+                break
+            self.record_rejection(url, response.status_code, response.headers)
+            if attempt < self.rate_limit_retries:
+                self.record_retry(url, response.status_code)
+
+        if response.status_code == 304 and cached:
+            self.rate_limiter_for(url).record_success()
+            self.cache.revalidations += 1
+            self.record_cache(url, 'revalidated')
+            self.cache.refresh(url, cached)
+            return cached.content
 
         # Check if request was successful
         try:
             response.raise_for_status()
-            content = json.loads(response.content.decode('utf-8'))
+            content = loads(response.content)
+            self.rate_limiter_for(url).record_success()
+            if self.cache:
+                self.cache.misses += 1
+                self.record_cache(url, 'miss')
+                self.cache.put(url, content, response.headers)
             return content
         except Exception as e:
-            self.pause_time *= 1.1
             # check if json (with error message) is returned
             try:
-                content = json.loads(response.content.decode('utf-8'))
+                content = loads(response.content)
                 raise ValueError(content)
             # if no json
             except json.decoder.JSONDecodeError as e:
@@ -81,11 +161,141 @@ class CoinGeckoAPI:
 
             raise
 
+    def _request_stream(self, url, prefix = 'item'):
+        """
+            Make a request to the CoinGecko API and yield the records under prefix (see json_stream) while the body arrives
+            The request is sent when iteration starts, streamed responses bypass the response cache
+        """
+        for attempt in range(self.rate_limit_retries + 1):
+            url = self.route(url)
+            wait_time = self.rate_limiter_for(url).reserve()
+            if wait_time > 0:
+                time.sleep(wait_time)
+            started = time.monotonic()
+            response = self.session.get(url, stream = True, timeout = self.request_timeout)
+
+            if not self.is_rejected(response.status_code):
+                break
+            self.record_request(url, response.status_code, time.monotonic() - started, wait_time, len(response.content))
+            self.record_rejection(url, response.status_code, response.headers)
+            if attempt < self.rate_limit_retries:
+                self.record_retry(url, response.status_code)
+
+        if response.status_code >= 400:
+            # A rejected last attempt was recorded in the loop
+            if not self.is_rejected(response.status_code):
+                self.record_request(url, response.status_code, time.monotonic() - started, wait_time, len(response.content))
+            try:
+                content = loads(response.content)
+            except json.decoder.JSONDecodeError:
+                response.raise_for_status()
+            raise ValueError(content)
+        self.rate_limiter_for(url).record_success()
+
+        received = 0
+        def chunks():
+            nonlocal received
+            for chunk in response.iter_content(self.stream_chunk_size):
+                received += len(chunk)
+                yield chunk
+
+        try:
+            yield from iter_records(chunks(), prefix)
+        finally:
+            response.close()
+            self.record_request(url, response.status_code, time.monotonic() - started, wait_time, received)
+
+    def _iter_pages(self, fetch_page, page_size, records_key = None, start_page = 1, max_pages = None, time_budget = None, prefetch = 1):
+        """
+            Yield the records of fetch_page(page) page by page, the next prefetch pages are fetched on a background thread
+            Stops after max_pages, once time_budget seconds have passed (pages in flight are still yielded),
+            or at an empty or short (fewer than page_size records) page
+        """
+        deadline = time.monotonic() + time_budget if time_budget is not None else None
+        last_page = start_page + max_pages - 1 if max_pages is not None else None
+        next_page = start_page
+        pending = deque() # futures of the pages in flight, in page order
+        executor = ThreadPoolExecutor(max_workers = max(1, prefetch), thread_name_prefix = 'CoinGeckoPrefetch')
+
+        def fetch(page):
+            result = fetch_page(page)
+            return (result or {}).get(records_key) or [] if records_key else result or []
+
+        try:
+            while True:
+                while len(pending) <= prefetch and (last_page is None or next_page <= last_page) \
+                        and (deadline is None or time.monotonic() < deadline):
+                    pending.append(executor.submit(fetch, next_page))
+                    next_page += 1
+                if not pending:
+                    return
+
+                records = pending.popleft().result()
+                if not records:
+                    return
+                is_last_page = page_size and len(records) < page_size
+                if is_last_page:
+                    for future in pending:
+                        future.cancel() # nothing after this page
+                yield records
+                if is_last_page:
+                    return
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait = False)
+
+    def route(self, url):
+        """The URL to send an attempt with, on the key with the most headroom if there is a key pool (chosen once per attempt)"""
+        if not self.key_pool:
+            return url
+        return self.key_pool.with_key(url, self.key_pool.choose())
+
+    def rate_limiter_for(self, url):
+        """Rate limiter of the key a request URL is sent with"""
+        key = self.key_pool.key_for_url(url) if self.key_pool else None
+        return key.rate_limiter if key else self.rate_limiter
+
+    def plan_for(self, url):
+        key = self.key_pool.key_for_url(url) if self.key_pool else None
+        return key.plan if key else self.plan
+
+    def is_rejected(self, status):
+        """Responses worth another attempt: 429, and with a key pool 401/403 (another key may work)"""
+        return status == 429 or (self.key_pool is not None and status in (401, 403))
+
+    def record_rejection(self, url, status, headers):
+        """Back off after a rejected request: pause the rate limiter, or bench the pool's key"""
+        key = self.key_pool.key_for_url(url) if self.key_pool else None
+        if key:
+            self.key_pool.bench(key, status, retry_after_seconds(headers))
+        elif status == 429:
+            self.rate_limiter.record_throttle(retry_after_seconds(headers))
+
+    def record_request(self, url, status, seconds, wait_seconds, response_bytes):
+        """Record one HTTP attempt (latency, rate limiter wait, status, body size) per endpoint and plan"""
+        if not self.metrics:
+            return
+        labels = {'endpoint': endpoint_name(url), 'plan': self.plan_for(url)}
+        self.metrics.observe('api_request_seconds', seconds, **labels)
+        self.metrics.observe('api_rate_limit_wait_seconds', wait_seconds, **labels)
+        self.metrics.observe('api_response_bytes', response_bytes, **labels)
+        self.metrics.increment('api_requests_total', status = status, **labels)
+
+    def record_retry(self, url, status):
+        if self.metrics:
+            self.metrics.increment('api_retries_total', endpoint = endpoint_name(url), plan = self.plan_for(url), status = status)
+
+    def record_cache(self, url, result):
+        if self.metrics:
+            self.metrics.increment('api_cache_total', endpoint = endpoint_name(url), plan = self.plan_for(url), result = result)
+
     def __append_params(self, api_url, params):
         """Append parameters to the API URL"""
 
         # If using pro version of CoinGecko, inject key in every call
-        if self.api_key:
+        # With a key pool, route() adds the key chosen for each attempt instead
+        if self.api_key and not self.key_pool:
             if self.plan == 'demo':
                 params['x_cg_demo_api_key'] = self.api_key
             else:
@@ -102,7 +312,7 @@ class CoinGeckoAPI:
     def ping(self):
         """Check if the API server is up and running"""
         api_url = '{0}ping'.format(self.api_base_url)
-        return self.__request(api_url)
+        return self._request(api_url)
     
     def api_is_up(self):
         """Return True if the API server is up and running, False otherwise"""
@@ -128,7 +338,7 @@ class CoinGeckoAPI:
         api_url = '{0}simple/price'.format(self.api_base_url)
         api_url = self.__append_params(api_url, kwargs)
 
-        return self.__request(api_url)
+        return self._request(api_url)
     
     # Coin Price by Token Addresses
     def get_token_price_by_address(self, asset_platform, contract_addresses, vs_currencies, **kwargs):
@@ -141,23 +351,32 @@ class CoinGeckoAPI:
 
         api_url = '{0}simple/token_price/{1}'.format(self.api_base_url, asset_platform)
         api_url = self.__append_params(api_url, kwargs)
-        return self.__request(api_url)
+        return self._request(api_url)
 
     # Supported Currencies List
     def get_supported_vs_currencies(self):
         """Returns a list of supported_vs_currencies (base currencies)"""
         api_url = '{0}simple/supported_vs_currencies'.format(self.api_base_url)
-        return self.__request(api_url)
+        return self._request(api_url)
     
 
     # ---------- COINS ----------#
     # API calls under {API_BASE_URL}/coins/* 
 
     # Coins List (ID Map)
-    def get_coins_list(self):
+    def get_coins_list(self, **kwargs):
         """Returns all coins with id, name, symbol, and platforms"""
         api_url = '{0}coins/list'.format(self.api_base_url)
-        return self.__request(api_url)
+        api_url = self.__append_params(api_url, kwargs)
+
+        return self._request(api_url)
+
+    def stream_coins_list(self, **kwargs):
+        """Yields the coins of get_coins_list() one by one while the response arrives"""
+        api_url = '{0}coins/list'.format(self.api_base_url)
+        api_url = self.__append_params(api_url, kwargs)
+
+        return self._request_stream(api_url)
     
     # Coins List with Market Data
     def get_coins_with_market_data(self, vs_currency = 'usd', order = 'volume_desc', per_page = 250, sparkline = True, **kwargs):
@@ -171,8 +390,32 @@ class CoinGeckoAPI:
         api_url = '{0}coins/markets'.format(self.api_base_url)
         api_url = self.__append_params(api_url, kwargs)
 
-        return self.__request(api_url)
+        return self._request(api_url)
+
+    def stream_coins_with_market_data(self, vs_currency = 'usd', order = 'volume_desc', per_page = 250, sparkline = True, **kwargs):
+        """Yields the coins of one get_coins_with_market_data() page one by one while the response arrives"""
+
+        kwargs['vs_currency'] = vs_currency
+        kwargs['order'] = order
+        kwargs['per_page'] = per_page
+        kwargs['sparkline'] = sparkline
+
+        api_url = '{0}coins/markets'.format(self.api_base_url)
+        api_url = self.__append_params(api_url, kwargs)
+
+        return self._request_stream(api_url)
     
+    def iter_coins_with_market_data(self, vs_currency = 'usd', order = 'volume_desc', per_page = 250, sparkline = False,
+            start_page = 1, max_pages = None, time_budget = None, prefetch = 1, **kwargs):
+        """
+            Yields get_coins_with_market_data() pages (lists of coins) from start_page on, prefetching the next pages
+            Stops after max_pages, after time_budget seconds or at the last (empty or short) page
+        """
+        return self._iter_pages(
+            lambda page: self.get_coins_with_market_data(vs_currency, order, per_page, sparkline, page = page, **kwargs),
+            per_page, start_page = start_page, max_pages = max_pages, time_budget = time_budget, prefetch = prefetch
+        )
+
     # Coin Data by ID
     def get_coin_by_id(self, id, localization = False, sparkline = True, **kwargs):
         """Returns all current data (name, price, market, etc.) for a given coin"""
@@ -183,7 +426,7 @@ class CoinGeckoAPI:
         api_url = '{0}coins/{1}/'.format(self.api_base_url, id)
         api_url = self.__append_params(api_url, kwargs)
 
-        return self.__request(api_url)
+        return self._request(api_url)
 
     # Coin Tickers by ID
     def get_coin_ticker_by_id(self, id, depth = True, **kwargs):
@@ -194,7 +437,27 @@ class CoinGeckoAPI:
         api_url = '{0}coins/{1}/tickers'.format(self.api_base_url, id)
         api_url = self.__append_params(api_url, kwargs)
 
-        return self.__request(api_url)
+        return self._request(api_url)
+
+    def stream_coin_tickers_by_id(self, id, depth = True, **kwargs):
+        """Yields the tickers of get_coin_ticker_by_id() one by one while the response arrives"""
+
+        kwargs['depth'] = depth
+
+        api_url = '{0}coins/{1}/tickers'.format(self.api_base_url, id)
+        api_url = self.__append_params(api_url, kwargs)
+
+        return self._request_stream(api_url, 'tickers.item')
+
+    def iter_coin_tickers(self, id, depth = True, start_page = 1, max_pages = None, time_budget = None, prefetch = 1, **kwargs):
+        """
+            Yields get_coin_ticker_by_id() pages of tickers (100 per page), prefetching the next pages
+            Stops after max_pages, after time_budget seconds or at the last (empty or short) page
+        """
+        return self._iter_pages(
+            lambda page: self.get_coin_ticker_by_id(id, depth, page = page, **kwargs),
+            self.TICKERS_PER_PAGE, 'tickers', start_page = start_page, max_pages = max_pages, time_budget = time_budget, prefetch = prefetch
+        )
 
     # Coin Historical Data by ID    
     def get_coin_history_by_id(self, id, date, localization = False, **kwargs):
@@ -219,7 +482,7 @@ class CoinGeckoAPI:
         api_url = '{0}coins/{1}/history'.format(self.api_base_url, id)
         api_url = self.__append_params(api_url, kwargs)
 
-        return self.__request(api_url)
+        return self._request(api_url)
     
     # Coin Historical Chart Data by ID
     def get_coin_chart_by_id(self, id, vs_currency = 'usd', days = 90, **kwargs):
@@ -231,7 +494,7 @@ class CoinGeckoAPI:
         api_url = '{0}coins/{1}/market_chart'.format(self.api_base_url, id)
         api_url = self.__append_params(api_url, kwargs)
 
-        return self.__request(api_url)   
+        return self._request(api_url)   
     
     # Coin Historical Chart Data within Time Range by ID
     def get_coin_chart_in_range(self, id, from_timestamp, to_timestamp, vs_currency = 'usd', **kwargs):
@@ -244,7 +507,7 @@ class CoinGeckoAPI:
         api_url = '{0}coins/{1}/market_chart/range'.format(self.api_base_url, id)
         api_url = self.__append_params(api_url, kwargs)
 
-        return self.__request(api_url)
+        return self._request(api_url)
     
     # Coin OHLC Chart by ID
     def get_coin_ohlc_by_id(self, id, days, vs_currency = 'usd', **kwargs):
@@ -256,4 +519,4 @@ class CoinGeckoAPI:
         api_url = '{0}coins/{1}/ohlc'.format(self.api_base_url, id)
         api_url = self.__append_params(api_url, kwargs)
 
-        return self.__request(api_url)
\ No newline at end of file
+        return self._request(api_url)
\ No newline at end of file
@@ -13,6 +13,15 @@ coins_market_data_to_coins = {
     "circulating_supply": "circulating_supply"
 }
 
+# get_coins_list(include_platform=True) to coins table
+# https://docs.coingecko.com/v3.0.1/reference/coins-list
+coins_list_to_coins = {
+    "id": "id",
+    "symbol": "symbol",
+    "name": "name",
+    "platforms": "platforms"
+}
+
 # get_coins_with_market_data() to continuous_btc_prices and continuous_usd_prices tables
 # https://docs.coingecko.com/v3.0.1/reference/coins-markets
 coins_market_data_to_continuous_prices = {
@@ -23,4 +32,37 @@ coins_market_data_to_continuous_prices = {
     "high_24h": "high_24h",
     "low_24h": "low_24h",
     "price_change_percentage_24h": "price_change_percentage_24h"
-}
\ No newline at end of file
+}
+
+# get_price(include_24hr_vol, include_24hr_change, include_last_updated_at) to continuous_btc_prices and continuous_usd_prices tables
+# https://docs.coingecko.com/v3.0.1/reference/simple-price
+# {currency} is the vs_currency of the table, see page_transform.simple_price_coins()
+simple_price_to_continuous_prices = {
+    "id": "coin_id",
+    "last_updated_at": "api_last_updated",
+    "{currency}": "price",
+    "{currency}_24h_vol": "vol_24h",
+    "{currency}_24h_change": "price_change_percentage_24h"
+}
+
+# coins table columns rounded to integers (BIGINT / NUMERIC(32,0) in the schema)
+coins_integer_columns = [
+    "market_cap_rank",
+    "market_cap_usd",
+    "fully_diluted_valuation",
+    "total_supply",
+    "max_supply",
+    "circulating_supply"
+]
+
+# continuous_btc_prices and continuous_usd_prices columns rounded to integers
+continuous_prices_integer_columns = [
+    "vol_24h"
+]
+
+# continuous_btc_prices and continuous_usd_prices NOT NULL columns
+continuous_prices_required_columns = [
+    "coin_id",
+    "api_last_updated",
+    "price"
+]
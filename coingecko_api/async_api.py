@@ -0,0 +1,263 @@
+import json
+import time
+import asyncio
+import aiohttp
+from collections import deque
+from coingecko_api.api import CoinGeckoAPI
+from coingecko_api.json_stream import RecordParser, loads
+
+# asyncio counterpart of CoinGeckoAPI
+# Endpoint methods are inherited: they only build the request URL and return
+# the result of the _request hook, which is overridden here with a coroutine, so every
+# endpoint (get_price, get_coins_with_market_data, ...) returns an awaitable, and
+# every stream_* and iter_* method an async generator.
+# Requests run concurrently, bounded by max_in_flight and the shared rate limiter.
+# Rate limiter and key pool calls may wait on the shared SQLite state file, they
+# run in a worker thread so a lock held by another process doesn't stall the loop.
+# Gateway errors, connection errors and timeouts are retried with exponential backoff.
+class AsyncCoinGeckoAPI(CoinGeckoAPI):
+    __RETRY_STATUSES = (502, 503, 504)
+    __CONNECTION_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError) # retried like the sync client's urllib3 Retry
+
+    def __init__(self, api_key, plan = 'public', retries = 5, max_in_flight = 20, rate_limit_state_file = None, rate_limiter = None, cache = None, metrics = None, api_base_url = None,
+            api_keys = None, key_pool = None):
+        super().__init__(api_key, plan, retries, rate_limit_state_file = rate_limit_state_file, rate_limiter = rate_limiter, cache = cache,
+            metrics = metrics, api_base_url = api_base_url, api_keys = api_keys, key_pool = key_pool)
+        self.retries = retries
+        self.max_in_flight = max_in_flight
+        self.__session = None
+        self.__semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    async def close(self):
+        """Close the underlying aiohttp session"""
+        if self.__session:
+            await self.__session.close()
+            self.__session = None
+
+    def _new_session(self, retries):
+        """Requests go through aiohttp, no requests session"""
+        return None
+
+    def __get_session(self):
+        if self.__session is None or self.__session.closed:
+            self.__session = aiohttp.ClientSession(timeout = aiohttp.ClientTimeout(total = self.request_timeout))
+            self.__semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self.__session
+
+    async def _request(self, url):
+        """Make a request to the CoinGecko API without blocking the event loop"""
+        session = self.__get_session()
+
+        # Serve fresh cached responses without spending rate budget, revalidate stale ones
+        cached = self.cache.get(url) if self.cache else None
+        if cached and cached.is_fresh():
+            self.cache.hits += 1
+            self.record_cache(url, 'hit')
+            return cached.content
+        request_headers = cached.validators() if cached else {}
+
+        status_retries = 0
+        throttle_retries = 0
+        while True:
+            url = await asyncio.to_thread(self.route, url)
+            wait_time = await asyncio.to_thread(self.rate_limiter_for(url).reserve)
+            await asyncio.sleep(wait_time)
+            started = time.monotonic()
+            try:
+                status, headers, body = await self.__send(session, url, request_headers)
+            except self.__CONNECTION_ERRORS:
+                self.record_request(url, 'error', time.monotonic() - started, wait_time, 0)
+                if status_retries >= self.retries:
+                    raise
+                await self.__backoff(url, 'error', status_retries)
+                status_retries += 1
+                continue
+            self.record_request(url, status, time.monotonic() - started, wait_time, len(body))
+
+            # Back off on 429 (honoring Retry-After, or on another key of the pool) and on gateway errors
+            if self.is_rejected(status):
+                await asyncio.to_thread(self.record_rejection, url, status, headers)
+                if throttle_retries < self.rate_limit_retries:
+                    throttle_retries += 1
+                    self.record_retry(url, status)
+                    continue
+            elif status in self.__RETRY_STATUSES and status_retries < self.retries:
+                await self.__backoff(url, status, status_retries)
+                status_retries += 1
+                continue
+            break
+
+        if status == 304 and cached:
+            await asyncio.to_thread(self.rate_limiter_for(url).record_success)
+            self.cache.revalidations += 1
+            self.record_cache(url, 'revalidated')
+            self.cache.refresh(url, cached)
+            return cached.content
+
+        if status >= 400:
+            raise self.__http_error(status, body)
+        content = loads(body)
+
+        await asyncio.to_thread(self.rate_limiter_for(url).record_success)
+        if self.cache:
+            self.cache.misses += 1
+            self.record_cache(url, 'miss')
+            self.cache.put(url, content, headers)
+        return content
+
+    async def _request_stream(self, url, prefix = 'item'):
+        """Async generator of the records under prefix, yielded while the body arrives (not cached)"""
+        session = self.__get_session()
+
+        throttle_retries = 0
+        status_retries = 0
+        while True:
+            url = await asyncio.to_thread(self.route, url)
+            wait_time = await asyncio.to_thread(self.rate_limiter_for(url).reserve)
+            await asyncio.sleep(wait_time)
+            retry_status = None
+            async with self.__semaphore:
+                started = time.monotonic()
+                try:
+                    response = await session.get(url)
+                except self.__CONNECTION_ERRORS:
+                    self.record_request(url, 'error', time.monotonic() - started, wait_time, 0)
+                    if status_retries >= self.retries:
+                        raise
+                    retry_status = 'error'
+                else:
+                    async with response:
+                        status = response.status
+                        if status >= 400:
+                            body = await response.read()
+                            self.record_request(url, status, time.monotonic() - started, wait_time, len(body))
+                            if self.is_rejected(status):
+                                await asyncio.to_thread(self.record_rejection, url, status, response.headers)
+                                if throttle_retries < self.rate_limit_retries:
+                                    throttle_retries += 1
+                                    self.record_retry(url, status)
+                                    continue
+                            elif status in self.__RETRY_STATUSES and status_retries < self.retries:
+                                retry_status = status
+                            if retry_status is None:
+                                raise self.__http_error(status, body)
+                        else:
+                            # Records already yielded can't be taken back, errors while streaming are raised
+                            await asyncio.to_thread(self.rate_limiter_for(url).record_success)
+                            parser = RecordParser(prefix)
+                            received = 0
+                            try:
+                                async for chunk in response.content.iter_chunked(self.stream_chunk_size):
+                                    received += len(chunk)
+                                    for record in parser.feed(chunk):
+                                        yield record
+                                for record in parser.close():
+                                    yield record
+                            finally:
+                                self.record_request(url, status, time.monotonic() - started, wait_time, received)
+                            return
+
+            # Outside the semaphore, a request backing off doesn't hold a slot other requests could use
+            await self.__backoff(url, retry_status, status_retries)
+            status_retries += 1
+
+    async def __send(self, session, url, headers):
+        """One GET bounded by max_in_flight (the rate limiter wait happens before), returns (status, headers, body)"""
+        async with self.__semaphore:
+            async with session.get(url, headers = headers) as response:
+                return response.status, response.headers, await response.read()
+
+    async def __backoff(self, url, status, attempt):
+        """Exponential backoff before retrying a gateway error, connection error or timeout"""
+        self.record_retry(url, status)
+        await asyncio.sleep(0.5 * (2 ** attempt))
+
+    @staticmethod
+    def __http_error(status, body):
+        """ValueError of an error response, with its JSON error message if there is one"""
+        try:
+            return ValueError(loads(body))
+        except json.decoder.JSONDecodeError:
+            return ValueError(f"HTTP {status}: {body[:200].decode('utf-8', 'replace')}")
+
+    async def _iter_pages(self, fetch_page, page_size, records_key = None, start_page = 1, max_pages = None, time_budget = None, prefetch = 1):
+        """Async generator of pages, the next prefetch pages are requested as tasks while the caller processes one"""
+        deadline = time.monotonic() + time_budget if time_budget is not None else None
+        last_page = start_page + max_pages - 1 if max_pages is not None else None
+        next_page = start_page
+        pending = deque() # tasks of the pages in flight, in page order
+
+        async def fetch(page):
+            result = await fetch_page(page)
+            return (result or {}).get(records_key) or [] if records_key else result or []
+
+        try:
+            while True:
+                while len(pending) <= prefetch and (last_page is None or next_page <= last_page) \
+                        and (deadline is None or time.monotonic() < deadline):
+                    pending.append(asyncio.ensure_future(fetch(next_page)))
+                    next_page += 1
+                if not pending:
+                    return
+
+                records = await pending.popleft()
+                if not records:
+                    return
+                is_last_page = page_size and len(records) < page_size
+                if is_last_page:
+                    for task in pending:
+                        task.cancel() # nothing after this page
+                yield records
+                if is_last_page:
+                    return
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions = True)
+
+    async def api_is_up(self):
+        """Return True if the API server is up and running, False otherwise"""
+
+        try:
+            await self.ping()
+            return True
+        except Exception as e:
+            return False
+
+    async def fetch_all(self, requests, timeout = None):
+        """
+            Await {key: coroutine} concurrently, returns {key: result or exception}
+            Requests not finished within timeout seconds are cancelled and mapped to asyncio.TimeoutError
+        """
+
+        tasks = {key: asyncio.ensure_future(request) for key, request in requests.items()}
+        if not tasks:
+            return {}
+
+        done, pending = await asyncio.wait(tasks.values(), timeout = timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions = True)
+
+        results = {}
+        for key, task in tasks.items():
+            if task in pending:
+                results[key] = asyncio.TimeoutError(f"Request {key} not fetched within {timeout}s")
+            elif task.exception():
+                results[key] = task.exception()
+            else:
+                results[key] = task.result()
+        return results
+
+    async def get_coins_with_market_data_pages(self, pages, timeout = None, **kwargs):
+        """
+            Fetch several /coins/markets pages concurrently, returns {page: coins or exception}
+            Pages not finished within timeout seconds are cancelled and mapped to asyncio.TimeoutError
+        """
+        return await self.fetch_all({page: self.get_coins_with_market_data(page = page, **kwargs) for page in pages}, timeout)
@@ -0,0 +1,43 @@
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Endpoint names for request URLs, used for per-endpoint settings (cache TTLs, ...)
+# Order matters: the first matching pattern wins
+ENDPOINT_PATTERNS = [
+    ('ping', re.compile(r'^ping$')),
+    ('simple/price', re.compile(r'^simple/price$')),
+    ('simple/token_price', re.compile(r'^simple/token_price/[^/]+$')),
+    ('simple/supported_vs_currencies', re.compile(r'^simple/supported_vs_currencies$')),
+    ('coins/list', re.compile(r'^coins/list$')),
+    ('coins/markets', re.compile(r'^coins/markets$')),
+    ('coins/{id}/tickers', re.compile(r'^coins/[^/]+/tickers$')),
+    ('coins/{id}/history', re.compile(r'^coins/[^/]+/history$')),
+    ('coins/{id}/market_chart/range', re.compile(r'^coins/[^/]+/market_chart/range$')),
+    ('coins/{id}/market_chart', re.compile(r'^coins/[^/]+/market_chart$')),
+    ('coins/{id}/ohlc', re.compile(r'^coins/[^/]+/ohlc$')),
+    ('coins/{id}', re.compile(r'^coins/[^/]+/?$')),
+]
+
+API_KEY_PARAMS = ('x_cg_demo_api_key', 'x_cg_pro_api_key')
+
+def endpoint_name(url):
+    """Return the endpoint name of a request URL, e.g. 'coins/{id}/ohlc' (or the raw path if unknown)"""
+    path = urlsplit(url).path
+    path = path.split('/api/v3/', 1)[-1].strip('/') if '/api/v3/' in path else path.strip('/')
+
+    for name, pattern in ENDPOINT_PATTERNS:
+        if pattern.match(path):
+            return name
+    return path
+
+def cache_key(url):
+    """Key of a request URL that ignores the API key and base URL (demo and pro keys share responses)"""
+    parts = urlsplit(strip_api_key(url))
+    path = parts.path.split('/api/v3/', 1)[-1] if '/api/v3/' in parts.path else parts.path
+    return path.strip('/') + ('?' + parts.query if parts.query else '')
+
+def strip_api_key(url):
+    """Remove the API key query parameters from a request URL"""
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key not in API_KEY_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
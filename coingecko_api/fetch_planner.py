@@ -0,0 +1,95 @@
+from urllib.parse import quote
+
+# Plans the API calls that fetch an exact set of coins
+# /coins/markets takes up to 250 ids per call but only one vs_currency, while
+# /simple/price returns several currencies per call (price, 24h volume and change,
+# no coin metadata or 24h high/low). Ids are packed into batches bounded by the
+# encoded length of the ids parameter, and of the candidate plans the one with
+# the fewest calls is used (ties go to the plan with more /coins/markets data).
+
+class FetchCall:
+    __slots__ = ('endpoint', 'vs_currencies', 'ids')
+
+    def __init__(self, endpoint, vs_currencies, ids):
+        self.endpoint = endpoint # 'coins/markets' or 'simple/price'
+        self.vs_currencies = vs_currencies
+        self.ids = ids
+
+    def request(self, cg):
+        """Make the call with a CoinGeckoAPI (or an awaitable with AsyncCoinGeckoAPI)"""
+        if self.endpoint == 'coins/markets':
+            return cg.get_coins_with_market_data(vs_currency = self.vs_currencies[0], ids = ','.join(self.ids),
+                per_page = FetchPlanner.MARKETS_PER_PAGE, sparkline = False)
+        return cg.get_price(','.join(self.ids), ','.join(self.vs_currencies),
+            include_24hr_vol = True, include_24hr_change = True, include_last_updated_at = True)
+
+    def __repr__(self):
+        return f"FetchCall({self.endpoint}, {','.join(self.vs_currencies)}, {len(self.ids)} ids)"
+
+class FetchPlan:
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+
+    def __len__(self):
+        return len(self.calls)
+
+    def coins_requested(self):
+        return sum(len(call.ids) for call in self.calls)
+
+def pack_ids(ids, max_ids_length, max_ids = None):
+    """Split ids into batches whose comma separated, URL encoded length stays within max_ids_length"""
+    batches = []
+    batch = []
+    length = 0
+    for coin_id in ids:
+        id_length = len(quote(coin_id, safe='')) + (3 if batch else 0) # ',' is encoded as %2C
+        if batch and (length + id_length > max_ids_length or (max_ids and len(batch) >= max_ids)):
+            batches.append(batch)
+            batch = []
+            id_length -= 3
+            length = 0
+        batch.append(coin_id)
+        length += id_length
+    if batch:
+        batches.append(batch)
+    return batches
+
+class FetchPlanner:
+    MARKETS_PER_PAGE = 250
+
+    def __init__(self, max_ids_length = 4000):
+        self.max_ids_length = max_ids_length
+
+    def markets_calls(self, vs_currency, ids):
+        return [FetchCall('coins/markets', (vs_currency,), batch)
+            for batch in pack_ids(ids, self.max_ids_length, self.MARKETS_PER_PAGE)]
+
+    def simple_calls(self, vs_currencies, ids):
+        return [FetchCall('simple/price', tuple(vs_currencies), batch)
+            for batch in pack_ids(ids, self.max_ids_length)]
+
+    def candidate_plans(self, market_data_ids, usd_price_ids, btc_price_ids):
+        """
+            Plans covering market data (coins table) for market_data_ids and USD / BTC prices for the price ids
+            Market data always comes from USD /coins/markets, which also carries those coins' USD prices
+        """
+        market_data_ids = sorted(set(market_data_ids))
+        usd_ids = set(usd_price_ids)
+        btc_ids = set(btc_price_ids)
+        usd_markets_ids = sorted(usd_ids.union(market_data_ids))
+        usd_remaining_ids = usd_ids.difference(market_data_ids)
+
+        return [
+            # USD and BTC /coins/markets
+            FetchPlan('markets', self.markets_calls('usd', usd_markets_ids) + self.markets_calls('btc', sorted(btc_ids))),
+            # USD /coins/markets, BTC prices from /simple/price
+            FetchPlan('markets+simple_btc', self.markets_calls('usd', usd_markets_ids) + self.simple_calls(['btc'], sorted(btc_ids))),
+            # USD /coins/markets for market data only, all other prices from one /simple/price sweep
+            FetchPlan('markets+simple', self.markets_calls('usd', market_data_ids)
+                + self.simple_calls(['usd', 'btc'], sorted(usd_remaining_ids.union(btc_ids)))),
+        ]
+
+    def plan(self, market_data_ids, usd_price_ids, btc_price_ids):
+        """Return the candidate plan with the fewest API calls"""
+        return min(self.candidate_plans(market_data_ids, usd_price_ids, btc_price_ids), key=len)
@@ -0,0 +1,149 @@
+import re
+import json
+import codecs
+
+# Optional faster backends: ijson (C yajl2 backend) parses incrementally,
+# orjson decodes whole bodies
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Incremental parsing of JSON response bodies
+# A RecordParser is fed the body chunk by chunk as it arrives and returns the
+# records (array items) completed so far, so the raw body, its decoded string
+# and the full object tree are never held in memory at once.
+# prefix follows ijson: 'item' for the items of a top-level array (/coins/list,
+# /coins/markets), 'tickers.item' for the items of the array under the
+# 'tickers' key (/coins/{id}/tickers).
+# With ijson any prefix is parsed incrementally. Without it the items of top-level
+# arrays are decoded one by one as they complete (json's C scanner), other
+# prefixes fall back to decoding the whole body at close().
+
+def loads(data):
+    """Decode JSON bytes with the fastest available decoder"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def backend_name():
+    return 'ijson' if ijson else ('orjson' if orjson else 'json')
+
+class ArraySplitter:
+    """Decode the items of a top-level JSON array while the bytes arrive"""
+    __WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self):
+        self.__decoder = json.JSONDecoder()
+        self.__text = codecs.getincrementaldecoder('utf-8')()
+        self.__buffer = '' # undecoded rest of the body
+        self.__started = False # past the opening '['
+        self.__after_item = False # expecting ',' or ']'
+        self.__expect_item = False # past a ',', the next item must follow (kept across chunks)
+        self.__done = False
+
+    def feed(self, chunk, final = False):
+        """Add bytes, returns the items completed by them"""
+        buffer = self.__buffer + self.__text.decode(chunk, final)
+        skip_whitespace = self.__WHITESPACE.match
+        items = []
+        position = 0
+
+        while not self.__done:
+            position = skip_whitespace(buffer, position).end()
+            if position == len(buffer):
+                break
+            character = buffer[position]
+
+            if not self.__started:
+                if character != '[':
+                    raise ValueError("Expected a JSON array")
+                self.__started = True
+                position += 1
+            elif character == ']' and not self.__expect_item:
+                self.__done = True
+                position += 1
+            elif self.__after_item:
+                if character != ',':
+                    raise ValueError(f"Expected ',' or ']' in JSON array, got {character!r}")
+                self.__after_item = False
+                self.__expect_item = True
+                position += 1
+            elif character == ']':
+                raise ValueError("Expected an item after ',' in JSON array")
+            else:
+                # Items are decoded by the C scanner, an incomplete item fails and is retried with more bytes
+                try:
+                    item, end = self.__decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    break
+                # A number may continue in the next chunk, wait until the ',' or ']' after the item has arrived
+                after = skip_whitespace(buffer, end).end()
+                if not final and (after == len(buffer) or buffer[after] not in ',]'):
+                    break
+                items.append(item)
+                position = end
+                self.__after_item = True
+                self.__expect_item = False
+
+        self.__buffer = buffer[position:]
+        return items
+
+    def close(self):
+        items = self.feed(b'', final = True)
+        if not self.__done:
+            raise ValueError("Incomplete JSON array")
+        return items
+
+class BufferedParser:
+    """Fallback for nested prefixes without ijson: decode the whole body at close()"""
+    def __init__(self, prefix):
+        self.__path = prefix.split('.')[:-1] # keys above the array
+        self.__chunks = []
+
+    def feed(self, chunk):
+        self.__chunks.append(chunk)
+        return []
+
+    def close(self):
+        content = loads(b''.join(self.__chunks))
+        self.__chunks = []
+        for key in self.__path:
+            content = content.get(key) or []
+        return list(content)
+
+class IjsonParser:
+    def __init__(self, prefix):
+        self.__records = ijson.sendable_list()
+        self.__coroutine = ijson.items_coro(self.__records, prefix, use_float = True)
+
+    def feed(self, chunk):
+        self.__coroutine.send(chunk)
+        return self.__take()
+
+    def close(self):
+        self.__coroutine.close()
+        return self.__take()
+
+    def __take(self):
+        records = list(self.__records)
+        del self.__records[:]
+        return records
+
+def RecordParser(prefix = 'item'):
+    """Incremental parser of the records under prefix, see the module comment"""
+    if ijson:
+        return IjsonParser(prefix)
+    if prefix == 'item':
+        return ArraySplitter()
+    return BufferedParser(prefix)
+
+def iter_records(chunks, prefix = 'item'):
+    """Yield the records under prefix from an iterable of body chunks"""
+    parser = RecordParser(prefix)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
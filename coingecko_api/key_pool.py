@@ -0,0 +1,112 @@
+import time
+import threading
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from coingecko_api.endpoints import API_KEY_PARAMS, strip_api_key
+
+# Several CoinGecko API keys (demo and paid plans mixed) used as one client
+# Every key has its own token bucket (shared between processes through the rate
+# limit state file like a single key's) and health: a key answering 429 is
+# benched until its Retry-After has passed, a rejected key (401/403) for an hour.
+# Requests go to the healthy key with the most headroom, so the pool's quota is
+# the sum of the keys' quotas. headroom() and max_rate make a pool usable where
+# a TokenBucketRateLimiter's budget is read (e.g. the fetch planning).
+
+def parse_api_keys(value):
+    """Parse 'plan:key,plan:key' (e.g. the COINGECKO_API_KEYS environment variable), returns [(key, plan)] or None"""
+    if not value:
+        return None
+    keys = []
+    for entry in value.replace(' ', '').split(','):
+        if not entry:
+            continue
+        plan, _, api_key = entry.rpartition(':')
+        keys.append((api_key, plan or 'demo'))
+    return keys or None
+
+class ApiKey:
+    def __init__(self, api_key, plan, base_url, key_param, rate_limiter):
+        self.api_key = api_key
+        self.plan = plan
+        self.base_url = base_url
+        self.key_param = key_param # x_cg_demo_api_key or x_cg_pro_api_key
+        self.rate_limiter = rate_limiter
+        self.benched_until = 0.0
+        self.rejections = 0
+
+    def is_benched(self, now = None):
+        return self.benched_until > (time.time() if now is None else now)
+
+    def __repr__(self):
+        return f"ApiKey({self.plan}, ...{self.api_key[-4:]})"
+
+class ApiKeyPool:
+    __THROTTLE_BENCH_SECONDS = 60 # 429 without Retry-After
+    __REJECTED_BENCH_SECONDS = 3600 # 401/403, invalid, expired or over the monthly credits
+
+    def __init__(self, keys):
+        if not keys:
+            raise ValueError("An API key pool needs at least one key")
+        self.keys = list(keys)
+        self.__by_key = {key.api_key: key for key in self.keys}
+        self.__lock = threading.Lock()
+
+    @property
+    def max_rate(self):
+        """Requests per second of the healthy keys (of all keys if every key is benched)"""
+        return sum(key.rate_limiter.max_rate for key in self.__healthy())
+
+    def headroom(self):
+        """Tokens available over the healthy keys"""
+        return sum(key.rate_limiter.headroom() for key in self.__healthy())
+
+    def choose(self):
+        """The healthy key with the most headroom, or the key coming off the bench first"""
+        now = time.time()
+        with self.__lock:
+            healthy = [key for key in self.keys if not key.is_benched(now)]
+            if not healthy:
+                return min(self.keys, key=lambda key: key.benched_until)
+        return max(healthy, key=lambda key: (key.rate_limiter.headroom(), key.rate_limiter.max_rate))
+
+    def key_for_url(self, url):
+        """The key a request URL is sent with"""
+        for name, value in parse_qsl(urlsplit(url).query):
+            if name in API_KEY_PARAMS and value in self.__by_key:
+                return self.__by_key[value]
+        return None
+
+    def with_key(self, url, key):
+        """url sent with key: the key's base URL and key parameter"""
+        url = strip_api_key(url)
+        parts = urlsplit(url)
+        path = parts.path.split('/api/v3/', 1)[-1]
+        url = key.base_url + path + ('?' + parts.query if parts.query else '')
+        separator = '&' if '?' in url else '?'
+        return url + separator + urlencode({key.key_param: key.api_key})
+
+    def bench(self, key, status, retry_after = None):
+        """Take a key out of rotation after a 429 (until Retry-After) or a 401/403"""
+        with self.__lock:
+            key.rejections += 1
+            if status == 429:
+                seconds = retry_after if retry_after is not None else self.__THROTTLE_BENCH_SECONDS
+            else:
+                seconds = self.__REJECTED_BENCH_SECONDS
+            key.benched_until = max(key.benched_until, time.time() + seconds)
+        if status == 429:
+            key.rate_limiter.record_throttle(retry_after)
+
+    def status(self):
+        """Per key plan, health and headroom, for logs"""
+        now = time.time()
+        return [{
+            'key': repr(key),
+            'benched_seconds': round(max(0.0, key.benched_until - now), 1),
+            'rejections': key.rejections,
+            'headroom': round(key.rate_limiter.headroom(), 1)
+        } for key in self.keys]
+
+    def __healthy(self):
+        now = time.time()
+        healthy = [key for key in self.keys if not key.is_benched(now)]
+        return healthy or self.keys
@@ -0,0 +1,86 @@
+import datetime
+import numpy as np
+
+# Columnar transformation of /coins/markets pages into database rows
+# A page is split into one column per API field once, then mapping, integer
+# rounding, required-column checks and id filtering run over whole columns
+# with NumPy. Every row from a page shares a single timestamp.
+
+def id_array(ids):
+    """Sorted unique NumPy array of coin ids, used for vectorized membership checks"""
+    return np.unique(np.array(list(ids), dtype=str))
+
+def object_column(values):
+    """1-D object array of a column (values may themselves be lists or None)"""
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+def integer_column(values):
+    """Round a column of numbers to Python ints, None (or NaN) stays None"""
+    rounded = np.rint(np.array(values, dtype=np.float64))
+    valid = np.isfinite(rounded)
+    safe = np.where(valid, rounded, 0.0)
+
+    # Values beyond int64 (e.g. meme coin supplies) fall back to Python ints
+    if np.all(np.abs(safe) < 2**63):
+        integers = safe.astype(np.int64).tolist()
+    else:
+        integers = [int(value) for value in safe.tolist()]
+
+    if valid.all():
+        return integers
+    return [value if is_valid else None for value, is_valid in zip(integers, valid.tolist())]
+
+def simple_price_coins(prices):
+    """Convert a get_price() response ({id: {currency: ...}}) to a list of coins for MarketPage"""
+    coins = []
+    for coin_id, values in prices.items():
+        coin = dict(values, id=coin_id)
+        if coin.get('last_updated_at') is not None:
+            coin['last_updated_at'] = datetime.datetime.fromtimestamp(coin['last_updated_at'], datetime.timezone.utc).isoformat()
+        coins.append(coin)
+    return coins
+
+class MarketPage:
+    def __init__(self, coins, timestamp = None):
+        self.coins = coins
+        self.size = len(coins)
+        self.timestamp = timestamp or datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self.ids = np.array([coin.get('id') for coin in coins], dtype=str)
+        self.__columns = {}
+
+    def column(self, key):
+        """Return the values of an API field for every coin on the page (cached)"""
+        if key not in self.__columns:
+            self.__columns[key] = [coin.get(key) for coin in self.coins]
+        return self.__columns[key]
+
+    def mask(self, ids):
+        """Boolean mask of the coins whose id is in ids (an id_array)"""
+        return np.isin(self.ids, ids)
+
+    def to_rows(self, mapping, integer_columns = (), required_columns = (), ids = None, extra_columns = None):
+        """
+            Map the page to database rows using an api_to_db_mappings dict
+            Only coins in ids (an id_array, None for all) with every required column set are returned
+        """
+
+        mask = np.ones(self.size, dtype=bool) if ids is None else self.mask(ids)
+
+        columns = {}
+        for api_key, db_column in mapping.items():
+            values = self.column(api_key)
+            if db_column in integer_columns:
+                values = integer_column(values)
+            values = object_column(values)
+            if db_column in required_columns:
+                mask &= ~np.equal(values, None)
+            columns[db_column] = values
+
+        # Select the rows once, then zip the columns back into dicts for the API
+        size = int(mask.sum())
+        names = list(columns) + list(extra_columns or {})
+        selected_columns = [columns[name][mask].tolist() for name in columns]
+        selected_columns += [[value] * size for value in (extra_columns or {}).values()]
+        return [dict(zip(names, values)) for values in zip(*selected_columns)]
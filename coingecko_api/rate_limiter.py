@@ -0,0 +1,145 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+# Token bucket rate limiter for the CoinGecko API
+# Bucket state can be kept in a small SQLite file so that overlapping scripts
+# (add_new_coins, store_real_time_prices, ...) share one quota.
+# The refill rate is adjusted AIMD-style: halved on every 429 and slowly
+# increased again on successful requests until it is back at the plan rate.
+class TokenBucketRateLimiter:
+    __DECREASE_FACTOR = 0.5 # multiply rate by this on 429
+    __INCREASE_FRACTION = 0.05 # add this fraction of the plan rate on success
+    __MIN_RATE_FRACTION = 0.1 # never go below this fraction of the plan rate
+    __DEFAULT_BACKOFF_SECONDS = 10 # pause when 429 has no Retry-After header
+
+    def __init__(self, pause_time, burst = None, state_file = None, bucket_name = 'default'):
+        self.max_rate = 1000 / pause_time # tokens per second
+        self.min_rate = self.max_rate * self.__MIN_RATE_FRACTION
+        self.capacity = burst if burst else max(1, int(self.max_rate))
+        self.state_file = state_file
+        self.bucket_name = bucket_name
+        self.__lock = threading.Lock()
+        self.__memory_state = None
+        self.__connection = None
+
+        if state_file:
+            directory = os.path.dirname(os.path.abspath(state_file))
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            self.__connection = sqlite3.connect(state_file, timeout = 30, isolation_level = None, check_same_thread = False)
+            self.__connection.execute('PRAGMA journal_mode=WAL')
+            self.__connection.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    name TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    rate REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    blocked_until REAL NOT NULL
+                )
+            """)
+
+    def __new_state(self):
+        return {'tokens': self.capacity, 'rate': self.max_rate, 'updated_at': time.time(), 'blocked_until': 0.0}
+
+    @contextmanager
+    def __state(self):
+        """Lock the bucket state, yield it as a dict and write back any changes"""
+        with self.__lock:
+            if not self.__connection:
+                if self.__memory_state is None:
+                    self.__memory_state = self.__new_state()
+                yield self.__memory_state
+                return
+
+            # BEGIN IMMEDIATE takes the write lock, serializing all processes sharing the file
+            self.__connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.__connection.execute(
+                    'SELECT tokens, rate, updated_at, blocked_until FROM buckets WHERE name = ?',
+                    (self.bucket_name,)
+                ).fetchone()
+                if row:
+                    state = dict(zip(('tokens', 'rate', 'updated_at', 'blocked_until'), row))
+                    # Plan may have changed since the state was written
+                    state['rate'] = min(max(state['rate'], self.min_rate), self.max_rate)
+                else:
+                    state = self.__new_state()
+
+                yield state
+
+                self.__connection.execute(
+                    'INSERT OR REPLACE INTO buckets (name, tokens, rate, updated_at, blocked_until) VALUES (?, ?, ?, ?, ?)',
+                    (self.bucket_name, state['tokens'], state['rate'], state['updated_at'], state['blocked_until'])
+                )
+                self.__connection.execute('COMMIT')
+            except BaseException:
+                self.__connection.execute('ROLLBACK')
+                raise
+
+    def __refill(self, state, now):
+        elapsed = max(0.0, now - state['updated_at'])
+        state['tokens'] = min(self.capacity, state['tokens'] + elapsed * state['rate'])
+        state['updated_at'] = now
+
+    def reserve(self):
+        """Take one token and return the number of seconds to wait before using it"""
+        with self.__state() as state:
+            now = time.time()
+            self.__refill(state, now)
+
+            # Tokens can go negative, each caller waits for its own place in line
+            state['tokens'] -= 1
+            wait_time = max(0.0, -state['tokens'] / state['rate'])
+            return max(wait_time, state['blocked_until'] - now)
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        wait_time = self.reserve()
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def headroom(self):
+        """Return the number of tokens currently available (negative if callers are queued)"""
+        with self.__state() as state:
+            now = time.time()
+            self.__refill(state, now)
+            if state['blocked_until'] > now:
+                return min(state['tokens'], 0.0)
+            return state['tokens']
+
+    def record_success(self):
+        """Additive increase of the refill rate after a successful request"""
+        with self.__state() as state:
+            if state['rate'] < self.max_rate:
+                self.__refill(state, time.time())
+                state['rate'] = min(self.max_rate, state['rate'] + self.max_rate * self.__INCREASE_FRACTION)
+
+    def record_throttle(self, retry_after = None):
+        """Multiplicative decrease of the refill rate and pause all callers after a 429"""
+        with self.__state() as state:
+            now = time.time()
+            self.__refill(state, now)
+            state['rate'] = max(self.min_rate, state['rate'] * self.__DECREASE_FACTOR)
+            state['tokens'] = min(state['tokens'], 0.0)
+            backoff = retry_after if retry_after is not None else self.__DEFAULT_BACKOFF_SECONDS
+            state['blocked_until'] = max(state['blocked_until'], now + backoff)
+
+def retry_after_seconds(headers):
+    """Parse a Retry-After header (seconds or HTTP date), return None if missing or invalid"""
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from coingecko_api.endpoints import endpoint_name, cache_key
+from coingecko_api.json_stream import loads
+
+# Response cache for CoinGeckoAPI
+# Responses are kept for a per-endpoint TTL in an in-memory LRU and, optionally,
+# a SQLite file shared between processes. Once an entry expires, its ETag /
+# Last-Modified validators are sent with the next request so an unchanged
+# response (304) only refreshes the entry instead of transferring the body again.
+# Entries hold the encoded JSON, every read decodes a new copy so callers can
+# modify what they get without changing the cached response for later hits.
+class CacheEntry:
+    __slots__ = ('body', 'etag', 'last_modified', 'expires_at')
+
+    def __init__(self, body, etag = None, last_modified = None, expires_at = 0.0):
+        self.body = body # JSON text
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+    @property
+    def content(self):
+        """The decoded response, a new copy on every access"""
+        return loads(self.body)
+
+    def is_fresh(self):
+        return time.time() < self.expires_at
+
+    def validators(self):
+        """Conditional request headers for revalidating this entry"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+class ResponseCache:
+    # TTLs in seconds, endpoints not listed here are not cached
+    # coins/markets and simple/price are left out: the collector runs about every minute and
+    # must see every run's prices, a cached page would be skipped as unchanged snapshots
+    DEFAULT_TTLS = {
+        'simple/supported_vs_currencies': 86400,
+        'coins/list': 3600,
+        'coins/{id}': 600,
+        'coins/{id}/history': 86400,
+    }
+
+    def __init__(self, ttls = None, max_entries = 1024, cache_file = None):
+        self.ttls = dict(self.DEFAULT_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.__memory = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__connection = None
+
+        if cache_file:
+            directory = os.path.dirname(os.path.abspath(cache_file))
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            self.__connection = sqlite3.connect(cache_file, timeout = 30, isolation_level = None, check_same_thread = False)
+            self.__connection.execute('PRAGMA journal_mode=WAL')
+            self.__connection.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+    def ttl(self, url):
+        """TTL in seconds for a request URL, 0 if the endpoint is not cached"""
+        return self.ttls.get(endpoint_name(url), 0)
+
+    def get(self, url):
+        """Return the cached CacheEntry for a request URL (fresh or stale), or None"""
+        if not self.ttl(url):
+            return None
+
+        key = cache_key(url)
+        with self.__lock:
+            entry = self.__memory.get(key)
+            if entry is not None:
+                self.__memory.move_to_end(key)
+                return entry
+
+            if not self.__connection:
+                return None
+            row = self.__connection.execute(
+                'SELECT content, etag, last_modified, expires_at FROM responses WHERE url = ?', (key,)
+            ).fetchone()
+            if not row:
+                return None
+
+            entry = CacheEntry(row[0], row[1], row[2], row[3])
+            self.__remember(key, entry)
+            return entry
+
+    def put(self, url, content, headers):
+        """Store a successful response, with its validators from the response headers"""
+        ttl = self.ttl(url)
+        if not ttl:
+            return
+
+        key = cache_key(url)
+        entry = CacheEntry(json.dumps(content), headers.get('ETag'), headers.get('Last-Modified'), time.time() + ttl)
+        with self.__lock:
+            self.__remember(key, entry)
+            if self.__connection:
+                self.__connection.execute(
+                    'INSERT OR REPLACE INTO responses (url, content, etag, last_modified, expires_at) VALUES (?, ?, ?, ?, ?)',
+                    (key, entry.body, entry.etag, entry.last_modified, entry.expires_at)
+                )
+
+    def refresh(self, url, entry):
+        """Extend an entry after a 304 Not Modified response"""
+        key = cache_key(url)
+        with self.__lock:
+            entry.expires_at = time.time() + self.ttl(url)
+            if self.__connection:
+                self.__connection.execute('UPDATE responses SET expires_at = ? WHERE url = ?', (entry.expires_at, key))
+
+    def clear(self):
+        with self.__lock:
+            self.__memory.clear()
+            if self.__connection:
+                self.__connection.execute('DELETE FROM responses')
+
+    def __remember(self, key, entry):
+        self.__memory[key] = entry
+        self.__memory.move_to_end(key)
+        while len(self.__memory) > self.max_entries:
+            self.__memory.popitem(last=False)
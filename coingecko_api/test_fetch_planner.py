@@ -0,0 +1,71 @@
+from urllib.parse import quote
+from coingecko_api.fetch_planner import FetchPlanner, FetchCall, pack_ids
+
+def coin_ids(count, prefix = 'coin'):
+    return [f'{prefix}-{i:03d}' for i in range(count)]
+
+def encoded_length(batch):
+    return len(quote(','.join(batch), safe=''))
+
+def test_batches_stay_within_the_encoded_length():
+    ids = coin_ids(500) + ['wrapped bitcoin', 'ünïcode-coin', 'a/b']
+    batches = pack_ids(ids, 200)
+    assert [coin_id for batch in batches for coin_id in batch] == ids
+    assert all(encoded_length(batch) <= 200 for batch in batches)
+    # Batches are filled: the next id would not have fit
+    assert all(encoded_length(batch + [next_batch[0]]) > 200 for batch, next_batch in zip(batches, batches[1:]))
+
+def test_batches_are_capped_at_max_ids():
+    batches = pack_ids(coin_ids(600), 100000, max_ids = 250)
+    assert [len(batch) for batch in batches] == [250, 250, 100]
+
+def test_an_id_longer_than_the_limit_gets_its_own_batch():
+    assert pack_ids(['a', 'x' * 50, 'b'], 10) == [['a'], ['x' * 50], ['b']]
+
+def test_small_sets_use_markets_for_both_currencies():
+    ids = coin_ids(10)
+    plan = FetchPlanner().plan(ids, ids, ids)
+    assert plan.name == 'markets'
+    assert [(call.endpoint, call.vs_currencies) for call in plan.calls] == [('coins/markets', ('usd',)), ('coins/markets', ('btc',))]
+
+def test_many_btc_prices_move_to_simple_price():
+    ids = coin_ids(600)
+    plan = FetchPlanner().plan(ids[:200], ids[:200], ids)
+    assert plan.name == 'markets+simple_btc'
+    assert len(plan) == 3 # one USD /coins/markets page, 600 BTC prices in two /simple/price calls
+    assert plan.coins_requested() == 800
+
+def test_prices_without_market_data_use_one_simple_price_sweep():
+    ids = coin_ids(300)
+    plan = FetchPlanner().plan([], ids, ids)
+    assert plan.name == 'markets+simple'
+    assert len(plan) == 1
+    assert plan.calls[0].vs_currencies == ('usd', 'btc')
+    assert plan.calls[0].ids == sorted(ids)
+
+def test_cheapest_plan_has_the_fewest_calls():
+    planner = FetchPlanner(max_ids_length = 1000)
+    ids = coin_ids(900)
+    candidates = planner.candidate_plans(ids[:300], ids[:600], ids[300:])
+    plan = planner.plan(ids[:300], ids[:600], ids[300:])
+    assert len(plan) == min(len(candidate) for candidate in candidates)
+    for candidate in candidates:
+        # Every candidate covers the market data and both price sets
+        usd = {coin_id for call in candidate.calls if 'usd' in call.vs_currencies for coin_id in call.ids}
+        btc = {coin_id for call in candidate.calls if 'btc' in call.vs_currencies for coin_id in call.ids}
+        markets = {coin_id for call in candidate.calls if call.endpoint == 'coins/markets' and call.vs_currencies == ('usd',) for coin_id in call.ids}
+        assert set(ids[:300]) <= markets and set(ids[:600]) <= usd and set(ids[300:]) <= btc
+
+def test_calls_make_their_requests():
+    class RecordingAPI:
+        def get_coins_with_market_data(self, **kwargs):
+            return ('markets', kwargs)
+
+        def get_price(self, ids, vs_currencies, **kwargs):
+            return ('price', ids, vs_currencies, kwargs)
+
+    endpoint, kwargs = FetchCall('coins/markets', ('btc',), ['bitcoin', 'ethereum']).request(RecordingAPI())
+    assert kwargs == {'vs_currency': 'btc', 'ids': 'bitcoin,ethereum', 'per_page': 250, 'sparkline': False}
+    endpoint, ids, vs_currencies, kwargs = FetchCall('simple/price', ('usd', 'btc'), ['bitcoin']).request(RecordingAPI())
+    assert (ids, vs_currencies) == ('bitcoin', 'usd,btc')
+    assert kwargs['include_last_updated_at']
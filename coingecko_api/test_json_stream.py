@@ -0,0 +1,82 @@
+import json
+import time
+import pytest
+from coingecko_api.api import CoinGeckoAPI
+from coingecko_api.json_stream import ArraySplitter
+from coingecko_api.rate_limiter import TokenBucketRateLimiter
+from utils.metrics import MetricsRegistry
+from utils.testing import FakeResponse, FakeSession
+
+def split(body, chunk_size):
+    """Items of body fed to an ArraySplitter chunk_size bytes at a time"""
+    data = body.encode('utf-8')
+    splitter = ArraySplitter()
+    items = []
+    for i in range(0, len(data), chunk_size):
+        items.extend(splitter.feed(data[i:i + chunk_size]))
+    items.extend(splitter.close())
+    return items
+
+BODY = json.dumps([
+    {'id': 'bitcoin', 'current_price': 67000.5, 'platforms': {'': ''}},
+    {'id': 'ethereum', 'name': 'Éther ✓', 'current_price': 3500},
+    12345678901234567890,
+    -1.5e-7,
+    'a string with ] and , inside',
+    [1, [2, 3]],
+    None
+], ensure_ascii=False)
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, len(BODY.encode('utf-8'))])
+def test_items_match_json_loads_for_any_chunking(chunk_size):
+    assert split(BODY, chunk_size) == json.loads(BODY)
+
+def test_number_split_across_chunks_is_not_cut():
+    splitter = ArraySplitter()
+    assert splitter.feed(b'[12') == []
+    assert splitter.feed(b'34,5') == [1234]
+    assert splitter.feed(b']') == [5]
+    assert splitter.close() == []
+
+@pytest.mark.parametrize('body', ['[]', ' [ ] ', '[\n]'])
+def test_empty_arrays(body):
+    assert split(body, 1) == []
+
+@pytest.mark.parametrize('body', ['[1,]', '[1,2,,3]', '[1 2]', '{"a": 1}', '[1,2'])
+def test_invalid_arrays_raise(body):
+    for chunk_size in (1, len(body)):
+        with pytest.raises(ValueError):
+            split(body, chunk_size)
+
+def test_trailing_comma_split_across_chunks_raises():
+    splitter = ArraySplitter()
+    assert splitter.feed(b'[1,') == [1]
+    with pytest.raises(ValueError):
+        splitter.feed(b']')
+
+def streaming_api(responses, clock, monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda seconds: setattr(clock, 'now', clock.now + seconds))
+    api = CoinGeckoAPI(None, rate_limiter = TokenBucketRateLimiter(pause_time = 1, burst = 100), metrics = MetricsRegistry())
+    api.rate_limit_retries = 1
+    api.session = FakeSession(responses)
+    return api
+
+def requests_total(api):
+    return {counter['status']: counter['value'] for counter in api.metrics.summary()['counters']['api_requests_total']}
+
+def test_stream_records_every_attempt_once(clock, monkeypatch):
+    coins = [{'id': 'bitcoin'}, {'id': 'ethereum'}]
+    api = streaming_api([FakeResponse(429, {'error': 'rate limited'}, {'Retry-After': '1'}), FakeResponse(200, coins)], clock, monkeypatch)
+    assert list(api.stream_coins_list()) == coins
+    assert requests_total(api) == {'429': 1, '200': 1}
+
+    throttled = FakeResponse(429, {'error': 'rate limited'}, {'Retry-After': '1'})
+    api = streaming_api([throttled, throttled], clock, monkeypatch)
+    with pytest.raises(ValueError):
+        list(api.stream_coins_list())
+    assert requests_total(api) == {'429': 2}
+
+    api = streaming_api([FakeResponse(404, {'error': 'not found'})], clock, monkeypatch)
+    with pytest.raises(ValueError):
+        list(api.stream_coins_list())
+    assert requests_total(api) == {'404': 1}
@@ -0,0 +1,98 @@
+import time
+import pytest
+from coingecko_api.api import CoinGeckoAPI
+from coingecko_api.key_pool import ApiKey, ApiKeyPool, parse_api_keys
+from coingecko_api.rate_limiter import TokenBucketRateLimiter
+from utils.testing import FakeResponse, FakeSession
+
+# clock (conftest.py) stands in for time.time()
+COINS = [{'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin'}]
+
+def pooled_api(responses, api_keys = (('demo-key-0001', 'demo'), ('paid-key-0002', 'analyst'))):
+    api = CoinGeckoAPI(None, api_keys = list(api_keys))
+    api.session = FakeSession(responses)
+    return api
+
+def sent_keys(api):
+    """Key of every request sent, in order"""
+    return [api.key_pool.key_for_url(url).api_key for url, _ in api.session.requests]
+
+def test_parse_api_keys():
+    assert parse_api_keys('demo:first, analyst:second,third') == [('first', 'demo'), ('second', 'analyst'), ('third', 'demo')]
+    assert parse_api_keys('') is None
+    assert parse_api_keys(' , ') is None
+
+def test_requests_carry_the_key_with_the_most_headroom(clock):
+    api = pooled_api([FakeResponse(200, COINS)])
+    assert api.get_coins_list() == COINS
+    url = api.session.requests[0][0]
+    # The analyst key has the larger bucket, its requests go to the pro API
+    assert url.startswith('https://pro-api.coingecko.com/api/v3/coins/list?')
+    assert 'x_cg_pro_api_key=paid-key-0002' in url and 'demo-key-0001' not in url
+
+def test_throttled_key_is_benched_and_the_request_rotates(clock):
+    api = pooled_api([
+        FakeResponse(429, {'error': 'rate limited'}, {'Retry-After': '30'}),
+        FakeResponse(200, COINS),
+        FakeResponse(200, COINS)
+    ])
+    assert api.get_coins_list() == COINS
+    assert sent_keys(api) == ['paid-key-0002', 'demo-key-0001']
+    assert api.session.requests[1][0].startswith('https://api.coingecko.com/api/v3/coins/list?')
+    assert 'x_cg_demo_api_key=demo-key-0001' in api.session.requests[1][0]
+
+    paid = api.key_pool.key_for_url(api.session.requests[0][0])
+    assert paid.is_benched() and paid.rejections == 1
+    assert api.key_pool.status()[1]['benched_seconds'] == 30
+    assert api.key_pool.max_rate == pytest.approx(0.5) # only the demo key is healthy
+
+    # Off the bench after Retry-After, the paid key has refilled and is chosen again
+    clock.now += 31
+    api.get_coins_list()
+    assert sent_keys(api)[-1] == 'paid-key-0002'
+
+def test_rejected_key_is_benched_for_an_hour(clock):
+    api = pooled_api([FakeResponse(401, {'error': 'invalid key'}), FakeResponse(200, COINS)])
+    assert api.get_coins_list() == COINS
+    assert sent_keys(api) == ['paid-key-0002', 'demo-key-0001']
+    assert api.key_pool.status()[1]['benched_seconds'] == 3600
+
+def test_all_keys_benched_waits_for_the_first_one_back(clock, monkeypatch):
+    sleeps = []
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock.now += seconds
+    monkeypatch.setattr(time, 'sleep', sleep)
+
+    api = pooled_api([
+        FakeResponse(429, {}, {'Retry-After': '20'}),
+        FakeResponse(429, {}, {'Retry-After': '5'}),
+        FakeResponse(200, COINS)
+    ])
+    assert api.get_coins_list() == COINS
+    assert sent_keys(api) == ['paid-key-0002', 'demo-key-0001', 'demo-key-0001']
+    assert sleeps == [pytest.approx(5)]
+
+def test_pool_budget_is_the_sum_of_the_healthy_keys(clock):
+    keys = [ApiKey(f'key-{i}', 'demo', 'https://api.coingecko.com/api/v3/', 'x_cg_demo_api_key',
+        TokenBucketRateLimiter(pause_time = 100, burst = 10)) for i in range(3)]
+    pool = ApiKeyPool(keys)
+    assert pool.max_rate == pytest.approx(30)
+    keys[0].rate_limiter.reserve()
+    assert pool.headroom() == pytest.approx(29)
+    assert pool.choose() is keys[1]
+
+    pool.bench(keys[1], 403)
+    assert pool.max_rate == pytest.approx(20)
+    assert pool.choose() is keys[2]
+
+    with pytest.raises(ValueError):
+        ApiKeyPool([])
+
+def test_with_key_replaces_the_base_url_and_key():
+    paid = ApiKey('paid', 'analyst', 'https://pro-api.coingecko.com/api/v3/', 'x_cg_pro_api_key', TokenBucketRateLimiter(pause_time = 100))
+    pool = ApiKeyPool([paid])
+    url = pool.with_key('https://api.coingecko.com/api/v3/simple/price?ids=bitcoin&x_cg_demo_api_key=old', paid)
+    assert url == 'https://pro-api.coingecko.com/api/v3/simple/price?ids=bitcoin&x_cg_pro_api_key=paid'
+    assert pool.key_for_url(url) is paid
+    assert pool.key_for_url('https://api.coingecko.com/api/v3/ping') is None
@@ -0,0 +1,66 @@
+import pytest
+from coingecko_api.rate_limiter import TokenBucketRateLimiter, retry_after_seconds
+
+# clock (conftest.py) stands in for time.time()
+
+def test_burst_is_free_then_callers_queue_at_the_rate(clock):
+    limiter = TokenBucketRateLimiter(pause_time = 100, burst = 3) # 10 requests per second
+    assert [limiter.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.reserve() == pytest.approx(0.1)
+    assert limiter.reserve() == pytest.approx(0.2)
+    assert limiter.headroom() == pytest.approx(-2)
+
+def test_bucket_refills_up_to_its_capacity(clock):
+    limiter = TokenBucketRateLimiter(pause_time = 100, burst = 3)
+    for _ in range(3):
+        limiter.reserve()
+    clock.now += 0.2
+    assert limiter.headroom() == pytest.approx(2)
+    clock.now += 60
+    assert limiter.headroom() == pytest.approx(3)
+
+def test_throttle_pauses_callers_for_retry_after(clock):
+    limiter = TokenBucketRateLimiter(pause_time = 100, burst = 10)
+    limiter.record_throttle(retry_after = 5)
+    assert limiter.reserve() == pytest.approx(5)
+    assert limiter.headroom() <= 0
+
+    clock.now += 10
+    assert limiter.headroom() == pytest.approx(10)
+
+def test_throttle_refills_at_half_the_rate(clock):
+    limiter = TokenBucketRateLimiter(pause_time = 100, burst = 10)
+    limiter.record_throttle(retry_after = 0)
+    clock.now += 1
+    assert limiter.headroom() == pytest.approx(5)
+
+def test_successes_restore_the_plan_rate(clock):
+    limiter = TokenBucketRateLimiter(pause_time = 100, burst = 100)
+    limiter.record_throttle(retry_after = 0)
+    for _ in range(10):
+        limiter.record_success()
+    clock.now += 1
+    assert limiter.headroom() == pytest.approx(10)
+
+def test_rate_never_drops_below_its_minimum(clock):
+    limiter = TokenBucketRateLimiter(pause_time = 100, burst = 100)
+    for _ in range(20):
+        limiter.record_throttle(retry_after = 0)
+    clock.now += 1
+    assert limiter.headroom() == pytest.approx(1) # a tenth of the plan rate
+
+def test_state_file_shares_the_bucket_between_limiters(clock, tmp_path):
+    state_file = str(tmp_path / 'rate_limiter.sqlite')
+    first = TokenBucketRateLimiter(pause_time = 100, burst = 2, state_file = state_file)
+    second = TokenBucketRateLimiter(pause_time = 100, burst = 2, state_file = state_file)
+    assert first.reserve() == 0.0
+    assert second.reserve() == 0.0
+    assert first.reserve() == pytest.approx(0.1)
+    second.record_throttle(retry_after = 30)
+    assert first.reserve() == pytest.approx(30)
+
+def test_retry_after_header():
+    assert retry_after_seconds({'Retry-After': '12'}) == 12.0
+    assert retry_after_seconds({'Retry-After': '-3'}) == 0.0
+    assert retry_after_seconds({'Retry-After': 'soon'}) is None
+    assert retry_after_seconds({}) is None
@@ -0,0 +1,81 @@
+from coingecko_api.api import CoinGeckoAPI
+from coingecko_api.rate_limiter import TokenBucketRateLimiter
+from coingecko_api.response_cache import ResponseCache
+from utils.testing import FakeResponse, FakeSession
+
+# clock (conftest.py) stands in for time.time()
+COINS_LIST_URL = 'https://api.coingecko.com/api/v3/coins/list'
+COINS = [{'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin'}]
+
+def cached_api(cache, responses):
+    api = CoinGeckoAPI(None, rate_limiter = TokenBucketRateLimiter(pause_time = 1, burst = 100), cache = cache)
+    api.session = FakeSession(responses)
+    return api
+
+def test_fresh_entries_are_served_without_a_request(clock):
+    cache = ResponseCache()
+    api = cached_api(cache, [FakeResponse(200, COINS, {'ETag': '"v1"'})])
+    assert api.get_coins_list() == COINS
+    assert api.get_coins_list() == COINS
+    assert len(api.session.requests) == 1
+    assert (cache.misses, cache.hits) == (1, 1)
+
+def test_expired_entry_is_revalidated_with_its_etag(clock):
+    cache = ResponseCache()
+    api = cached_api(cache, [
+        FakeResponse(200, COINS, {'ETag': '"v1"', 'Last-Modified': 'Thu, 01 Jan 2026 00:00:00 GMT'}),
+        FakeResponse(304),
+        FakeResponse(200, COINS + [{'id': 'ethereum'}], {'ETag': '"v2"'})
+    ])
+    api.get_coins_list()
+
+    clock.now += cache.ttl(COINS_LIST_URL) + 1
+    assert api.get_coins_list() == COINS
+    assert api.session.requests[1][1] == {'If-None-Match': '"v1"', 'If-Modified-Since': 'Thu, 01 Jan 2026 00:00:00 GMT'}
+    assert cache.revalidations == 1
+
+    # The 304 extended the entry, it is fresh for another TTL
+    clock.now += cache.ttl(COINS_LIST_URL) - 1
+    api.get_coins_list()
+    assert len(api.session.requests) == 2
+
+    clock.now += 2
+    assert len(api.get_coins_list()) == 2
+    assert api.session.requests[2][1] == {'If-None-Match': '"v1"', 'If-Modified-Since': 'Thu, 01 Jan 2026 00:00:00 GMT'}
+    assert cache.get(COINS_LIST_URL).etag == '"v2"'
+
+def test_reads_are_copies(clock):
+    cache = ResponseCache()
+    api = cached_api(cache, [FakeResponse(200, COINS)])
+    coins = api.get_coins_list()
+    coins[0]['name'] = 'changed'
+    coins.append({'id': 'ethereum'})
+    assert api.get_coins_list() == COINS
+    assert cache.get(COINS_LIST_URL).content is not cache.get(COINS_LIST_URL).content
+
+def test_price_endpoints_are_not_cached(clock):
+    cache = ResponseCache()
+    api = cached_api(cache, [FakeResponse(200, [{'id': 'bitcoin'}]), FakeResponse(200, [{'id': 'bitcoin'}])])
+    api.get_coins_with_market_data()
+    api.get_coins_with_market_data()
+    assert len(api.session.requests) == 2
+    assert cache.ttl('https://api.coingecko.com/api/v3/simple/price?ids=bitcoin') == 0
+
+def test_cache_file_is_shared_and_ignores_the_api_key(clock, tmp_path):
+    cache_file = str(tmp_path / 'responses.sqlite')
+    ResponseCache(cache_file = cache_file).put(COINS_LIST_URL + '?x_cg_demo_api_key=first', COINS, {'ETag': '"v1"'})
+
+    entry = ResponseCache(cache_file = cache_file).get(COINS_LIST_URL + '?x_cg_pro_api_key=second')
+    assert entry.content == COINS
+    assert entry.etag == '"v1"'
+    assert entry.is_fresh()
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = ResponseCache(max_entries = 2)
+    for coin_id in ('bitcoin', 'ethereum'):
+        cache.put(f'https://api.coingecko.com/api/v3/coins/{coin_id}', {'id': coin_id}, {})
+    cache.get('https://api.coingecko.com/api/v3/coins/bitcoin')
+    cache.put('https://api.coingecko.com/api/v3/coins/solana', {'id': 'solana'}, {})
+
+    assert cache.get('https://api.coingecko.com/api/v3/coins/ethereum') is None
+    assert cache.get('https://api.coingecko.com/api/v3/coins/bitcoin').content == {'id': 'bitcoin'}
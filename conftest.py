@@ -0,0 +1,30 @@
+# pytest runs the offline tests (test_*.py next to the modules they cover)
+# coingecko_api/test_api.py calls the live API at import, run it as a script instead:
+#   python -m coingecko_api.test_api
+import time
+import pytest
+
+collect_ignore = ['coingecko_api/test_api.py']
+
+class Clock:
+    """Stands in for time.time() so TTLs and token buckets only move when a test advances it"""
+    def __init__(self, now = 1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'time', clock)
+    return clock
+
+@pytest.fixture(scope = 'session')
+def postgres_server(tmp_path_factory):
+    """Embedded PostgreSQL (pgserver) for the tests of the SQL functions, skipped without pgserver"""
+    pgserver = pytest.importorskip('pgserver')
+    pytest.importorskip('psycopg')
+    server = pgserver.get_server(str(tmp_path_factory.mktemp('pgdata')), cleanup_mode = 'stop')
+    yield server
+    server.cleanup()
@@ -1,3 +1,5 @@
+CREATE SCHEMA IF NOT EXISTS coingecko_archive;
+
 CREATE TABLE coins (
     id VARCHAR(255) PRIMARY KEY,
     symbol VARCHAR(50) NOT NULL,
@@ -10,6 +12,7 @@ CREATE TABLE coins (
     total_supply NUMERIC(32,0),
     max_supply NUMERIC(32,0),
     circulating_supply NUMERIC(32,0),
+    platforms JSONB,
     update_hourly BOOLEAN NOT NULL DEFAULT FALSE,
     track_prices BOOLEAN NOT NULL DEFAULT FALSE,
     usd_stable_coin BOOLEAN NOT NULL DEFAULT FALSE,
@@ -19,6 +22,9 @@ CREATE TABLE coins (
     added_on DATE NOT NULL DEFAULT (CURRENT_DATE AT TIME ZONE 'UTC')
 );
 
+-- Continuous price tables are partitioned by month on created_at
+-- Monthly partitions are created by create_price_partitions() (custom_db_functions.sql),
+-- the default partitions only catch rows if partition maintenance falls behind.
 CREATE TABLE continuous_btc_prices (
     coin_id VARCHAR(255) NOT NULL,
     api_last_updated TIMESTAMP NOT NULL,
@@ -28,7 +34,11 @@ CREATE TABLE continuous_btc_prices (
     high_24h DOUBLE PRECISION,
     low_24h DOUBLE PRECISION,
     price_change_percentage_24h REAL
-);
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE continuous_btc_prices_default PARTITION OF continuous_btc_prices DEFAULT;
+CREATE INDEX continuous_btc_prices_coin_id_created_at_idx ON continuous_btc_prices (coin_id, created_at DESC);
+CREATE INDEX continuous_btc_prices_created_at_brin_idx ON continuous_btc_prices USING BRIN (created_at);
 
 CREATE TABLE continuous_usd_prices (
     coin_id VARCHAR(255) NOT NULL,
@@ -39,7 +49,11 @@ CREATE TABLE continuous_usd_prices (
     high_24h DOUBLE PRECISION,
     low_24h DOUBLE PRECISION,
     price_change_percentage_24h REAL
-);
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE continuous_usd_prices_default PARTITION OF continuous_usd_prices DEFAULT;
+CREATE INDEX continuous_usd_prices_coin_id_created_at_idx ON continuous_usd_prices (coin_id, created_at DESC);
+CREATE INDEX continuous_usd_prices_created_at_brin_idx ON continuous_usd_prices USING BRIN (created_at);
 
 CREATE TABLE hourly_usd_prices (
     coin_id VARCHAR(255) NOT NULL,
@@ -51,7 +65,8 @@ CREATE TABLE hourly_usd_prices (
     vwap DOUBLE PRECISION NOT NULL,
     twap DOUBLE PRECISION NOT NULL,
     volume BIGINT NOT NULL,
-    price_snapshots SMALLINT NOT NULL
+    price_snapshots SMALLINT NOT NULL,
+    PRIMARY KEY (coin_id, hour)
 );
 
 CREATE TABLE hourly_btc_prices (
@@ -63,7 +78,8 @@ CREATE TABLE hourly_btc_prices (
     high DOUBLE PRECISION NOT NULL,
     low DOUBLE PRECISION NOT NULL,
     close DOUBLE PRECISION NOT NULL,
-    price_snapshots SMALLINT NOT NULL
+    price_snapshots SMALLINT NOT NULL,
+    PRIMARY KEY (coin_id, hour)
 );
 
 CREATE TABLE daily_usd_prices (
@@ -80,4 +96,24 @@ CREATE TABLE daily_usd_prices (
     PRIMARY KEY (coin_id, day)
 );
 
+-- Last consolidated bucket boundary per hourly/daily table, see consolidate_prices()
+CREATE TABLE consolidation_watermarks (
+    target_table VARCHAR(255) PRIMARY KEY,
+    consolidated_until TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
 
+-- Most recent continuous price per coin and currency ('usd' / 'btc')
+-- Kept current by the update_latest_prices() triggers on the continuous price tables
+CREATE TABLE latest_prices (
+    coin_id VARCHAR(255) NOT NULL,
+    currency VARCHAR(10) NOT NULL,
+    api_last_updated TIMESTAMP NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    price DOUBLE PRECISION NOT NULL,
+    vol_24h BIGINT,
+    high_24h DOUBLE PRECISION,
+    low_24h DOUBLE PRECISION,
+    price_change_percentage_24h REAL,
+    PRIMARY KEY (coin_id, currency)
+);
@@ -8,7 +8,8 @@ RETURNS TABLE (
 ) AS $$
 BEGIN
 RETURN QUERY
-     SELECT coins.id, coins.update_hourly, coins.updated_at, coins.market_cap_rank
+     -- updated_at is a DATE in coingecko_schema.sql, cast to the declared result type
+     SELECT coins.id, coins.update_hourly, coins.updated_at::TIMESTAMP, coins.market_cap_rank
      FROM coins
      WHERE (coins.update_hourly = TRUE AND coins.updated_at < CURRENT_TIMESTAMP AT TIME ZONE 'UTC' - INTERVAL '1 hour')
                OR coins.id IN (
@@ -37,21 +38,13 @@ RETURN QUERY
           recent_prices.coin_id, 
           recent_prices.vol_24h, 
           recent_prices.created_at
-     FROM (
-          SELECT 
-               DISTINCT ON (cup.coin_id) 
-               cup.coin_id, 
-               cup.vol_24h, 
-               cup.created_at
-          FROM 
-               continuous_usd_prices AS cup
-          JOIN
-               coins c ON cup.coin_id = c.id
-               AND c.track_prices = TRUE
-          ORDER BY 
-               cup.coin_id, 
-               cup.created_at DESC
-     ) AS recent_prices
+     FROM 
+          latest_prices AS recent_prices
+     JOIN
+          coins c ON recent_prices.coin_id = c.id
+          AND c.track_prices = TRUE
+     WHERE 
+          recent_prices.currency = 'usd'
      ORDER BY 
         ROW_NUMBER() OVER (ORDER BY recent_prices.vol_24h ASC) + (EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP AT TIME ZONE 'UTC' - recent_prices.created_at)) / 60) DESC
     LIMIT p_limit;
@@ -71,27 +64,57 @@ RETURN QUERY
           recent_prices.coin_id, 
           recent_prices.vol_24h, 
           recent_prices.created_at
-     FROM (
-          SELECT 
-               DISTINCT ON (cup.coin_id) 
-               cup.coin_id, 
-               cup.vol_24h, 
-               cup.created_at
-          FROM 
-               continuous_btc_prices AS cup
-          JOIN
-               coins c ON cup.coin_id = c.id
-               AND c.track_prices = TRUE
-          ORDER BY 
-               cup.coin_id, 
-               cup.created_at DESC
-     ) AS recent_prices
+     FROM 
+          latest_prices AS recent_prices
+     JOIN
+          coins c ON recent_prices.coin_id = c.id
+          AND c.track_prices = TRUE
+     WHERE 
+          recent_prices.currency = 'btc'
      ORDER BY 
         ROW_NUMBER() OVER (ORDER BY recent_prices.vol_24h ASC) + (EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP AT TIME ZONE 'UTC' - recent_prices.created_at)) / 60) DESC
     LIMIT p_limit;
 END;
 $$ LANGUAGE plpgsql;
 
+-- Freshness inputs of every tracked coin for the collector's scheduler (utils/freshness_scheduler.py)
+-- Volume and volatility come from the latest USD price, refreshed times are NULL for coins without prices yet
+CREATE OR REPLACE FUNCTION price_freshness()
+RETURNS TABLE (
+     coin_id VARCHAR(255),
+     vol_24h BIGINT,
+     price DOUBLE PRECISION,
+     high_24h DOUBLE PRECISION,
+     low_24h DOUBLE PRECISION,
+     price_change_percentage_24h REAL,
+     usd_created_at TIMESTAMP,
+     btc_created_at TIMESTAMP
+) AS $$
+BEGIN
+RETURN QUERY
+     SELECT
+          c.id,
+          usd.vol_24h,
+          usd.price,
+          usd.high_24h,
+          usd.low_24h,
+          usd.price_change_percentage_24h,
+          usd.created_at,
+          btc.created_at
+     FROM
+          coins c
+     LEFT JOIN
+          latest_prices usd ON usd.coin_id = c.id AND usd.currency = 'usd'
+     LEFT JOIN
+          latest_prices btc ON btc.coin_id = c.id AND btc.currency = 'btc'
+     WHERE
+          c.track_prices = TRUE
+          AND c.archived = FALSE
+     ORDER BY
+          c.id;
+END;
+$$ LANGUAGE plpgsql;
+
 -- Formats number into short easily readable format
 CREATE OR REPLACE FUNCTION format_number(num numeric)
 RETURNS text AS $$
@@ -138,4 +161,411 @@ BEGIN
   END IF;
   RETURN formatted_number;
 END;
-$$ LANGUAGE plpgsql;
\ No newline at end of file
+$$ LANGUAGE plpgsql;
+
+-- OHLC, TWAP and difference-method VWAP/volume bars for one window of a continuous price table
+-- Same logic as hourly_prices.sql / daily_prices.sql, but only reads rows in [p_from, p_to)
+-- plus the last row before p_from for each coin (the LAG boundary). Volume of the interval that
+-- crosses p_from is clipped to the window.
+CREATE OR REPLACE FUNCTION price_bars(p_source TEXT, p_bucket TEXT, p_from TIMESTAMP, p_to TIMESTAMP)
+RETURNS TABLE (
+     coin_id VARCHAR(255),
+     bucket_start TIMESTAMP,
+     open DOUBLE PRECISION,
+     high DOUBLE PRECISION,
+     low DOUBLE PRECISION,
+     close DOUBLE PRECISION,
+     vwap DOUBLE PRECISION,
+     twap DOUBLE PRECISION,
+     volume BIGINT,
+     price_snapshots INTEGER
+) AS $$
+BEGIN
+RETURN QUERY EXECUTE format($query$
+     WITH NewRows AS (
+          SELECT cp.coin_id, cp.created_at, cp.price, cp.vol_24h
+          FROM %1$I cp
+          WHERE cp.created_at >= $1
+               AND cp.created_at < $2
+     ),
+     CarryOver AS (
+          -- Last row before the window for each coin, only used as the start of its first interval
+          -- Not bounded in time, like the LAG of hourly_prices.sql: a coin paused for days still gets
+          -- the volume of its long interval (one backward scan of the (coin_id, created_at) indexes)
+          SELECT prev.coin_id, prev.created_at, prev.price, prev.vol_24h
+          FROM (SELECT DISTINCT nr.coin_id FROM NewRows nr) coins_in_window
+          CROSS JOIN LATERAL (
+               SELECT cp.coin_id, cp.created_at, cp.price, cp.vol_24h
+               FROM %1$I cp
+               WHERE cp.coin_id = coins_in_window.coin_id
+                    AND cp.created_at < $1
+               ORDER BY cp.created_at DESC
+               LIMIT 1
+          ) prev
+     ),
+     BucketOHLCAndCount AS (
+          SELECT
+               nr.coin_id,
+               date_trunc(%2$L, nr.created_at) AS bucket_start,
+               AVG(nr.price) AS simple_avg_price,
+               MIN(nr.price) AS low_price,
+               MAX(nr.price) AS high_price,
+               (array_agg(nr.price ORDER BY nr.created_at ASC))[1] AS open_price,
+               (array_agg(nr.price ORDER BY nr.created_at DESC))[1] AS close_price,
+               COUNT(*) AS price_snapshots
+          FROM NewRows nr
+          GROUP BY nr.coin_id, date_trunc(%2$L, nr.created_at)
+     ),
+     LaggedData AS (
+          SELECT
+               ar.coin_id,
+               ar.created_at AS ts_end,
+               ar.vol_24h AS vol_24h_end,
+               ar.price AS price_end,
+               LAG(ar.created_at, 1) OVER w AS ts_start,
+               LAG(ar.vol_24h, 1) OVER w AS vol_24h_start,
+               LAG(ar.price, 1) OVER w AS price_start
+          FROM (SELECT * FROM CarryOver UNION ALL SELECT * FROM NewRows) ar
+          WINDOW w AS (PARTITION BY ar.coin_id ORDER BY ar.created_at)
+     ),
+     EstimatedIntervalVolume AS (
+          SELECT
+               ld.coin_id,
+               ld.ts_start,
+               ld.ts_end,
+               EXTRACT(EPOCH FROM (ld.ts_end - ld.ts_start)) AS interval_duration_seconds,
+               (ld.price_start + ld.price_end) / 2.0 AS avg_interval_price,
+               GREATEST(0.0,
+                    (ld.vol_24h_end - COALESCE(ld.vol_24h_start, 0))
+                    + (COALESCE(ld.vol_24h_start, 0) / 24.0) * (EXTRACT(EPOCH FROM (ld.ts_end - ld.ts_start)) / 3600.0)
+               ) AS estimated_interval_volume
+          FROM LaggedData ld
+          WHERE ld.ts_start IS NOT NULL
+               AND ld.ts_end > ld.ts_start
+               AND ld.price_start IS NOT NULL
+               AND ld.price_end IS NOT NULL
+     ),
+     OverlapCalculation AS (
+          SELECT
+               eiv.coin_id,
+               b.bucket_start,
+               eiv.interval_duration_seconds,
+               eiv.avg_interval_price,
+               eiv.estimated_interval_volume,
+               GREATEST(eiv.ts_start, b.bucket_start, $1) AS overlap_start,
+               LEAST(eiv.ts_end, b.bucket_start + ('1 ' || %2$L)::interval) AS overlap_end
+          FROM EstimatedIntervalVolume eiv
+          CROSS JOIN LATERAL generate_series(
+               date_trunc(%2$L, GREATEST(eiv.ts_start, $1)),
+               date_trunc(%2$L, eiv.ts_end),
+               ('1 ' || %2$L)::interval
+          ) AS b(bucket_start)
+     ),
+     BucketVolumeAndVWAPComponents AS (
+          SELECT
+               oc.coin_id,
+               oc.bucket_start,
+               SUM(oc.estimated_interval_volume * EXTRACT(EPOCH FROM (oc.overlap_end - oc.overlap_start)) / oc.interval_duration_seconds) AS estimated_volume,
+               SUM(oc.estimated_interval_volume * oc.avg_interval_price * EXTRACT(EPOCH FROM (oc.overlap_end - oc.overlap_start)) / oc.interval_duration_seconds) AS estimated_volume_price_product
+          FROM OverlapCalculation oc
+          WHERE oc.overlap_start < oc.overlap_end
+               AND oc.interval_duration_seconds > 0
+          GROUP BY oc.coin_id, oc.bucket_start
+     )
+     SELECT
+          ohlc.coin_id::VARCHAR(255),
+          ohlc.bucket_start,
+          ohlc.open_price::DOUBLE PRECISION,
+          ohlc.high_price::DOUBLE PRECISION,
+          ohlc.low_price::DOUBLE PRECISION,
+          ohlc.close_price::DOUBLE PRECISION,
+          (CASE
+               WHEN COALESCE(vol.estimated_volume, 0) = 0 THEN ohlc.simple_avg_price
+               ELSE vol.estimated_volume_price_product / NULLIF(vol.estimated_volume, 0)
+          END)::DOUBLE PRECISION,
+          ohlc.simple_avg_price::DOUBLE PRECISION,
+          COALESCE(CAST(vol.estimated_volume AS BIGINT), 0),
+          ohlc.price_snapshots::INTEGER
+     FROM BucketOHLCAndCount ohlc
+     LEFT JOIN BucketVolumeAndVWAPComponents vol
+          ON ohlc.coin_id = vol.coin_id AND ohlc.bucket_start = vol.bucket_start
+$query$, p_source, p_bucket)
+USING p_from, p_to;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Incrementally consolidates continuous prices into hourly_usd_prices, hourly_btc_prices or daily_usd_prices
+-- Processes closed buckets from the target's watermark up to p_max_window at a time and upserts them,
+-- so re-running a window is idempotent. Call repeatedly until caught_up is TRUE.
+-- The last bucket before the watermark is recomputed as well: the interval between its last snapshot
+-- and the first snapshot after the watermark only becomes known now, and belongs partly to it.
+CREATE OR REPLACE FUNCTION consolidate_prices(p_target TEXT, p_max_window INTERVAL DEFAULT '7 days')
+RETURNS TABLE (
+     bars_upserted INTEGER,
+     window_end TIMESTAMP,
+     caught_up BOOLEAN
+) AS $$
+DECLARE
+     v_source TEXT;
+     v_bucket TEXT;
+     v_from TIMESTAMP;
+     v_rows_from TIMESTAMP;
+     v_to TIMESTAMP;
+     v_end TIMESTAMP;
+     v_rows INTEGER;
+BEGIN
+     IF p_target = 'hourly_usd_prices' THEN
+          v_source := 'continuous_usd_prices';
+          v_bucket := 'hour';
+     ELSIF p_target = 'hourly_btc_prices' THEN
+          v_source := 'continuous_btc_prices';
+          v_bucket := 'hour';
+     ELSIF p_target = 'daily_usd_prices' THEN
+          v_source := 'continuous_usd_prices';
+          v_bucket := 'day';
+     ELSE
+          RAISE EXCEPTION 'Unknown consolidation target: %', p_target;
+     END IF;
+
+     -- Only buckets that are already closed are consolidated
+     v_end := date_trunc(v_bucket, CURRENT_TIMESTAMP AT TIME ZONE 'UTC');
+
+     -- Lock the watermark row so overlapping runs don't process the same window
+     SELECT w.consolidated_until INTO v_from
+     FROM consolidation_watermarks w
+     WHERE w.target_table = p_target
+     FOR UPDATE;
+
+     IF v_from IS NULL THEN
+          EXECUTE format('SELECT date_trunc(%L, MIN(created_at)) FROM %I', v_bucket, v_source) INTO v_from;
+          IF v_from IS NULL THEN
+               RETURN QUERY SELECT 0, NULL::TIMESTAMP, TRUE;
+               RETURN;
+          END IF;
+     END IF;
+
+     v_to := LEAST(v_end, v_from + p_max_window);
+     IF v_to <= v_from THEN
+          RETURN QUERY SELECT 0, v_from, TRUE;
+          RETURN;
+     END IF;
+     v_rows_from := v_from - ('1 ' || v_bucket)::interval;
+
+     IF p_target = 'hourly_usd_prices' THEN
+          INSERT INTO hourly_usd_prices (coin_id, hour, open, high, low, close, vwap, twap, volume, price_snapshots)
+          SELECT b.coin_id, b.bucket_start, b.open, b.high, b.low, b.close, b.vwap, b.twap, b.volume, b.price_snapshots
+          FROM price_bars(v_source, v_bucket, v_rows_from, v_to) b
+          ON CONFLICT ON CONSTRAINT hourly_usd_prices_pkey DO UPDATE SET
+               open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low, close = EXCLUDED.close,
+               vwap = EXCLUDED.vwap, twap = EXCLUDED.twap, volume = EXCLUDED.volume,
+               price_snapshots = EXCLUDED.price_snapshots;
+     ELSIF p_target = 'hourly_btc_prices' THEN
+          INSERT INTO hourly_btc_prices (coin_id, hour, vwap, twap, open, high, low, close, price_snapshots)
+          SELECT b.coin_id, b.bucket_start, b.vwap, b.twap, b.open, b.high, b.low, b.close, b.price_snapshots
+          FROM price_bars(v_source, v_bucket, v_rows_from, v_to) b
+          ON CONFLICT ON CONSTRAINT hourly_btc_prices_pkey DO UPDATE SET
+               vwap = EXCLUDED.vwap, twap = EXCLUDED.twap, open = EXCLUDED.open, high = EXCLUDED.high,
+               low = EXCLUDED.low, close = EXCLUDED.close, price_snapshots = EXCLUDED.price_snapshots;
+     ELSE
+          INSERT INTO daily_usd_prices (coin_id, day, open, high, low, close, vwap, twap, volume, price_snapshots)
+          SELECT b.coin_id, b.bucket_start::DATE, b.open, b.high, b.low, b.close, b.vwap, b.twap, b.volume, b.price_snapshots
+          FROM price_bars(v_source, v_bucket, v_rows_from, v_to) b
+          ON CONFLICT ON CONSTRAINT daily_usd_prices_pkey DO UPDATE SET
+               open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low, close = EXCLUDED.close,
+               vwap = EXCLUDED.vwap, twap = EXCLUDED.twap, volume = EXCLUDED.volume,
+               price_snapshots = EXCLUDED.price_snapshots;
+     END IF;
+     GET DIAGNOSTICS v_rows = ROW_COUNT;
+
+     INSERT INTO consolidation_watermarks AS w (target_table, consolidated_until, updated_at)
+     VALUES (p_target, v_to, CURRENT_TIMESTAMP AT TIME ZONE 'UTC')
+     ON CONFLICT (target_table) DO UPDATE SET
+          consolidated_until = EXCLUDED.consolidated_until,
+          updated_at = EXCLUDED.updated_at;
+
+     RETURN QUERY SELECT v_rows, v_to, v_to >= v_end;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Creates the monthly partitions of continuous_usd_prices and continuous_btc_prices
+-- from the month of p_from up to p_months_ahead months from now, returns the number created
+CREATE OR REPLACE FUNCTION create_price_partitions(p_from DATE DEFAULT CURRENT_DATE, p_months_ahead INTEGER DEFAULT 3)
+RETURNS INTEGER AS $$
+DECLARE
+     v_table TEXT;
+     v_month DATE;
+     v_last_month DATE;
+     v_partition TEXT;
+     v_created INTEGER := 0;
+BEGIN
+     v_last_month := date_trunc('month', CURRENT_DATE + make_interval(months => p_months_ahead))::DATE;
+
+     FOREACH v_table IN ARRAY ARRAY['continuous_usd_prices', 'continuous_btc_prices'] LOOP
+          v_month := date_trunc('month', p_from)::DATE;
+          WHILE v_month <= v_last_month LOOP
+               v_partition := format('%s_y%sm%s', v_table, to_char(v_month, 'YYYY'), to_char(v_month, 'MM'));
+               IF to_regclass(v_partition) IS NULL THEN
+                    EXECUTE format(
+                         'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                         v_partition, v_table, v_month, (v_month + interval '1 month')::DATE
+                    );
+                    v_created := v_created + 1;
+               END IF;
+               v_month := (v_month + interval '1 month')::DATE;
+          END LOOP;
+     END LOOP;
+
+     RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Retention: drops (or archives into coingecko_archive) monthly continuous price partitions that are
+-- older than p_keep_months and fully consolidated into the hourly/daily tables (see consolidate_prices)
+-- Late rows move the watermarks back (rewind_consolidation_watermarks), a partition receiving them is kept
+CREATE OR REPLACE FUNCTION drop_consolidated_price_partitions(p_keep_months INTEGER DEFAULT 3, p_archive BOOLEAN DEFAULT FALSE)
+RETURNS TABLE (
+     partition_name TEXT,
+     action TEXT
+) AS $$
+DECLARE
+     v_partition RECORD;
+     v_cutoff TIMESTAMP;
+     v_upper TIMESTAMP;
+     v_usd_consolidated TIMESTAMP;
+     v_btc_consolidated TIMESTAMP;
+BEGIN
+     v_cutoff := date_trunc('month', CURRENT_TIMESTAMP AT TIME ZONE 'UTC') - make_interval(months => p_keep_months);
+
+     -- A partition is consolidated once every table built from it has a watermark past its end
+     SELECT MIN(w.consolidated_until) INTO v_usd_consolidated
+     FROM consolidation_watermarks w
+     WHERE w.target_table IN ('hourly_usd_prices', 'daily_usd_prices')
+     HAVING COUNT(*) = 2;
+
+     SELECT w.consolidated_until INTO v_btc_consolidated
+     FROM consolidation_watermarks w
+     WHERE w.target_table = 'hourly_btc_prices';
+
+     FOR v_partition IN
+          SELECT parent.relname::TEXT AS parent_name, child.relname::TEXT AS child_name
+          FROM pg_inherits inh
+          JOIN pg_class parent ON inh.inhparent = parent.oid
+          JOIN pg_class child ON inh.inhrelid = child.oid
+          JOIN pg_namespace ns ON parent.relnamespace = ns.oid
+          WHERE parent.relname IN ('continuous_usd_prices', 'continuous_btc_prices')
+               AND ns.nspname = current_schema()
+               AND child.relname ~ '_y\d{4}m\d{2}$'
+          ORDER BY child.relname
+     LOOP
+          -- Upper bound of the monthly partition, from its name (created by create_price_partitions)
+          v_upper := to_timestamp(substring(v_partition.child_name FROM '_y(\d{4}m\d{2})$'), 'YYYY"m"MM')::TIMESTAMP + interval '1 month';
+
+          CONTINUE WHEN v_upper > v_cutoff;
+          CONTINUE WHEN v_upper > COALESCE(
+               CASE WHEN v_partition.parent_name = 'continuous_usd_prices' THEN v_usd_consolidated ELSE v_btc_consolidated END,
+               '-infinity'::TIMESTAMP
+          );
+
+          IF p_archive THEN
+               EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', v_partition.parent_name, v_partition.child_name);
+               EXECUTE format('ALTER TABLE %I SET SCHEMA coingecko_archive', v_partition.child_name);
+               RETURN QUERY SELECT v_partition.child_name, 'archived'::TEXT;
+          ELSE
+               EXECUTE format('DROP TABLE %I', v_partition.child_name);
+               RETURN QUERY SELECT v_partition.child_name, 'dropped'::TEXT;
+          END IF;
+     END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Keeps latest_prices current, statement level so a bulk insert costs one upsert
+-- TG_ARGV[0] is the currency of the continuous price table ('usd' / 'btc')
+CREATE OR REPLACE FUNCTION update_latest_prices()
+RETURNS TRIGGER AS $$
+BEGIN
+     INSERT INTO latest_prices AS lp (coin_id, currency, api_last_updated, created_at, price, vol_24h, high_24h, low_24h, price_change_percentage_24h)
+     SELECT DISTINCT ON (nr.coin_id)
+          nr.coin_id, TG_ARGV[0], nr.api_last_updated, nr.created_at, nr.price, nr.vol_24h, nr.high_24h, nr.low_24h, nr.price_change_percentage_24h
+     FROM new_rows nr
+     ORDER BY nr.coin_id, nr.created_at DESC
+     ON CONFLICT (coin_id, currency) DO UPDATE SET
+          api_last_updated = EXCLUDED.api_last_updated,
+          created_at = EXCLUDED.created_at,
+          price = EXCLUDED.price,
+          vol_24h = EXCLUDED.vol_24h,
+          high_24h = EXCLUDED.high_24h,
+          low_24h = EXCLUDED.low_24h,
+          price_change_percentage_24h = EXCLUDED.price_change_percentage_24h
+     WHERE lp.created_at <= EXCLUDED.created_at;
+     RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER continuous_usd_prices_latest_prices
+AFTER INSERT ON continuous_usd_prices
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_latest_prices('usd');
+
+CREATE OR REPLACE TRIGGER continuous_btc_prices_latest_prices
+AFTER INSERT ON continuous_btc_prices
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_latest_prices('btc');
+
+-- Moves the consolidation watermarks back when rows arrive for buckets that are already consolidated
+-- (e.g. drained from the collector's write spool after a database outage), so the next consolidate_prices()
+-- call recomputes those buckets and drop_consolidated_price_partitions() keeps their partition until then.
+-- TG_ARGV holds the consolidation targets built from the continuous price table.
+CREATE OR REPLACE FUNCTION rewind_consolidation_watermarks()
+RETURNS TRIGGER AS $$
+DECLARE
+     v_oldest TIMESTAMP;
+BEGIN
+     SELECT MIN(nr.created_at) INTO v_oldest FROM new_rows nr;
+
+     UPDATE consolidation_watermarks w
+     SET consolidated_until = date_trunc(CASE WHEN w.target_table = 'daily_usd_prices' THEN 'day' ELSE 'hour' END, v_oldest),
+          updated_at = CURRENT_TIMESTAMP AT TIME ZONE 'UTC'
+     WHERE w.target_table = ANY(TG_ARGV)
+          AND w.consolidated_until > v_oldest;
+     RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER continuous_usd_prices_late_rows
+AFTER INSERT ON continuous_usd_prices
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION rewind_consolidation_watermarks('hourly_usd_prices', 'daily_usd_prices');
+
+CREATE OR REPLACE TRIGGER continuous_btc_prices_late_rows
+AFTER INSERT ON continuous_btc_prices
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION rewind_consolidation_watermarks('hourly_btc_prices');
+
+-- Rebuilds latest_prices from the continuous price tables (initial fill or repair)
+CREATE OR REPLACE FUNCTION refresh_latest_prices()
+RETURNS INTEGER AS $$
+DECLARE
+     v_rows INTEGER;
+BEGIN
+     INSERT INTO latest_prices AS lp (coin_id, currency, api_last_updated, created_at, price, vol_24h, high_24h, low_24h, price_change_percentage_24h)
+     SELECT DISTINCT ON (cp.coin_id, cp.currency)
+          cp.coin_id, cp.currency, cp.api_last_updated, cp.created_at, cp.price, cp.vol_24h, cp.high_24h, cp.low_24h, cp.price_change_percentage_24h
+     FROM (
+          SELECT 'usd' AS currency, cup.* FROM continuous_usd_prices cup
+          UNION ALL
+          SELECT 'btc' AS currency, cbp.* FROM continuous_btc_prices cbp
+     ) cp
+     ORDER BY cp.coin_id, cp.currency, cp.created_at DESC
+     ON CONFLICT (coin_id, currency) DO UPDATE SET
+          api_last_updated = EXCLUDED.api_last_updated,
+          created_at = EXCLUDED.created_at,
+          price = EXCLUDED.price,
+          vol_24h = EXCLUDED.vol_24h,
+          high_24h = EXCLUDED.high_24h,
+          low_24h = EXCLUDED.low_24h,
+          price_change_percentage_24h = EXCLUDED.price_change_percentage_24h
+     WHERE lp.created_at <= EXCLUDED.created_at;
+     GET DIAGNOSTICS v_rows = ROW_COUNT;
+     RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
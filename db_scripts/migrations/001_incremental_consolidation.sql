@@ -0,0 +1,27 @@
+-- Incremental hourly/daily consolidation for existing databases
+-- Adds the primary keys consolidate_prices() upserts on, and the watermark table.
+-- Run custom_db_functions.sql afterwards to create price_bars() and consolidate_prices().
+
+SET search_path TO coingecko;
+
+-- Remove duplicate hourly bars (left by re-running hourly_prices.sql) before adding the keys
+DELETE FROM hourly_usd_prices a
+USING hourly_usd_prices b
+WHERE a.ctid < b.ctid
+    AND a.coin_id = b.coin_id
+    AND a.hour = b.hour;
+
+DELETE FROM hourly_btc_prices a
+USING hourly_btc_prices b
+WHERE a.ctid < b.ctid
+    AND a.coin_id = b.coin_id
+    AND a.hour = b.hour;
+
+ALTER TABLE hourly_usd_prices ADD PRIMARY KEY (coin_id, hour);
+ALTER TABLE hourly_btc_prices ADD PRIMARY KEY (coin_id, hour);
+
+CREATE TABLE IF NOT EXISTS consolidation_watermarks (
+    target_table VARCHAR(255) PRIMARY KEY,
+    consolidated_until TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
@@ -0,0 +1,65 @@
+-- Monthly range partitions and indexes for continuous_usd_prices and continuous_btc_prices
+-- Run custom_db_functions.sql first (for create_price_partitions), and views.sql afterwards
+-- (recent_coin_prices depends on the old tables and is dropped here).
+-- Existing rows are copied into the new partitioned tables inside one transaction.
+
+SET search_path TO coingecko;
+
+BEGIN;
+
+CREATE SCHEMA IF NOT EXISTS coingecko_archive;
+
+DROP VIEW IF EXISTS recent_coin_prices;
+
+ALTER TABLE continuous_usd_prices RENAME TO continuous_usd_prices_unpartitioned;
+ALTER TABLE continuous_btc_prices RENAME TO continuous_btc_prices_unpartitioned;
+
+CREATE TABLE continuous_btc_prices (
+    coin_id VARCHAR(255) NOT NULL,
+    api_last_updated TIMESTAMP NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    price DOUBLE PRECISION NOT NULL,
+    vol_24h BIGINT,
+    high_24h DOUBLE PRECISION,
+    low_24h DOUBLE PRECISION,
+    price_change_percentage_24h REAL
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE continuous_btc_prices_default PARTITION OF continuous_btc_prices DEFAULT;
+CREATE INDEX continuous_btc_prices_coin_id_created_at_idx ON continuous_btc_prices (coin_id, created_at DESC);
+CREATE INDEX continuous_btc_prices_created_at_brin_idx ON continuous_btc_prices USING BRIN (created_at);
+
+CREATE TABLE continuous_usd_prices (
+    coin_id VARCHAR(255) NOT NULL,
+    api_last_updated TIMESTAMP NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    price DOUBLE PRECISION NOT NULL,
+    vol_24h BIGINT,
+    high_24h DOUBLE PRECISION,
+    low_24h DOUBLE PRECISION,
+    price_change_percentage_24h REAL
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE continuous_usd_prices_default PARTITION OF continuous_usd_prices DEFAULT;
+CREATE INDEX continuous_usd_prices_coin_id_created_at_idx ON continuous_usd_prices (coin_id, created_at DESC);
+CREATE INDEX continuous_usd_prices_created_at_brin_idx ON continuous_usd_prices USING BRIN (created_at);
+
+-- Partitions for every month with data, plus the next three months
+SELECT create_price_partitions(
+    LEAST(
+        (SELECT MIN(created_at) FROM continuous_usd_prices_unpartitioned),
+        (SELECT MIN(created_at) FROM continuous_btc_prices_unpartitioned),
+        CURRENT_DATE
+    )::DATE
+);
+
+INSERT INTO continuous_usd_prices SELECT * FROM continuous_usd_prices_unpartitioned;
+INSERT INTO continuous_btc_prices SELECT * FROM continuous_btc_prices_unpartitioned;
+
+DROP TABLE continuous_usd_prices_unpartitioned;
+DROP TABLE continuous_btc_prices_unpartitioned;
+
+COMMIT;
+
+ANALYZE continuous_usd_prices;
+ANALYZE continuous_btc_prices;
@@ -0,0 +1,19 @@
+-- latest_prices snapshot table (one row per coin and currency) for existing databases
+-- Afterwards run custom_db_functions.sql (installs the update_latest_prices triggers and the
+-- rewritten priority functions), then views.sql, then fill the table:
+--     SELECT refresh_latest_prices();
+
+SET search_path TO coingecko;
+
+CREATE TABLE IF NOT EXISTS latest_prices (
+    coin_id VARCHAR(255) NOT NULL,
+    currency VARCHAR(10) NOT NULL,
+    api_last_updated TIMESTAMP NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    price DOUBLE PRECISION NOT NULL,
+    vol_24h BIGINT,
+    high_24h DOUBLE PRECISION,
+    low_24h DOUBLE PRECISION,
+    price_change_percentage_24h REAL,
+    PRIMARY KEY (coin_id, currency)
+);
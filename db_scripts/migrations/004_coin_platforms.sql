@@ -0,0 +1,6 @@
+-- Contract addresses per platform for existing databases, kept current by add_new_coins.py
+-- (from /coins/list?include_platform=true, e.g. {"ethereum": "0x..."})
+
+SET search_path TO coingecko;
+
+ALTER TABLE coins ADD COLUMN IF NOT EXISTS platforms JSONB;
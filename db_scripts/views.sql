@@ -1,4 +1,5 @@
-CREATE VIEW coingecko.recent_coin_prices AS
+-- Reads one row per coin and currency from latest_prices (kept current by triggers)
+CREATE OR REPLACE VIEW coingecko.recent_coin_prices AS
 WITH latest_btc AS (
     SELECT
         coin_id,
@@ -8,9 +9,9 @@ WITH latest_btc AS (
         vol_24h AS btc_vol_24h,
         high_24h AS btc_high_24h,
         low_24h AS btc_low_24h,
-        price_change_percentage_24h AS btc_price_change_percentage_24h,
-        ROW_NUMBER() OVER (PARTITION BY coin_id ORDER BY created_at DESC) AS btc_row_num
-    FROM coingecko.continuous_btc_prices
+        price_change_percentage_24h AS btc_price_change_percentage_24h
+    FROM coingecko.latest_prices
+    WHERE currency = 'btc'
 ),
 latest_usd AS (
     SELECT
@@ -21,9 +22,9 @@ latest_usd AS (
         vol_24h AS usd_vol_24h,
         high_24h AS usd_high_24h,
         low_24h AS usd_low_24h,
-        price_change_percentage_24h AS usd_price_change_percentage_24h,
-        ROW_NUMBER() OVER (PARTITION BY coin_id ORDER BY created_at DESC) AS usd_row_num
-    FROM coingecko.continuous_usd_prices
+        price_change_percentage_24h AS usd_price_change_percentage_24h
+    FROM coingecko.latest_prices
+    WHERE currency = 'usd'
 )
 SELECT
     c.id AS coin_id,
@@ -61,8 +62,8 @@ SELECT
     EXTRACT(EPOCH FROM (NOW() AT TIME ZONE 'UTC' - lusd.created_at AT TIME ZONE 'UTC')) AS usd_seconds_since_last_check
 FROM
     coingecko.coins c
-    INNER JOIN latest_btc lbtc ON c.id = lbtc.coin_id AND lbtc.btc_row_num = 1
-    INNER JOIN latest_usd lusd ON c.id = lusd.coin_id AND lusd.usd_row_num = 1
+    INNER JOIN latest_btc lbtc ON c.id = lbtc.coin_id
+    INNER JOIN latest_usd lusd ON c.id = lusd.coin_id
 WHERE c.archived = FALSE
     AND c.track_prices = TRUE
 ;
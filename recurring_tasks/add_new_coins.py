@@ -1,65 +1,96 @@
 import os
-from supabase import create_client, Client
-from supabase.client import ClientOptions
-from itertools import islice
+import argparse
 from coingecko_api.api import CoinGeckoAPI
+from coingecko_api.key_pool import parse_api_keys
 from utils.script_logger import ScriptLogger
+from utils.config import load_config, resolve_path
+from utils.batch_writer import BatchWriter
+from storage import open_storage
+from utils.coin_universe import CoinUniverse, fingerprint
+from utils.metrics import metrics
 from dotenv import load_dotenv
 
-# Initialize the script logger
-log = ScriptLogger("add_new_coins")
+parser = argparse.ArgumentParser(description="Sync the coins table with the CoinGecko coin list")
+parser.add_argument('--full', action='store_true', help="diff against the coins table instead of the local state (repair)")
+args = parser.parse_args()
+
+# Initialize the script logger, API and database metrics are exported at log.end()
+log = ScriptLogger("add_new_coins", metrics = metrics)
 
 # Load environment variables from .pip env file
 load_dotenv()
 
 # Initialize and Test the CoinGeckoAPI class
-cg = CoinGeckoAPI(os.getenv('COINGECKO_API_KEY'), os.getenv('COINGECKO_API_PLAN', 'public'))
-if not cg.api_is_up:
+# Rate limit state is shared with the other recurring tasks through config's rate_limit_state_file
+# No response cache: a cached coin list would hide listings from the fingerprint check below for its TTL
+config = load_config()
+cg = CoinGeckoAPI(os.getenv('COINGECKO_API_KEY'), os.getenv('COINGECKO_API_PLAN', 'public'),
+    rate_limit_state_file = resolve_path(config.get('rate_limit_state_file')), metrics = metrics,
+    api_base_url = os.getenv('COINGECKO_API_URL'), api_keys = parse_api_keys(os.getenv('COINGECKO_API_KEYS')))
+if not cg.api_is_up():
     log.error("CoinGecko API not responding")
     raise Exception("CoinGecko API is not responding")
 
-# Initialize Supabase client
-url: str = os.getenv("SUPABASE_URL")
-key: str = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(url, key,
-  options=ClientOptions(
-    postgrest_client_timeout=30,
-    schema="coingecko",
-  ))
+# Storage backend from config's storage_backend (Supabase by default), see storage/
+storage = open_storage(config)
+
+# Last known universe, see utils/coin_universe.py
+universe = CoinUniverse(resolve_path(config.get('coin_universe_file', 'logs/coin_universe.sqlite')))
 
 # Get all supported coins on CoinGecko
-coins_list = cg.get_coins_list()
+with log.span('fetch'):
+    coins_list = cg.get_coins_list(include_platform = True)
 max_market_cap_rank = len(coins_list)
 total_coins = len(coins_list)
+coins_fingerprint = fingerprint(coins_list)
+
+# Nothing listed, delisted or renamed since the last sync, skip the database
+if not args.full and coins_fingerprint == universe.fingerprint():
+    print(f"Total coins in CoinGecko: {total_coins}, unchanged")
+    log.end(f"Total coins in CoinGecko: {total_coins}, unchanged")
+    raise SystemExit
 
-# Batch insert the data into the database
-def batch_insert(data, batch_size=500):
-    it = iter(data)
-    for i in range(0, len(data), batch_size):
-        yield ({**record, 'market_cap_rank': max_market_cap_rank} for record in islice(it, batch_size))
+# Seed the local state from the coins table on the first run (or --full)
+if args.full or universe.is_empty():
+    with log.span('seed'):
+        known_coins = []
+        page_size = 1000
+        while True:
+            with metrics.time('db_read_seconds', table = 'coins'):
+                rows = storage.select("coins", "id, symbol, name, platforms, archived", order = "id", offset = len(known_coins), limit = page_size)
+            known_coins.extend(rows)
+            if len(rows) < page_size:
+                break
+        universe.seed(known_coins)
 
-coins_added = []
-for batch in batch_insert(coins_list):
-    batch_list = list(batch)
-    try:  
-        response = supabase.table("coins") \
-            .upsert(batch_list, ignore_duplicates=True) \
-            .execute()
-        if response.data:
-            coins_added.extend(response.data)
-            # print(f"Successfully added {len(response.data)} of {len(batch_list)} coins.")
+with log.span('diff'):
+    diff = universe.diff(coins_list)
+
+# New coins are inserted (existing rows kept), all other changes are upserts of the changed columns
+writer = BatchWriter(storage, log, config.get('db_chunk_size', 500), config.get('db_chunk_sizes'), metrics = metrics)
+writer.add_many("coins", [{**row, 'market_cap_rank': max_market_cap_rank} for row in diff.added], upsert=True, ignore_duplicates=True)
+writer.add_many("coins", diff.archived + diff.restored + diff.changed, upsert=True)
+coins_written = 0
+with log.span('write'):
+    try:
+        coins_written = writer.flush().get("coins", 0)
     except Exception as exception:
-        log.error("Error adding coins", exception)
-        print(exception)
+        log.error(f"Error writing coins, {writer.pending_rows()} rows not written", exception)
+
+# Keep the new universe only if every row was written, otherwise the next run diffs again
+if writer.failed_rows == 0 and writer.pending_rows() == 0:
+    universe.commit(coins_list, coins_fingerprint)
+universe.close()
 
 print()
 print(f"Total coins in CoinGecko: {total_coins}")
-print(f"Total coins skipped: {total_coins - len(coins_added)}")
-print(f"Total coins added: {len(coins_added)}")
-if coins_added:
-    print()
-    print("Coins added:")
-    for coin in coins_added:
-        print(coin['id'])
+print(f"Coins written: {coins_written} ({diff})")
+for label, rows in [("Coins added", diff.added), ("Coins archived", diff.archived), ("Coins restored", diff.restored)]:
+    if rows:
+        print()
+        print(f"{label}:")
+        for coin in rows:
+            print(coin['id'])
 
-log.end(f"Total coins in CoinGecko: {total_coins}, Total coins added: {len(coins_added)}, Total coins skipped: {total_coins - len(coins_added)}")
+storage.close()
+log.end(f"Total coins in CoinGecko: {total_coins}, {diff}, {coins_written} rows written{'' if writer.failed_rows == 0 else f', {writer.failed_rows} failed'}{'' if writer.pending_rows() == 0 else f', {writer.pending_rows()} not written'}")
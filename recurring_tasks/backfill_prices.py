@@ -0,0 +1,238 @@
+import os
+import argparse
+import asyncio
+import datetime
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from coingecko_api.api import CoinGeckoAPI
+from coingecko_api.async_api import AsyncCoinGeckoAPI
+from coingecko_api.key_pool import parse_api_keys
+from utils.script_logger import ScriptLogger
+from utils.metrics import metrics
+from utils.config import load_config, resolve_path
+from utils.batch_writer import BatchWriter
+from storage import open_storage
+from utils.price_rollups import SnapshotIntervals, bars_to_rows, HOUR, DAY
+from utils.backfill import BackfillCheckpoint, backfill_windows, chart_snapshots, epoch_seconds, to_utc_day, LEAD_SECONDS
+from dotenv import load_dotenv
+
+# Backfill hourly/daily price history from /coins/{id}/market_chart/range
+# Every (coin, window) is fetched concurrently within the shared rate limit, rolled up
+# with utils/price_rollups (same bars as consolidate_prices()) and bulk written.
+# Finished windows are checkpointed, an interrupted backfill continues where it stopped,
+# so it can also be scheduled with --max-run-time to progress a little every run.
+class PriceBackfill:
+    # Tables written per (currency, granularity), daily bars are derived from hourly snapshots too
+    TARGET_TABLES = {
+        ('usd', 'hourly'): {'hourly_usd_prices': HOUR, 'daily_usd_prices': DAY},
+        ('usd', 'daily'): {'daily_usd_prices': DAY},
+        ('btc', 'hourly'): {'hourly_btc_prices': HOUR},
+    }
+
+    # Days of history available on the free plans
+    FREE_PLAN_HISTORY_DAYS = 365
+
+    # /coins/{id}/ohlc with interval=hourly/daily (paid plans) covers up to this many days
+    OHLC_DAYS = {'hourly': 90, 'daily': 180}
+
+    def __init__(self, config, currency = 'usd', granularity = 'hourly', overwrite = False):
+        if (currency, granularity) not in self.TARGET_TABLES:
+            raise ValueError(f"No price table for {granularity} {currency} prices")
+
+        self.config = config
+        self.currency = currency
+        self.granularity = granularity
+        self.target_tables = self.TARGET_TABLES[(currency, granularity)]
+        self.overwrite = overwrite # replace existing bars instead of keeping them
+
+        # Rate limit state is shared with the other recurring tasks through config's rate_limit_state_file
+        self.cg = CoinGeckoAPI(os.getenv('COINGECKO_API_KEY'), os.getenv('COINGECKO_API_PLAN', 'public'),
+            rate_limit_state_file = resolve_path(config.get('rate_limit_state_file')), metrics = metrics,
+            api_base_url = os.getenv('COINGECKO_API_URL'), api_keys = parse_api_keys(os.getenv('COINGECKO_API_KEYS')))
+        if not self.cg.api_is_up():
+            raise Exception("CoinGecko API is not responding")
+        self.max_in_flight = config.get('backfill_max_in_flight', 10)
+        self.async_cg = AsyncCoinGeckoAPI(self.cg.api_key, self.cg.plan, max_in_flight = self.max_in_flight, rate_limiter = self.cg.rate_limiter, metrics = metrics,
+            api_base_url = self.cg.api_base_url, key_pool = self.cg.key_pool)
+
+        # Storage backend from config's storage_backend, the postgres backend writes the bars with COPY
+        self.storage = open_storage(config)
+
+        # Writes run on one worker thread so fetching continues while a window is written
+        self.writer = BatchWriter(self.storage, None, config.get('db_chunk_size', 500), config.get('db_chunk_sizes'), metrics = metrics)
+        self.executor = ThreadPoolExecutor(max_workers = 1)
+        self.checkpoint = BackfillCheckpoint(resolve_path(config.get('backfill_state_file', 'logs/backfill_state.sqlite')))
+
+    def close(self):
+        self.executor.shutdown()
+        self.checkpoint.close()
+        self.storage.close()
+
+    def tracked_coin_ids(self):
+        """Ids of all coins with track_prices set"""
+        coin_ids = []
+        page_size = 1000
+        while True:
+            rows = self.storage.select("coins", "id", filters = {"track_prices": True, "archived": False},
+                order = "id", offset = len(coin_ids), limit = page_size)
+            coin_ids.extend(coin['id'] for coin in rows)
+            if len(rows) < page_size:
+                return coin_ids
+
+    def plan_windows(self, coin_ids, start, end):
+        """Return the unfinished (coin_id, window_start, window_end) jobs, oldest windows first"""
+        start, end = to_utc_day(start), to_utc_day(end)
+
+        # Free plans only serve the last year of history
+        if self.cg.plan in ['demo', 'public']:
+            earliest = to_utc_day(datetime.datetime.now(datetime.timezone.utc)) - datetime.timedelta(days=self.FREE_PLAN_HISTORY_DAYS - 1)
+            if start < earliest:
+                print(f"{self.cg.plan} plan history starts at {earliest.date()}, backfilling from there")
+                start = earliest
+
+        finished = self.checkpoint.finished_windows(self.currency, self.granularity)
+        windows = backfill_windows(start, end, self.granularity)
+        return [(coin_id, window_start, window_end) for window_start, window_end in windows for coin_id in coin_ids
+            if (coin_id, window_start) not in finished]
+
+    async def fetch_ohlc(self, coin_id):
+        """OHLC candles of the last OHLC_DAYS, keyed by bucket start (paid plans only)"""
+        days = self.OHLC_DAYS[self.granularity]
+        candles = await self.async_cg.get_coin_ohlc_by_id(coin_id, days, vs_currency = self.currency, interval = self.granularity)
+
+        # Candle timestamps are the close time of the candle
+        bucket_seconds = HOUR if self.granularity == 'hourly' else DAY
+        return {int(candle[0] // 1000) - bucket_seconds: tuple(candle[1:5]) for candle in candles or []}
+
+    async def window_rows(self, coin_id, window_start, window_end):
+        """Fetch one window and return {table: rows} of its bars"""
+        from_timestamp = epoch_seconds(window_start)
+        to_timestamp = epoch_seconds(window_end)
+
+        # Start one snapshot early so the interval into the first bucket is included
+        lead = LEAD_SECONDS[self.granularity]
+        chart = await self.async_cg.get_coin_chart_in_range(coin_id, from_timestamp - lead, to_timestamp, vs_currency = self.currency)
+        timestamps, prices, volumes_24h = chart_snapshots(chart, from_timestamp - lead, to_timestamp)
+
+        # Precise OHLC for the recent windows where the API has candles
+        ohlc = None
+        ohlc_from = epoch_seconds(to_utc_day(datetime.datetime.now(datetime.timezone.utc))) - self.OHLC_DAYS[self.granularity] * DAY
+        if self.cg.plan not in ['demo', 'public'] and to_timestamp > ohlc_from:
+            if coin_id not in self.__ohlc:
+                self.__ohlc[coin_id] = asyncio.ensure_future(self.fetch_ohlc(coin_id))
+            task = self.__ohlc[coin_id]
+            try:
+                ohlc = await task
+            except Exception:
+                # Forget the failed call, the coin's next window requests the candles again
+                if self.__ohlc.get(coin_id) is task:
+                    del self.__ohlc[coin_id]
+                raise
+
+        intervals = SnapshotIntervals(np.full(len(timestamps), coin_id), timestamps, prices, volumes_24h)
+        rows = {}
+        for table, bucket_seconds in self.target_tables.items():
+            bars = intervals.bars(bucket_seconds)
+            bucket_starts = bars['bucket_start'].astype(np.int64)
+            keep = (bucket_starts >= from_timestamp) & (bucket_starts < to_timestamp)
+            bars = {name: values[keep] for name, values in bars.items()}
+
+            if ohlc and bucket_seconds == LEAD_SECONDS[self.granularity]:
+                self.apply_ohlc(bars, ohlc)
+            if table == 'hourly_btc_prices':
+                del bars['volume']
+
+            rows[table] = bars_to_rows(bars, 'hour' if bucket_seconds == HOUR else 'day')
+        return rows
+
+    @staticmethod
+    def apply_ohlc(bars, ohlc):
+        """Replace snapshot based open/high/low/close with API candles where available"""
+        for i, bucket_start in enumerate(bars['bucket_start'].astype(np.int64).tolist()):
+            candle = ohlc.get(bucket_start)
+            if candle:
+                bars['open'][i], bars['high'][i], bars['low'][i], bars['close'][i] = candle
+
+    def write_window(self, coin_id, window_start, window_end, rows):
+        """Write one window's bars and checkpoint it if no row failed, returns the bars written"""
+        failed_rows = self.writer.failed_rows
+        for table, table_rows in rows.items():
+            self.writer.add_many(table, table_rows, upsert = True, ignore_duplicates = not self.overwrite)
+        rows_written = self.writer.flush()
+
+        if self.writer.failed_rows == failed_rows:
+            self.checkpoint.mark_finished(coin_id, self.currency, self.granularity, window_start, window_end,
+                sum(len(table_rows) for table_rows in rows.values()))
+        return rows_written
+
+    async def backfill(self, jobs, max_run_time = None):
+        """Process jobs with max_in_flight workers, no new window is started after max_run_time"""
+        self.__ohlc = {} # coin_id -> task returning {bucket start epoch: (open, high, low, close)}
+        queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+        loop = asyncio.get_running_loop()
+
+        async def worker():
+            while not queue.empty():
+                if max_run_time and self.log.current_run_time_seconds() > max_run_time:
+                    return
+                coin_id, window_start, window_end = queue.get_nowait()
+                try:
+                    rows = await self.window_rows(coin_id, window_start, window_end)
+                    rows_written = await loop.run_in_executor(self.executor, self.write_window, coin_id, window_start, window_end, rows)
+                    for table, written in rows_written.items():
+                        self.bars_written[table] = self.bars_written.get(table, 0) + written
+                    self.windows_finished += 1
+                except Exception as exception:
+                    self.windows_failed += 1
+                    self.log.error(f"Error backfilling {coin_id} {window_start.date()} - {window_end.date()}", exception)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.max_in_flight)))
+        finally:
+            await self.async_cg.close()
+
+    def run(self, coin_ids, start, end, max_run_time = None):
+        self.log = ScriptLogger("backfill_prices", metrics = metrics)
+        self.writer.log = self.log
+        self.bars_written = {}
+        self.windows_finished = 0
+        self.windows_failed = 0
+
+        try:
+            jobs = self.plan_windows(coin_ids, start, end)
+            print(f"{len(jobs)} {self.granularity} {self.currency} windows to backfill for {len(coin_ids)} coins")
+            asyncio.run(self.backfill(jobs, max_run_time))
+        except Exception as exception:
+            self.log.error("Error backfilling prices", exception)
+            raise
+
+        remaining = len(jobs) - self.windows_finished
+        written = ", ".join(f"{written} {table} bars" for table, written in self.bars_written.items())
+        self.log.end(f"{self.granularity} {self.currency} backfill, {self.windows_finished} windows finished, {self.windows_failed} failed, {remaining} remaining{', ' if written else ''}{written}")
+
+if __name__ == "__main__":
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    parser = argparse.ArgumentParser(description="Backfill hourly/daily price history from CoinGecko")
+    parser.add_argument('--coins', help="comma separated coin ids (default: coins with track_prices)")
+    parser.add_argument('--start', default=str(today - datetime.timedelta(days=364)), help="first day, YYYY-MM-DD (default: a year ago)")
+    parser.add_argument('--end', default=str(today), help="day after the last day, YYYY-MM-DD (default: today)")
+    parser.add_argument('--currency', default='usd', choices=['usd', 'btc'])
+    parser.add_argument('--granularity', default='hourly', choices=['hourly', 'daily'])
+    parser.add_argument('--overwrite', action='store_true', help="replace existing bars (by default consolidated bars are kept)")
+    parser.add_argument('--restart', action='store_true', help="forget the checkpoint of the selected coins and start over")
+    parser.add_argument('--max-run-time', type=float, help="stop starting new windows after this many seconds")
+    args = parser.parse_args()
+
+    # Load environment variables from .pip env file
+    load_dotenv()
+
+    backfill = PriceBackfill(load_config(), args.currency, args.granularity, args.overwrite)
+    try:
+        coin_ids = args.coins.replace(' ', '').split(',') if args.coins else backfill.tracked_coin_ids()
+        if args.restart:
+            backfill.checkpoint.reset(args.currency, args.granularity, coin_ids)
+        backfill.run(coin_ids, args.start, args.end, args.max_run_time)
+    finally:
+        backfill.close()
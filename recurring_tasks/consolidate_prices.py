@@ -0,0 +1,43 @@
+from utils.script_logger import ScriptLogger
+from utils.config import load_config
+from utils.metrics import metrics
+from storage import open_storage
+from dotenv import load_dotenv
+
+# Initialize the script logger, database function latency is exported at log.end()
+log = ScriptLogger("consolidate_prices", metrics = metrics)
+
+# Maximum run time in seconds from config's max_run_time_seconds, shared with the other tasks
+config = load_config()
+max_run_time = config.get('max_run_time_seconds', 50)
+
+# Tables consolidated from the continuous price tables, see consolidate_prices() in custom_db_functions.sql
+consolidation_targets = ["hourly_usd_prices", "hourly_btc_prices", "daily_usd_prices"]
+
+# Load environment variables from .pip env file
+load_dotenv()
+
+# Storage backend from config's storage_backend, the SQLite backend consolidates with utils/price_rollups
+storage = open_storage(config)
+
+# Each call consolidates one window after the table's watermark, repeat until caught up
+results = []
+for target in consolidation_targets:
+    bars_upserted = 0
+    window_end = None
+    caught_up = False
+    try:
+        while not caught_up and log.current_run_time_seconds() < max_run_time:
+            with metrics.time('db_rpc_seconds', function = 'consolidate_prices', table = target):
+                window = storage.rpc("consolidate_prices", {"p_target": target})[0]
+            bars_upserted += window['bars_upserted']
+            window_end = window['window_end']
+            caught_up = window['caught_up']
+    except Exception as exception:
+        log.error(f"Error consolidating {target}", exception)
+
+    print(f"{target}: {bars_upserted} bars upserted, consolidated until {window_end}{'' if caught_up else ' (behind)'}")
+    results.append(f"{target} {bars_upserted} bars{'' if caught_up else ' (behind)'}")
+
+storage.close()
+log.end(", ".join(results))
@@ -0,0 +1,108 @@
+import argparse
+import datetime
+from utils.script_logger import ScriptLogger
+from utils.metrics import metrics
+from utils.config import load_config, resolve_path
+from utils.parquet_export import PriceExporter, ExportTable
+from utils.write_spool import WriteSpool
+from storage import open_storage
+from dotenv import load_dotenv
+
+# Export the price tables to date and currency partitioned Parquet files (utils/parquet_export)
+# Only rows after each table's watermark are read, page by page in (time, coin_id) order,
+# so a scheduled run copies what is new since the last one. Rows younger than
+# export_settle_seconds are left for the next run, and so is everything from where rows
+# can still arrive behind the watermark: the oldest row waiting in the local write spool,
+# for bars also the bucket before the consolidation watermark (consolidated again by the next
+# consolidate_prices run) and the buckets spooled rows will consolidate again.
+# Analytics read the files with utils.parquet_export.read_prices() instead of the database.
+
+def to_utc(value):
+    """Naive UTC datetime of an ISO timestamp or date string"""
+    value = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+def bucket_start(value, bucket):
+    """Start of the bucket (timedelta) value falls in"""
+    return datetime.datetime.min + (value - datetime.datetime.min) // bucket * bucket
+
+def export_until(name, until, storage, spool = None):
+    """until (naive UTC) capped where rows of table name can still arrive, None if none of its rows are final yet"""
+    table = ExportTable(name)
+    source = name
+    bucket = None
+    if table.time_column != 'created_at':
+        watermark = storage.select('consolidation_watermarks', 'consolidated_until', filters = {'target_table': name})
+        if not watermark:
+            return None
+        # consolidate_prices() starts its next run one bucket before the watermark, that bucket is not final
+        bucket = datetime.timedelta(hours=1) if table.time_column == 'hour' else datetime.timedelta(days=1)
+        until = min(until, bucket_start(to_utc(watermark[0]['consolidated_until']), bucket) - bucket)
+        source = f'continuous_{table.currency}_prices'
+
+    oldest = spool.oldest_pending(source) if spool else None
+    if oldest:
+        oldest = to_utc(oldest)
+        if bucket:
+            # The bucket of the oldest spooled row and the one before it are consolidated again
+            oldest = bucket_start(oldest, bucket) - bucket
+        until = min(until, oldest)
+    return until
+
+def storage_page_fetcher(storage):
+    """fetch_page for PriceExporter reading a table from the storage backend with keyset pagination"""
+    def fetch_page(table, columns, after, until, limit):
+        with metrics.time('db_read_seconds', table = table):
+            return storage.select_after(table, columns, ExportTable(table).time_column, after, until, limit)
+    return fetch_page
+
+if __name__ == "__main__":
+    config = load_config()
+    parser = argparse.ArgumentParser(description="Export price tables to Parquet files")
+    parser.add_argument('--tables', default=','.join(config.get('export_tables', [])), help="comma separated price tables (default: config's export_tables)")
+    parser.add_argument('--restart', action='store_true', help="delete the exported files of the tables and export them again")
+    parser.add_argument('--max-run-time', type=float, help="stop starting new batches after this many seconds")
+    args = parser.parse_args()
+
+    # Load environment variables from .pip env file
+    load_dotenv()
+
+    log = ScriptLogger("export_prices", metrics = metrics)
+
+    # Storage backend from config's storage_backend, see storage/
+    storage = open_storage(config, timeout = 60)
+
+    # Rows still in the collector's write spool on this host hold the exports back, see export_until()
+    spool = WriteSpool(resolve_path(config['write_spool_file'])) if config.get('write_spool_file') else None
+
+    exporter = PriceExporter(resolve_path(config.get('export_directory', 'logs/exports')), storage_page_fetcher(storage),
+        page_size = config.get('export_page_size', 1000), batch_rows = config.get('export_batch_rows', 200000))
+    settled = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - datetime.timedelta(seconds=config.get('export_settle_seconds', 900))
+    should_stop = (lambda: log.current_run_time_seconds() > args.max_run_time) if args.max_run_time else None
+
+    results = []
+    for table in args.tables.replace(' ', '').split(','):
+        if not table:
+            continue
+        try:
+            if args.restart:
+                exporter.reset(table)
+            until = export_until(table, settled, storage, spool)
+            if until is None:
+                print(f"{table}: nothing consolidated yet")
+                results.append(f"{table} not consolidated")
+                continue
+            with log.span(table):
+                exported, caught_up = exporter.export(table, until.isoformat(), should_stop)
+        except Exception as exception:
+            log.error(f"Error exporting {table}", exception)
+            print(exception)
+            continue
+
+        print(f"{table}: {exported} rows exported{'' if caught_up else ' (behind)'}")
+        results.append(f"{table} {exported} rows{'' if caught_up else ' (behind)'}")
+
+    storage.close()
+    if spool:
+        spool.close()
+    log.end(", ".join(results))
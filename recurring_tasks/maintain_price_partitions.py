@@ -0,0 +1,48 @@
+import datetime
+from utils.script_logger import ScriptLogger
+from utils.config import load_config
+from storage import open_storage
+from dotenv import load_dotenv
+
+# Initialize the script logger
+log = ScriptLogger("maintain_price_partitions")
+
+# Retention settings from config.json
+config = load_config()
+retention_months = config.get('partition_retention_months', 3)
+archive_partitions = config.get('archive_old_partitions', False)
+
+# Load environment variables from .pip env file
+load_dotenv()
+
+# Storage backend from config's storage_backend, the partition functions need the PostgreSQL schema
+# Backends without partitioned price tables (sqlite) have nothing to maintain
+storage = open_storage(config)
+
+# Create the monthly partitions for the coming months
+partitions_created = 0
+if storage.partitioned:
+    try:
+        partitions_created = storage.rpc("create_price_partitions", {"p_from": datetime.date.today().isoformat()})
+    except Exception as exception:
+        log.error("Error creating price partitions", exception)
+
+# Drop or archive old partitions that have been consolidated into the hourly/daily tables
+partitions_removed = []
+if storage.partitioned:
+    try:
+        partitions_removed = storage.rpc("drop_consolidated_price_partitions", {
+            "p_keep_months": retention_months,
+            "p_archive": archive_partitions
+        })
+    except Exception as exception:
+        log.error("Error removing consolidated price partitions", exception)
+
+for partition in partitions_removed:
+    print(f"{partition['partition_name']} {partition['action']}")
+
+storage.close()
+if storage.partitioned:
+    log.end(f"{partitions_created} partitions created, {len(partitions_removed)} partitions {'archived' if archive_partitions else 'dropped'}")
+else:
+    log.end(f"Skipped, the {storage.name} storage backend has no price partitions")
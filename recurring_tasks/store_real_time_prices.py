@@ -1,189 +1,342 @@
 import os
-from supabase import create_client, Client
-from supabase.client import ClientOptions
-from coingecko_api.api_to_db_mappings import coins_market_data_to_coins, coins_market_data_to_continuous_prices
+import time
+import signal
+import argparse
+from coingecko_api.api_to_db_mappings import coins_market_data_to_coins, coins_market_data_to_continuous_prices, \
+    simple_price_to_continuous_prices, coins_integer_columns, continuous_prices_integer_columns, continuous_prices_required_columns
+from coingecko_api.page_transform import MarketPage, id_array, simple_price_coins
+from coingecko_api.fetch_planner import FetchPlanner
 from coingecko_api.api import CoinGeckoAPI
+from coingecko_api.async_api import AsyncCoinGeckoAPI
+from coingecko_api.key_pool import parse_api_keys
+from coingecko_api.response_cache import ResponseCache
 from utils.script_logger import ScriptLogger
+from utils.config import load_config, resolve_path
+from utils.batch_writer import BatchWriter
+from storage import open_storage
+from utils.write_spool import WriteSpool, SpoolWriter, SpoolFlusher
+from utils.freshness_scheduler import FreshnessScheduler
+from utils.price_store import PriceStore
+from utils.snapshot_filter import SnapshotFilter
+from utils.metrics import metrics
 from dotenv import load_dotenv
-import datetime
-import random
-
-# TODO: Randomize calls between updating USD prices and BTC to avoid skipping BTC prices more often
-
-# Initialize the script logger
-log = ScriptLogger("store_real_time_prices")
-
-# Set the maximum times in seconds
-max_coin_update_time = 25
-max_run_time = 50
-
-# Initialize counters
-total_coins_updated = 0
-total_usd_prices_added = 0  
-total_btc_prices_added = 0
-api_page_calls = 0
-
-# Load environment variables from .pip env file
-load_dotenv()
-
-# Initialize and Test the CoinGeckoAPI class
-cg = CoinGeckoAPI(os.getenv('COINGECKO_API_KEY'), os.getenv('COINGECKO_API_PLAN', 'public'))
-if not cg.api_is_up:
-    log.error("CoinGecko API is not responding")
-    raise Exception("CoinGecko API is not responding")
-
-# Initialize Supabase client
-url: str = os.getenv("SUPABASE_URL")
-key: str = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(url, key,
-  options=ClientOptions(
-    postgrest_client_timeout=30,
-    schema="coingecko",
-  ))
-
-# Choose max page randomly to update lower volume
-max_page = random.randint(3, 30)
-
-# Get coin update priorities
-coin_update_limit = 500 + (max_page * 100)
-response = supabase.rpc("coins_to_update", {"p_limit": coin_update_limit}).execute()
-coins_to_update = [coin['id'] for coin in response.data]
-
-price_priority_limit = 30 + max_page
-response = supabase.rpc("usd_price_priority", {"p_limit": price_priority_limit}).execute()
-usd_price_priority = [coin['coin_id'] for coin in response.data]
-response = supabase.rpc("btc_price_priority", {"p_limit": price_priority_limit}).execute()
-btc_price_priority = [coin['coin_id'] for coin in response.data]
-
-def update_coins_and_usd_prices():
-    global log, max_coin_update_time, max_run_time, total_coins_updated, total_usd_prices_added, api_page_calls, max_page, cg, supabase, coins_to_update, usd_price_priority
-
-    # Get active coins from CoinGecko, iterate over max_page pages of API calls (250 coins per page)
-    for page_number in range(1,max_page+1):
-
-        # Break if max_total_run_time is reached
-        if log.current_run_time_seconds() > max_run_time:
-            break
-        
-        # Random skip to reduce API calls and run time
-        if random.random() < (page_number / ( max_page + 2 ))**0.4:
-            continue
-
-        coins_list = cg.get_coins_with_market_data(page=page_number)
-        api_page_calls += 1
-
-        for coin in coins_list:
-
-            # Update general data in coins table
-            if (coin['id'] in coins_to_update) and (log.current_run_time_seconds() < max_coin_update_time):
+import asyncio
+import numpy as np
+
+# Collects real time prices from CoinGecko into the continuous price tables
+# Runs once per call (cron) or, with --daemon, as a resident service that keeps
+# its clients warm, refreshes the priority lists on their own interval and
+# starts a new run as soon as the previous one is done.
+# Which coins are refreshed each run is decided by the FreshnessScheduler.
+class RealTimePriceCollector:
+    # Default maximum times in seconds, overridden by config's max_run_time_seconds / max_coin_update_time_seconds
+    max_coin_update_time = 25
+    max_run_time = 50
+
+    def __init__(self, config):
+        self.config = config
+        self.priorities_loaded_at = None
+        self.max_run_time = config.get('max_run_time_seconds', self.max_run_time)
+        self.max_coin_update_time = config.get('max_coin_update_time_seconds', self.max_coin_update_time)
+
+        # API and database latency, retries and sizes, reset per run and exported by the run's ScriptLogger
+        self.metrics = metrics
+
+        # Initialize and Test the CoinGeckoAPI class
+        # Rate limit state is shared with the other recurring tasks through config's rate_limit_state_file
+        # Responses are cached per endpoint TTL (and revalidated) through config's response_cache_file
+        self.cache = ResponseCache(cache_file = resolve_path(config.get('response_cache_file')))
+        self.cg = CoinGeckoAPI(os.getenv('COINGECKO_API_KEY'), os.getenv('COINGECKO_API_PLAN', 'public'),
+            rate_limit_state_file = resolve_path(config.get('rate_limit_state_file')), cache = self.cache, metrics = self.metrics,
+            api_base_url = os.getenv('COINGECKO_API_URL'), api_keys = parse_api_keys(os.getenv('COINGECKO_API_KEYS')))
+        if not self.cg.api_is_up():
+            raise Exception("CoinGecko API is not responding")
+
+        # Async client shares the rate limiter (and key pool), it lives on its own event loop so its session stays open between runs
+        self.loop = asyncio.new_event_loop()
+        self.async_cg = AsyncCoinGeckoAPI(self.cg.api_key, self.cg.plan, rate_limiter = self.cg.rate_limiter, cache = self.cache, metrics = self.metrics,
+            api_base_url = self.cg.api_base_url, key_pool = self.cg.key_pool)
+
+        # Storage backend from config's storage_backend (Supabase by default), see storage/
+        self.storage = open_storage(config)
+
+        # API calls are planned per run from the priority lists, ids batches bounded by config's fetch_max_ids_length
+        self.planner = FetchPlanner(config.get('fetch_max_ids_length', 4000))
+
+        # Per coin refresh intervals between the configured bounds, per-call cost kept in scheduler_state_file
+        self.scheduler = FreshnessScheduler(
+            min_interval = config.get('price_min_refresh_seconds', 60),
+            max_interval = config.get('price_max_refresh_seconds', 3600),
+            state_file = resolve_path(config.get('scheduler_state_file'))
+        )
+
+        # Snapshots whose api_last_updated didn't change since the stored one are skipped, seeded from latest_prices
+        self.snapshots = SnapshotFilter()
+
+        # Prices stored by this process, queryable without the database (latest, OHLC, TWAP, change)
+        # Snapshotted to price_store_file, so a restarted collector keeps its hot window
+        self.price_store_file = resolve_path(config.get('price_store_file'))
+        self.price_store_snapshot_seconds = config.get('price_store_snapshot_seconds', 300)
+        self.prices = PriceStore.load(self.price_store_file, config.get('price_store_capacity', 720), config.get('price_store_resolution_seconds', 60))
+        self.prices_snapshot_at = time.monotonic()
+
+        # Rows are collected per API response and written in bulk, chunk sizes from config.json
+        # With a write_spool_file they are spooled locally and written by a background SpoolFlusher instead
+        self.db_writer = BatchWriter(self.storage, None, config.get('db_chunk_size', 500), config.get('db_chunk_sizes'), metrics = self.metrics)
+        self.spool = None
+        self.flusher = None
+        self.stop_signal = None # name of the signal stopping the daemon
+        if config.get('write_spool_file'):
+            self.spool = WriteSpool(resolve_path(config['write_spool_file']))
+            self.writer = SpoolWriter(self.spool)
+            self.flusher = SpoolFlusher(self.spool, self.db_writer, batch_size = config.get('spool_batch_size', 2000))
+            self.flusher.start()
+        else:
+            self.writer = self.db_writer
+        # The snapshot filter remembers a price row only once the writer reports it written (or spooled)
+        self.writer.on_written = self.record_written
+
+    def close(self):
+        self.loop.run_until_complete(self.async_cg.close())
+        self.loop.close()
+        self.snapshot_prices()
+
+        # Give the flusher a moment to empty the spool, rows left over are written by the next run
+        if self.flusher:
+            self.flusher.drain(self.config.get('spool_drain_seconds', 10))
+            self.flusher.stop(timeout = 30)
+            self.spool.close()
+        self.storage.close()
+
+    def snapshot_prices(self):
+        if self.price_store_file:
+            self.prices.snapshot(self.price_store_file)
+            self.prices_snapshot_at = time.monotonic()
+
+    def load_priorities(self):
+        """Get the coins to update and the freshness of every tracked coin's prices"""
+        coin_update_limit = self.config.get('coin_update_limit', 2000)
+        with self.metrics.time('db_rpc_seconds', function = 'coins_to_update'):
+            rows = self.storage.rpc("coins_to_update", {"p_limit": coin_update_limit})
+        self.coins_to_update = [coin['id'] for coin in rows]
+
+        coins = []
+        page_size = 1000
+        while True:
+            with self.metrics.time('db_rpc_seconds', function = 'price_freshness'):
+                rows = self.storage.rpc("price_freshness", offset = len(coins), limit = page_size)
+            coins.extend(rows)
+            if len(rows) < page_size:
+                break
+        self.scheduler.load(coins)
+
+        if not self.snapshots.seeded:
+            self.load_last_updated()
+
+        self.priorities_loaded_at = time.monotonic()
+
+    def load_last_updated(self):
+        """Seed the snapshot filter with the api_last_updated of every coin's latest stored price"""
+        rows = []
+        page_size = 1000
+        while True:
+            with self.metrics.time('db_read_seconds', table = 'latest_prices'):
+                page = self.storage.select("latest_prices", "coin_id, currency, api_last_updated", order = "coin_id, currency",
+                    offset = len(rows), limit = page_size)
+            rows.extend(page)
+            if len(page) < page_size:
+                break
+        self.snapshots.seed(rows)
+
+    def plan_fetches(self):
+        """Plan the most urgent fetches that fit this run's time and rate limit budget"""
+        time_budget = self.max_run_time - self.log.current_run_time_seconds()
+        rate_limiter = self.cg.rate_limiter
+        quota_calls = rate_limiter.headroom() + rate_limiter.max_rate * time_budget
+        self.call_budget = self.scheduler.call_budget(time_budget, quota_calls, default_seconds_per_call = 1 / rate_limiter.max_rate)
+
+        plan, price_ids, market_data_ids = self.scheduler.select(self.planner, self.coins_to_update, self.call_budget)
+        self.price_priority = {currency: id_array(ids) for currency, ids in price_ids.items()}
+        self.run_coins_to_update = id_array(market_data_ids)
+        return plan
+
+    async def fetch(self, plan):
+        """Make the planned calls concurrently, bounded by the shared rate limiter"""
+        timeout = self.max_run_time - self.log.current_run_time_seconds()
+        return await self.async_cg.fetch_all({call: call.request(self.async_cg) for call in plan.calls}, timeout)
+
+    def price_rows(self, page, currency, mapping):
+        """Continuous price rows for the page's coins in currency's priority list, each coin stored once per run and only if it changed"""
+        ids = np.setdiff1d(self.price_priority[currency], self.prices_stored[currency], assume_unique=True)
+        rows = page.to_rows(
+            mapping,
+            integer_columns = continuous_prices_integer_columns,
+            required_columns = continuous_prices_required_columns,
+            ids = ids,
+            extra_columns = {'created_at': page.timestamp}
+        )
+        # Unchanged snapshots count as refreshed, the stored row is still the latest
+        self.prices_stored[currency] = np.union1d(self.prices_stored[currency], id_array(row['coin_id'] for row in rows))
+        rows = self.snapshots.changed(currency, rows)
+        self.prices.add_rows(currency, rows)
+        return rows
+
+    def record_written(self, table, rows):
+        """Commits written continuous price rows to the snapshot filter"""
+        if table.startswith('continuous_') and table.endswith('_prices'):
+            self.snapshots.commit(table[len('continuous_'):-len('_prices')], rows)
+
+    def store_responses(self, responses):
+        log = self.log
+
+        for call, response in responses.items():
+
+            # Break if max_total_run_time is reached
+            if log.current_run_time_seconds() > self.max_run_time:
+                break
+
+            if isinstance(response, Exception):
+                log.error(f"Error fetching {call}", response)
+                continue
+            self.api_calls += 1
+
+            try:
+                with log.span('transform'):
+                    self.queue_rows(call, response)
+            except Exception as exception:
+                log.error(f"Error transforming {call}", exception)
+
+            # Bulk write the response, rows a database outage leaves unwritten stay queued for the next write
+            with log.span('write'):
                 try:
-                    # Modify coin data to match coins table
-                    general_data = {value: coin.get(key) for key, value in coins_market_data_to_coins.items()}
-                    for key, value in general_data.items():
-                        if isinstance(value, float):
-                            general_data[key] = int(round(value))
-
-                    # Add current utc timestamp
-                    general_data['updated_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
-
-                    # Upsert coin data, print success message
-                    response = supabase.table("coins") \
-                        .upsert(general_data) \
-                        .execute()
-                    
-                    if response.data:
-                        # print(f"Successfully updated {coin['id']} general data")
-                        total_coins_updated += 1
-                    else:
-                        log.error(f"Unknown Response when updating {coin['id']} general data")
-                        print("Unknown Response:")
-                        print(response)
-            
+                    rows_written = self.writer.flush()
                 except Exception as exception:
-                    log.error(f"Error updating {coin['id']} general data", exception)
-                    print(exception)
-                    print(coin['id'])
+                    log.error(f"Error writing rows, {self.writer.pending_rows()} rows kept for the next write", exception)
+                    continue
+            self.total_coins_updated += rows_written.get("coins", 0)
+            self.total_usd_prices_added += rows_written.get("continuous_usd_prices", 0)
+            self.total_btc_prices_added += rows_written.get("continuous_btc_prices", 0)
 
-            # Update price data in continuous_usd_prices table
-            if (coin['id'] in usd_price_priority):
-                try:
-                    # Modify coin data to match continuous_usd_prices table
-                    price_data = {value: coin.get(key) for key, value in coins_market_data_to_continuous_prices.items()}
-                    price_data['vol_24h'] = int(round(price_data['vol_24h']))
-
-                    # Add current utc timestamp
-                    price_data['created_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
-
-                    # Insert price_data in to continuous_usd_prices table
-                    response = supabase.table("continuous_usd_prices") \
-                        .insert(price_data) \
-                        .execute()
-                    
-                    if response.data:   
-                        # print(f"Successfully added {coin['id']} USD price data")
-                        total_usd_prices_added += 1
-                    else:
-                        log.error(response)
-                        log.error(f"Unknown Response when adding {coin['id']} USD price data")
-                        print("Unknown Response:")
-                        print(response)
+    def queue_rows(self, call, response):
+        """Queue the coins and continuous price rows of one API response"""
+        if call.endpoint == 'coins/markets':
+            page = MarketPage(response)
+            currency = call.vs_currencies[0]
 
-                except Exception as exception:
-                    log.error(f"Error adding {coin['id']} USD price data", exception)
-                    print(exception)
-                    print(coin)   
+            # Queue general data for the coins table
+            if currency == 'usd' and self.log.current_run_time_seconds() < self.max_coin_update_time:
+                self.writer.add_many("coins", page.to_rows(
+                    coins_market_data_to_coins,
+                    integer_columns = coins_integer_columns,
+                    ids = self.run_coins_to_update,
+                    extra_columns = {'updated_at': page.timestamp}
+                ), upsert=True)
 
-def update_btc_prices():
-    global log, max_coin_update_time, max_run_time, total_coins_updated, total_btc_prices_added, api_page_calls, max_page, cg, supabase, btc_price_priority
+            self.writer.add_many(f"continuous_{currency}_prices", self.price_rows(page, currency, coins_market_data_to_continuous_prices))
+        else:
+            page = MarketPage(simple_price_coins(response))
+            for currency in call.vs_currencies:
+                mapping = {api_key.format(currency=currency): db_column for api_key, db_column in simple_price_to_continuous_prices.items()}
+                self.writer.add_many(f"continuous_{currency}_prices", self.price_rows(page, currency, mapping))
+        self.coins_from_api += page.size
 
-    for page_number in range(1,max_page+1):
+    def run(self, priority_refresh_seconds = 0):
+        """One collection run, priorities are reloaded when older than priority_refresh_seconds"""
+        self.metrics.reset()
+        self.log = ScriptLogger("store_real_time_prices", metrics = self.metrics)
+        self.writer.log = self.log
+        self.db_writer.log = self.log
 
-        # Break if max_total_run_time is reached
-        if log.current_run_time_seconds() > max_run_time:
-            break
+        # Initialize counters
+        self.total_coins_updated = 0
+        self.total_usd_prices_added = 0
+        self.total_btc_prices_added = 0
+        self.api_calls = 0
+        self.coins_from_api = 0
+        self.prices_stored = {'usd': id_array([]), 'btc': id_array([])}
+        self.snapshots.reset_counts()
+        plan = None
 
-        # Random skip to reduce API calls and run time
-        if random.random() < (page_number / ( max_page + 2 ))**0.4:
-            continue
+        try:
+            # Backpressure: let the flusher catch up if the spool is far behind (rows are kept either way)
+            if self.flusher and not self.flusher.wait_for_capacity(self.config.get('spool_max_pending_rows', 500000), 5):
+                self.log.error(f"Write spool is behind, {self.spool.pending_rows()} rows pending")
 
-        coins_list = cg.get_coins_with_market_data(page=page_number, vs_currency='btc')
-        api_page_calls += 1
+            with self.log.span('plan'):
+                if self.priorities_loaded_at is None or time.monotonic() - self.priorities_loaded_at >= priority_refresh_seconds:
+                    self.load_priorities()
 
-        for coin in coins_list:
-            # Update price data in continuous_btc_prices table
-            if (coin['id'] in btc_price_priority):
-                try:
-                    # Modify coin data to match continuous_usd_prices table
-                    price_data = {value: coin.get(key) for key, value in coins_market_data_to_continuous_prices.items()}
-
-                    # Add current utc timestamp
-                    price_data['created_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
-                    price_data['vol_24h'] = int(round(price_data['vol_24h']))
-                    
-                    # Insert price_data in to continuous_btc_prices table, print success message
-                    response = supabase.table("continuous_btc_prices") \
-                        .insert(price_data) \
-                        .execute()
-                    
-                    if response.data:   
-                        # print(f"Successfully added {coin['id']} BTC price data")
-                        total_btc_prices_added += 1
-                    else:
-                        log.error(f"Unknown Response when adding {coin['id']} BTC price data")
-                        print("Unknown Response:")
-                        print(response)
+                # Fetch exactly the scheduled coins, with whichever plan needs the fewest API calls
+                plan = self.plan_fetches()
 
-                except Exception as exception:
-                    log.error(f"Error adding {coin['id']} BTC price data", exception)
-                    print(exception)
-                    print(coin)        
-
-# Run Function in random order
-functions = [update_coins_and_usd_prices, update_btc_prices]
-random.shuffle(functions)
-for func in functions:
-    func()
-    if log.current_run_time_seconds() > max_run_time:
-        break
-    
-log.end(f"{max_page} max API page, {api_page_calls * 250} coins from API, {len(coins_to_update)} coins queued for update, {total_coins_updated} coins updated, {total_usd_prices_added} USD prices added, {total_btc_prices_added} BTC prices added")      
+            fetch_started = time.monotonic()
+            with self.log.span('fetch'):
+                responses = self.loop.run_until_complete(self.fetch(plan))
+            self.store_responses(responses)
+            self.scheduler.record_run(self.api_calls, time.monotonic() - fetch_started)
+
+            # Remember what was refreshed for the next runs between priority reloads
+            for currency, ids in self.prices_stored.items():
+                self.scheduler.mark_refreshed(currency, ids)
+            updated = set(self.run_coins_to_update.tolist())
+            self.coins_to_update = [coin_id for coin_id in self.coins_to_update if coin_id not in updated]
+
+            if time.monotonic() - self.prices_snapshot_at >= self.price_store_snapshot_seconds:
+                with self.log.span('snapshot'):
+                    self.snapshot_prices()
+
+        except Exception as exception:
+            self.log.error("Error collecting real time prices", exception)
+            raise
+
+        self.log.end(f"{plan.name} fetch plan, {len(plan)} of {self.call_budget} API calls planned, {self.api_calls} API calls, {self.coins_from_api} coins from API, {len(self.run_coins_to_update)} coins queued for update, {self.total_coins_updated} coins updated, {self.total_usd_prices_added} USD prices added, {self.total_btc_prices_added} BTC prices added, {self.snapshots.summary()}, {self.scheduler.staleness_summary()}{f', {self.spool.pending_rows()} rows in write spool' if self.spool else ''}{f', stopping on {self.stop_signal}' if self.stop_signal else ''}")
+
+    def run_daemon(self):
+        """Collect continuously until SIGTERM/SIGINT, finishing the current run before exiting"""
+        stop_requested = False
+
+        # The run in progress reports the signal in its end message
+        def request_stop(signum, frame):
+            nonlocal stop_requested
+            stop_requested = True
+            self.stop_signal = signal.Signals(signum).name
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        # Wait at least min_run_interval between run starts, market data is cached upstream for about a minute
+        min_run_interval = self.config.get('daemon_min_run_interval_seconds', 60)
+        priority_refresh_seconds = self.config.get('daemon_priority_refresh_seconds', 300)
+
+        while not stop_requested:
+            run_started = time.monotonic()
+            try:
+                self.run(priority_refresh_seconds)
+            except Exception:
+                pass # logged by run(), the next run starts after the interval as usual
+
+            # Sleep in short steps so a signal is handled promptly
+            while not stop_requested and time.monotonic() - run_started < min_run_interval:
+                time.sleep(min(1.0, min_run_interval - (time.monotonic() - run_started)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store real time prices from CoinGecko")
+    parser.add_argument('--daemon', action='store_true', help="run continuously until SIGTERM instead of once")
+    args = parser.parse_args()
+
+    # Load environment variables from .pip env file
+    load_dotenv()
+
+    try:
+        collector = RealTimePriceCollector(load_config())
+    except Exception as exception:
+        ScriptLogger("store_real_time_prices").error("Error starting price collector", exception)
+        raise
+
+    try:
+        if args.daemon:
+            collector.run_daemon()
+        else:
+            collector.run()
+    finally:
+        collector.close()
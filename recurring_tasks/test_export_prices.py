@@ -0,0 +1,40 @@
+import datetime
+from recurring_tasks.export_prices import export_until
+from storage.sqlite_storage import SqliteStorage
+from utils.write_spool import WriteSpool
+
+SETTLED = datetime.datetime(2026, 3, 10, 12, 0)
+
+def storage_with_watermarks(tmp_path, **watermarks):
+    storage = SqliteStorage(str(tmp_path / 'coingecko.sqlite'))
+    storage.write('consolidation_watermarks', [{'target_table': table, 'consolidated_until': until, 'updated_at': SETTLED}
+        for table, until in watermarks.items()])
+    return storage
+
+def test_continuous_prices_export_until_settled(tmp_path):
+    storage = storage_with_watermarks(tmp_path)
+    assert export_until('continuous_usd_prices', SETTLED, storage) == SETTLED
+    storage.close()
+
+def test_bars_stop_a_bucket_before_the_consolidation_watermark(tmp_path):
+    storage = storage_with_watermarks(tmp_path,
+        hourly_usd_prices = '2026-03-10T09:00:00', daily_usd_prices = '2026-03-08T00:00:00')
+    # The next consolidate_prices run rewrites 08:00 (and the 7th), they are not exported yet
+    assert export_until('hourly_usd_prices', SETTLED, storage) == datetime.datetime(2026, 3, 10, 8, 0)
+    assert export_until('daily_usd_prices', SETTLED, storage) == datetime.datetime(2026, 3, 7)
+    assert export_until('hourly_btc_prices', SETTLED, storage) is None
+
+    # A watermark ahead of the settle time leaves the settle time as the cap
+    assert export_until('hourly_usd_prices', datetime.datetime(2026, 3, 10, 7, 30), storage) == datetime.datetime(2026, 3, 10, 7, 30)
+    storage.close()
+
+def test_spooled_rows_hold_the_export_back(tmp_path):
+    storage = storage_with_watermarks(tmp_path, hourly_usd_prices = '2026-03-10T09:00:00')
+    spool = WriteSpool(str(tmp_path / 'spool.sqlite'))
+    spool.append('continuous_usd_prices', [{'coin_id': 'bitcoin', 'created_at': '2026-03-10T05:20:00', 'price': 1.0}])
+
+    assert export_until('continuous_usd_prices', SETTLED, storage, spool) == datetime.datetime(2026, 3, 10, 5, 20)
+    # The spooled row's bucket and the one before it are consolidated again
+    assert export_until('hourly_usd_prices', SETTLED, storage, spool) == datetime.datetime(2026, 3, 10, 4, 0)
+    spool.close()
+    storage.close()
@@ -0,0 +1,27 @@
+import os
+from utils.config import resolve_path
+from storage.base import Storage, group_by_columns
+
+# Storage backends of the recurring tasks, see storage/base.py for the interface
+#   supabase  PostgREST through the Supabase client (SUPABASE_URL, SUPABASE_KEY), the default
+#   postgres  direct connections with binary COPY writes (DATABASE_URL), needs psycopg
+#   sqlite    a local database file for development and tests (sqlite_database_file)
+# The backend is config's storage_backend, the STORAGE_BACKEND environment variable overrides it.
+
+BACKENDS = ('supabase', 'postgres', 'sqlite')
+
+def open_storage(config, timeout = 30):
+    """Storage backend selected by STORAGE_BACKEND or config's storage_backend"""
+    backend = os.getenv('STORAGE_BACKEND') or config.get('storage_backend', 'supabase')
+    if backend == 'supabase':
+        from storage.supabase_storage import SupabaseStorage
+        return SupabaseStorage(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"), timeout = timeout)
+    if backend == 'postgres':
+        from storage.postgres_storage import PostgresStorage
+        return PostgresStorage(os.getenv("DATABASE_URL"), config.get('postgres_schema', 'coingecko'),
+            max_connections = config.get('postgres_max_connections', 4), timeout = timeout,
+            bulk_chunk_size = config.get('postgres_copy_chunk_size', 20000))
+    if backend == 'sqlite':
+        from storage.sqlite_storage import SqliteStorage
+        return SqliteStorage(os.getenv("SQLITE_DATABASE_FILE") or resolve_path(config.get('sqlite_database_file', 'logs/coingecko.sqlite')))
+    raise ValueError(f"Unknown storage backend {backend}, expected one of {', '.join(BACKENDS)}")
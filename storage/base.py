@@ -0,0 +1,49 @@
+# Interface of the storage backends used by the recurring tasks
+# A backend reads and writes rows as dicts shaped like the PostgREST JSON the
+# tasks were written against: timestamps as ISO strings, JSONB as dicts/lists.
+#   write(table, rows, upsert, ignore_duplicates) -> rows written, errors are raised
+#   select(table, columns, filters, order, offset, limit) -> rows, filters are {column: value} equalities
+#   select_after(table, columns, time_column, after, until, limit) -> keyset page in (time_column, coin_id) order
+#   rpc(function, params, offset, limit) -> rows (or the value of a scalar function)
+#   is_transient(exception) -> True if a failed write is worth retrying as is
+
+# SQLSTATE classes of errors that go away on retry: connection, transaction rollback
+# (serialization, deadlock), insufficient resources, operator intervention
+TRANSIENT_SQLSTATES = ('08', '40', '53', '57')
+
+def group_by_columns(rows):
+    """Split rows into groups sharing their set of columns, returns [(columns, rows)] in first seen order"""
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row), []).append(row)
+    return list(groups.items())
+
+class Storage:
+    name = None
+    bulk_chunk_size = None # rows per write if the backend isn't bound by request sizes
+    partitioned = True # continuous price tables are monthly partitions (create/drop_consolidated_price_partitions)
+
+    def write(self, table, rows, upsert = False, ignore_duplicates = False):
+        raise NotImplementedError
+
+    def select(self, table, columns = '*', filters = None, order = None, offset = 0, limit = None):
+        raise NotImplementedError
+
+    def select_after(self, table, columns, time_column, after, until, limit):
+        raise NotImplementedError
+
+    def rpc(self, function, params = None, offset = 0, limit = None):
+        raise NotImplementedError
+
+    def is_transient(self, exception):
+        return True
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def order_columns(order):
+        """['id', 'currency'] of an order given as 'id, currency' or a list"""
+        if order is None:
+            return []
+        return [column.strip() for column in order.split(',')] if isinstance(order, str) else list(order)
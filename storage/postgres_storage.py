@@ -0,0 +1,205 @@
+import datetime
+import threading
+from decimal import Decimal
+from storage.base import Storage, TRANSIENT_SQLSTATES, group_by_columns
+
+# psycopg 3 and its pool are only needed for the direct PostgreSQL backend
+try:
+    import psycopg
+    from psycopg import sql
+    from psycopg.rows import dict_row
+    from psycopg.types.json import Jsonb, Json
+    from psycopg_pool import ConnectionPool
+except ImportError:
+    psycopg = None
+
+# Direct PostgreSQL backend (e.g. Supabase's database port, DATABASE_URL)
+# Writes are binary COPYs over pooled connections: inserts go straight into the
+# table, upserts are copied into a temporary table of the same shape and merged
+# with one INSERT ... SELECT ... ON CONFLICT, so a batch of thousands of rows is one
+# round trip without JSON encoding or PostgREST's row limits. Statement level
+# triggers (latest_prices) fire for COPY like for INSERT.
+# Values arrive in PostgREST form and are converted to the column types read from
+# the catalog, results are returned in PostgREST form (ISO timestamps, numbers).
+# Connections use schema as their search_path: the trigger and rpc functions of
+# custom_db_functions.sql name their tables without a schema, like PostgREST calls them.
+
+def to_timestamp(value):
+    """Naive UTC datetime of an ISO timestamp string (offsets converted to UTC)"""
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+def to_date(value):
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value[:10])
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+# Conversion of PostgREST values per column type (pg_type names, as used by COPY set_types)
+CONVERTERS = {
+    'timestamp': to_timestamp,
+    'timestamptz': lambda value: datetime.datetime.fromisoformat(value.replace('Z', '+00:00')) if isinstance(value, str) else value,
+    'date': to_date,
+    'float8': float,
+    'float4': float,
+    'numeric': lambda value: Decimal(str(value)),
+    'int8': int,
+    'int4': int,
+    'int2': int,
+    'bool': bool,
+    'jsonb': lambda value: Jsonb(value),
+    'json': lambda value: Json(value),
+}
+
+def to_json_value(value):
+    """PostgREST form of a value read from the database"""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+class PostgresStorage(Storage):
+    name = 'postgres'
+
+    def __init__(self, conninfo, schema = 'coingecko', min_connections = 1, max_connections = 4, timeout = 30, bulk_chunk_size = 20000):
+        if psycopg is None:
+            raise ImportError("The postgres storage backend needs psycopg (pip install 'psycopg[binary,pool]')")
+        self.schema = schema
+        self.bulk_chunk_size = bulk_chunk_size
+        self.pool = ConnectionPool(conninfo, min_size = min_connections, max_size = max_connections, timeout = timeout,
+            kwargs = {'row_factory': dict_row, 'options': f'-c statement_timeout={int(timeout * 1000)} -c search_path={schema}'}, open = True)
+        self.__lock = threading.Lock()
+        self.__column_types = {} # table -> {column: pg_type name}
+        self.__primary_keys = {} # table -> [column]
+
+    def close(self):
+        self.pool.close()
+
+    def write(self, table, rows, upsert = False, ignore_duplicates = False):
+        """COPY rows into table (through a staging table for upserts), returns the rows inserted or updated"""
+        if not rows:
+            return 0
+        column_types, primary_key = self.__table_info(table)
+        written = 0
+
+        # Rows without a column keep its current value (upsert) or default (insert), like PostgREST
+        with self.pool.connection() as connection:
+            for columns, group in group_by_columns(rows):
+                unknown = [column for column in columns if column not in column_types]
+                if unknown:
+                    raise ValueError(f"Unknown columns {', '.join(unknown)} in {table}")
+                target = sql.Identifier(self.schema, table)
+                column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+
+                with connection.cursor() as cursor:
+                    if not upsert:
+                        written += self.__copy(cursor, target, columns, column_types, group)
+                        continue
+
+                    if not primary_key:
+                        raise ValueError(f"Can't upsert into {table}, it has no primary key")
+                    stage = sql.Identifier(f'stage_{table}')
+                    cursor.execute(sql.SQL('CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP').format(stage, target))
+                    self.__copy(cursor, stage, columns, column_types, group)
+                    updates = [column for column in columns if column not in primary_key]
+                    if ignore_duplicates or not updates:
+                        conflict = sql.SQL('DO NOTHING')
+                    else:
+                        conflict = sql.SQL('DO UPDATE SET {}').format(sql.SQL(', ').join(
+                            sql.SQL('{0} = EXCLUDED.{0}').format(sql.Identifier(column)) for column in updates))
+                    cursor.execute(sql.SQL('INSERT INTO {target} ({columns}) SELECT {columns} FROM {stage} ON CONFLICT ({key}) {conflict}').format(
+                        target = target, columns = column_list, stage = stage,
+                        key = sql.SQL(', ').join(map(sql.Identifier, primary_key)), conflict = conflict))
+                    written += cursor.rowcount
+                    cursor.execute(sql.SQL('DROP TABLE {}').format(stage))
+        return written
+
+    def select(self, table, columns = '*', filters = None, order = None, offset = 0, limit = None):
+        columns = [column.strip() for column in columns.split(',')] if isinstance(columns, str) else list(columns)
+        query = sql.SQL('SELECT {} FROM {}').format(
+            sql.SQL('*') if columns == ['*'] else sql.SQL(', ').join(map(sql.Identifier, columns)),
+            sql.Identifier(self.schema, table))
+        params = []
+        if filters:
+            query += sql.SQL(' WHERE ') + sql.SQL(' AND ').join(sql.SQL('{} = %s').format(sql.Identifier(column)) for column in filters)
+            params.extend(filters.values())
+        return self.__fetch(query + self.__order_offset_limit(order, offset, limit), params)
+
+    def select_after(self, table, columns, time_column, after, until, limit):
+        time_identifier = sql.Identifier(time_column)
+        query = sql.SQL('SELECT {} FROM {} WHERE {} < %s').format(
+            sql.SQL(', ').join(map(sql.Identifier, columns)), sql.Identifier(self.schema, table), time_identifier)
+        params = [until]
+        if after:
+            query += sql.SQL(' AND ({}, coin_id) > (%s, %s)').format(time_identifier)
+            params.extend(after)
+        return self.__fetch(query + self.__order_offset_limit([time_column, 'coin_id'], 0, limit), params)
+
+    def rpc(self, function, params = None, offset = 0, limit = None):
+        """Rows of a set returning function, the value of a scalar one"""
+        params = params or {}
+        query = sql.SQL('SELECT * FROM {}({})').format(sql.Identifier(self.schema, function),
+            sql.SQL(', ').join(sql.SQL('{} => %s').format(sql.Identifier(name)) for name in params))
+        rows = self.__fetch(query + self.__order_offset_limit(None, offset, limit), list(params.values()))
+        if len(rows) == 1 and list(rows[0]) == [function]:
+            return rows[0][function]
+        return rows
+
+    def is_transient(self, exception):
+        sqlstate = getattr(exception, 'sqlstate', None)
+        if sqlstate:
+            return sqlstate[:2] in TRANSIENT_SQLSTATES
+        if isinstance(exception, (ValueError, TypeError, KeyError)):
+            return False
+        return True
+
+    def __copy(self, cursor, target, columns, column_types, rows):
+        """Binary COPY of rows into target, returns the rows copied"""
+        types = [column_types[column] for column in columns]
+        converters = [CONVERTERS.get(column_type) for column_type in types]
+        statement = sql.SQL('COPY {} ({}) FROM STDIN (FORMAT BINARY)').format(target, sql.SQL(', ').join(map(sql.Identifier, columns)))
+        with cursor.copy(statement) as copy:
+            copy.set_types(types)
+            for row in rows:
+                copy.write_row([value if value is None or convert is None else convert(value)
+                    for value, convert in zip((row[column] for column in columns), converters)])
+        return len(rows)
+
+    def __fetch(self, query, params):
+        with self.pool.connection() as connection:
+            rows = connection.execute(query, params).fetchall()
+        return [{column: to_json_value(value) for column, value in row.items()} for row in rows]
+
+    @staticmethod
+    def __order_offset_limit(order, offset, limit):
+        query = sql.SQL('')
+        columns = Storage.order_columns(order)
+        if columns:
+            query += sql.SQL(' ORDER BY ') + sql.SQL(', ').join(map(sql.Identifier, columns))
+        if offset:
+            query += sql.SQL(' OFFSET {}').format(sql.Literal(int(offset)))
+        if limit is not None:
+            query += sql.SQL(' LIMIT {}').format(sql.Literal(int(limit)))
+        return query
+
+    def __table_info(self, table):
+        """Column types and primary key of a table, read from the catalog once"""
+        with self.__lock:
+            if table not in self.__column_types:
+                with self.pool.connection() as connection:
+                    columns = connection.execute(
+                        'SELECT column_name, udt_name FROM information_schema.columns WHERE table_schema = %s AND table_name = %s',
+                        (self.schema, table)).fetchall()
+                    if not columns:
+                        raise ValueError(f"Table {self.schema}.{table} does not exist")
+                    key = connection.execute(
+                        """SELECT a.attname FROM pg_index i
+                           JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+                           WHERE i.indrelid = %s::regclass AND i.indisprimary""",
+                        (f'{self.schema}.{table}',)).fetchall()
+                self.__column_types[table] = {row['column_name']: row['udt_name'] for row in columns}
+                self.__primary_keys[table] = [row['attname'] for row in key]
+            return self.__column_types[table], self.__primary_keys[table]
@@ -0,0 +1,297 @@
+import os
+import json
+import sqlite3
+import datetime
+import threading
+import numpy as np
+from storage.base import Storage, group_by_columns
+from utils.price_rollups import SnapshotIntervals, bars_to_rows, HOUR, DAY
+
+# Local SQLite backend for development and tests
+# Creates the tables of coingecko_schema.sql the tasks read and write (without
+# partitions), keeps latest_prices current with triggers like the PostgreSQL
+# schema and implements coins_to_update(), price_freshness() and consolidate_prices()
+# (with utils/price_rollups) in Python. The tables aren't partitioned, there are no
+# partitions to create or drop.
+# Values are stored in PostgREST form: timestamps as naive UTC ISO strings,
+# JSONB as JSON text, booleans as 0/1 (returned as booleans).
+# coins.updated_at keeps the collector's timestamp, coins_to_update() compares it to the hour.
+
+# Primary key and column types per table (the continuous price tables have no primary key)
+TABLES = {
+    'coins': (['id'], {
+        'id': 'text', 'symbol': 'text', 'name': 'text', 'website': 'text', 'image_url': 'text',
+        'market_cap_rank': 'integer', 'market_cap_usd': 'integer', 'fully_diluted_valuation': 'integer',
+        'total_supply': 'real', 'max_supply': 'real', 'circulating_supply': 'real', 'platforms': 'json',
+        'update_hourly': 'boolean', 'track_prices': 'boolean', 'usd_stable_coin': 'boolean', 'wrapped_coin': 'boolean',
+        'archived': 'boolean', 'updated_at': 'timestamp', 'added_on': 'date'
+    }),
+    'latest_prices': (['coin_id', 'currency'], {
+        'coin_id': 'text', 'currency': 'text', 'api_last_updated': 'timestamp', 'created_at': 'timestamp', 'price': 'real',
+        'vol_24h': 'integer', 'high_24h': 'real', 'low_24h': 'real', 'price_change_percentage_24h': 'real'
+    }),
+    'consolidation_watermarks': (['target_table'], {'target_table': 'text', 'consolidated_until': 'timestamp', 'updated_at': 'timestamp'})
+}
+for currency in ('usd', 'btc'):
+    TABLES[f'continuous_{currency}_prices'] = (None, {
+        'coin_id': 'text', 'api_last_updated': 'timestamp', 'created_at': 'timestamp', 'price': 'real',
+        'vol_24h': 'integer', 'high_24h': 'real', 'low_24h': 'real', 'price_change_percentage_24h': 'real'
+    })
+for table, time_column in (('hourly_usd_prices', 'hour'), ('hourly_btc_prices', 'hour'), ('daily_usd_prices', 'day')):
+    TABLES[table] = (['coin_id', time_column], {
+        'coin_id': 'text', time_column: 'timestamp' if time_column == 'hour' else 'date', 'open': 'real', 'high': 'real',
+        'low': 'real', 'close': 'real', 'vwap': 'real', 'twap': 'real', 'volume': 'integer', 'price_snapshots': 'integer'
+    })
+del TABLES['hourly_btc_prices'][1]['volume']
+
+DEFAULTS = {
+    'coins': {'update_hourly': '0', 'track_prices': '0', 'usd_stable_coin': '0', 'wrapped_coin': '0', 'archived': '0',
+        'updated_at': "'0001-01-01T00:00:00'", 'added_on': "(date('now'))"}
+}
+
+LATEST_PRICES_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS continuous_{currency}_prices_latest_prices AFTER INSERT ON continuous_{currency}_prices
+    BEGIN
+        INSERT INTO latest_prices (coin_id, currency, api_last_updated, created_at, price, vol_24h, high_24h, low_24h, price_change_percentage_24h)
+        VALUES (NEW.coin_id, '{currency}', NEW.api_last_updated, NEW.created_at, NEW.price, NEW.vol_24h, NEW.high_24h, NEW.low_24h, NEW.price_change_percentage_24h)
+        ON CONFLICT (coin_id, currency) DO UPDATE SET
+            api_last_updated = excluded.api_last_updated, created_at = excluded.created_at, price = excluded.price,
+            vol_24h = excluded.vol_24h, high_24h = excluded.high_24h, low_24h = excluded.low_24h,
+            price_change_percentage_24h = excluded.price_change_percentage_24h
+        WHERE latest_prices.created_at <= excluded.created_at;
+    END
+"""
+
+# Rows older than a consolidation watermark move it back to their bucket, like rewind_consolidation_watermarks()
+REWIND_WATERMARKS_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS continuous_{currency}_prices_late_rows AFTER INSERT ON continuous_{currency}_prices
+    BEGIN
+        UPDATE consolidation_watermarks
+        SET consolidated_until = strftime(CASE WHEN target_table = 'daily_usd_prices' THEN '%Y-%m-%dT00:00:00' ELSE '%Y-%m-%dT%H:00:00' END, NEW.created_at),
+            updated_at = strftime('%Y-%m-%dT%H:%M:%S', 'now')
+        WHERE target_table IN ({targets}) AND consolidated_until > NEW.created_at;
+    END
+"""
+
+# Source table, bucket size and columns of the consolidation targets, see consolidate_prices()
+CONSOLIDATION_TARGETS = {
+    'hourly_usd_prices': ('continuous_usd_prices', HOUR, 'hour'),
+    'hourly_btc_prices': ('continuous_btc_prices', HOUR, 'hour'),
+    'daily_usd_prices': ('continuous_usd_prices', DAY, 'day')
+}
+
+def to_timestamp(value):
+    """Naive UTC ISO string of an ISO timestamp (offsets converted to UTC)"""
+    value = datetime.datetime.fromisoformat(value.replace('Z', '+00:00')) if isinstance(value, str) else value
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value.isoformat()
+
+# Stored form per column type, and the PostgREST form read back
+TO_SQLITE = {
+    'timestamp': to_timestamp,
+    'date': lambda value: str(value)[:10],
+    'json': json.dumps,
+    'boolean': int,
+    'real': float # NUMERIC(32,0) supplies may exceed SQLite's 64 bit integers
+}
+FROM_SQLITE = {
+    'json': json.loads,
+    'boolean': bool
+}
+
+class SqliteStorage(Storage):
+    name = 'sqlite'
+    bulk_chunk_size = 10000
+    partitioned = False
+
+    def __init__(self, database_file):
+        directory = os.path.dirname(os.path.abspath(database_file))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.database_file = database_file
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(database_file, timeout = 30, isolation_level = None, check_same_thread = False)
+        self.__connection.row_factory = sqlite3.Row
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=NORMAL')
+        self.__create_tables()
+
+    def close(self):
+        self.__connection.close()
+
+    def write(self, table, rows, upsert = False, ignore_duplicates = False):
+        primary_key, column_types = self.__table(table)
+        written = 0
+        with self.__lock:
+            self.__connection.execute('BEGIN IMMEDIATE')
+            try:
+                for columns, group in group_by_columns(rows):
+                    unknown = [column for column in columns if column not in column_types]
+                    if unknown:
+                        raise ValueError(f"Unknown columns {', '.join(unknown)} in {table}")
+                    statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+                    if upsert:
+                        updates = [column for column in columns if column not in primary_key]
+                        if ignore_duplicates or not updates:
+                            statement += f" ON CONFLICT ({', '.join(primary_key)}) DO NOTHING"
+                        else:
+                            statement += f" ON CONFLICT ({', '.join(primary_key)}) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in updates)}"
+                    converters = [TO_SQLITE.get(column_types[column]) for column in columns]
+                    cursor = self.__connection.executemany(statement, [
+                        [value if value is None or convert is None else convert(value) for value, convert in zip((row[column] for column in columns), converters)]
+                        for row in group])
+                    written += cursor.rowcount
+                self.__connection.execute('COMMIT')
+            except BaseException:
+                self.__connection.execute('ROLLBACK')
+                raise
+        return written
+
+    def select(self, table, columns = '*', filters = None, order = None, offset = 0, limit = None):
+        _, column_types = self.__table(table)
+        columns = [column.strip() for column in columns.split(',')] if isinstance(columns, str) else list(columns)
+        columns = list(column_types) if columns == ['*'] else columns
+        statement = f"SELECT {', '.join(columns)} FROM {table}"
+        params = []
+        if filters:
+            statement += ' WHERE ' + ' AND '.join(f'{column} = ?' for column in filters)
+            params = [TO_SQLITE.get(column_types[column], lambda value: value)(value) for column, value in filters.items()]
+        return self.__fetch(table, statement + self.__order_offset_limit(order, offset, limit), params)
+
+    def select_after(self, table, columns, time_column, after, until, limit):
+        statement = f"SELECT {', '.join(columns)} FROM {table} WHERE {time_column} < ?"
+        params = [until]
+        if after:
+            statement += f' AND ({time_column}, coin_id) > (?, ?)'
+            params.extend(after)
+        return self.__fetch(table, statement + self.__order_offset_limit([time_column, 'coin_id'], 0, limit), params)
+
+    def rpc(self, function, params = None, offset = 0, limit = None):
+        """coins_to_update(), price_freshness() and consolidate_prices() of custom_db_functions.sql"""
+        if function == 'coins_to_update':
+            rows = self.__fetch('coins', """
+                SELECT id, update_hourly, updated_at, market_cap_rank FROM coins
+                WHERE (update_hourly = 1 AND updated_at < strftime('%Y-%m-%dT%H:%M:%S', 'now', '-1 hour')) OR id IN (
+                    SELECT id FROM coins
+                    ORDER BY market_cap_rank - (julianday('now') - julianday(updated_at)) * 1440, random()
+                    LIMIT ?
+                )""", [(params or {}).get('p_limit', 2000)])
+        elif function == 'price_freshness':
+            rows = self.__fetch('latest_prices', """
+                SELECT c.id AS coin_id, usd.vol_24h, usd.price, usd.high_24h, usd.low_24h, usd.price_change_percentage_24h,
+                    usd.created_at AS usd_created_at, btc.created_at AS btc_created_at
+                FROM coins c
+                LEFT JOIN latest_prices usd ON usd.coin_id = c.id AND usd.currency = 'usd'
+                LEFT JOIN latest_prices btc ON btc.coin_id = c.id AND btc.currency = 'btc'
+                WHERE c.track_prices = 1 AND c.archived = 0
+                ORDER BY c.id""", [])
+        elif function == 'consolidate_prices':
+            rows = [self.__consolidate_prices(params['p_target'], datetime.timedelta(days = 7))]
+        else:
+            raise NotImplementedError(f"{function}() is not available in the SQLite storage backend")
+        return rows[offset:offset + limit] if limit is not None else rows[offset:]
+
+    def is_transient(self, exception):
+        return isinstance(exception, sqlite3.OperationalError) and 'locked' in str(exception)
+
+    def __consolidate_prices(self, target, max_window):
+        """Upserts the bars of the next window after target's watermark and moves the watermark, like consolidate_prices()"""
+        if target not in CONSOLIDATION_TARGETS:
+            raise ValueError(f"Unknown consolidation target: {target}")
+        source, bucket_seconds, bucket_column = CONSOLIDATION_TARGETS[target]
+        bucket = datetime.timedelta(seconds = bucket_seconds)
+
+        def floor(value):
+            return datetime.datetime.fromtimestamp(value.timestamp() // bucket_seconds * bucket_seconds, datetime.timezone.utc).replace(tzinfo=None)
+
+        # Only buckets that are already closed are consolidated
+        end = floor(datetime.datetime.now(datetime.timezone.utc))
+        watermark = self.select('consolidation_watermarks', 'consolidated_until', {'target_table': target})
+        if watermark:
+            window_from = datetime.datetime.fromisoformat(watermark[0]['consolidated_until'])
+        else:
+            oldest = self.__fetch(source, f'SELECT MIN(created_at) AS created_at FROM {source}', [])[0]['created_at']
+            if oldest is None:
+                return {'bars_upserted': 0, 'window_end': None, 'caught_up': True}
+            window_from = floor(datetime.datetime.fromisoformat(oldest).replace(tzinfo = datetime.timezone.utc))
+        window_to = min(end, window_from + max_window)
+        if window_to <= window_from:
+            return {'bars_upserted': 0, 'window_end': window_from.isoformat(), 'caught_up': True}
+
+        # The bucket before the window is consolidated again, each coin's last earlier row (however old,
+        # like the CarryOver of price_bars()) starts its first interval
+        rows_from = window_from - bucket
+        snapshots = self.__fetch(source, f"""
+            SELECT coin_id, created_at, price, vol_24h FROM (
+                SELECT coin_id, MAX(created_at) AS created_at, price, vol_24h FROM {source}
+                WHERE created_at < ? AND coin_id IN (SELECT coin_id FROM {source} WHERE created_at >= ? AND created_at < ?)
+                GROUP BY coin_id
+                UNION ALL
+                SELECT coin_id, created_at, price, vol_24h FROM {source}
+                WHERE created_at >= ? AND created_at < ?
+            )
+            ORDER BY coin_id, created_at""", [rows_from.isoformat()] + [rows_from.isoformat(), window_to.isoformat()] * 2)
+        rows = []
+        if snapshots:
+            bars = SnapshotIntervals(
+                [row['coin_id'] for row in snapshots],
+                np.array([row['created_at'] for row in snapshots], dtype='datetime64[us]'),
+                [np.nan if row['price'] is None else row['price'] for row in snapshots],
+                [np.nan if row['vol_24h'] is None else row['vol_24h'] for row in snapshots]
+            ).bars(bucket_seconds)
+            in_window = bars['bucket_start'] >= np.datetime64(rows_from, 's')
+            bars = {column: values[in_window] for column, values in bars.items()}
+            if target == 'hourly_btc_prices':
+                del bars['volume']
+            rows = bars_to_rows(bars, bucket_column)
+        bars_upserted = self.write(target, rows, upsert = True) if rows else 0
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.write('consolidation_watermarks', [{'target_table': target, 'consolidated_until': window_to, 'updated_at': now}], upsert = True)
+        return {'bars_upserted': bars_upserted, 'window_end': window_to.isoformat(), 'caught_up': window_to >= end}
+
+    def __table(self, table):
+        if table not in TABLES:
+            raise ValueError(f"Table {table} does not exist in the SQLite storage backend")
+        return TABLES[table]
+
+    def __fetch(self, table, statement, params):
+        _, column_types = TABLES[table]
+        with self.__lock:
+            rows = self.__connection.execute(statement, params).fetchall()
+        converted = []
+        for row in rows:
+            values = {}
+            for column in row.keys():
+                value = row[column]
+                convert = FROM_SQLITE.get(column_types.get(column))
+                values[column] = value if value is None or convert is None else convert(value)
+            converted.append(values)
+        return converted
+
+    @staticmethod
+    def __order_offset_limit(order, offset, limit):
+        statement = ''
+        columns = Storage.order_columns(order)
+        if columns:
+            statement += f" ORDER BY {', '.join(columns)}"
+        if limit is not None or offset:
+            statement += f" LIMIT {int(limit) if limit is not None else -1} OFFSET {int(offset)}"
+        return statement
+
+    def __create_tables(self):
+        with self.__lock:
+            for table, (primary_key, column_types) in TABLES.items():
+                columns = [f"{column} {'TEXT' if column_type in ('timestamp', 'date', 'json') else column_type.upper()}"
+                    + (f' DEFAULT {DEFAULTS[table][column]}' if column in DEFAULTS.get(table, {}) else '')
+                    for column, column_type in column_types.items()]
+                if primary_key:
+                    columns.append(f"PRIMARY KEY ({', '.join(primary_key)})")
+                self.__connection.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)})")
+                if primary_key is None:
+                    self.__connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_coin_id_created_at_idx ON {table} (coin_id, created_at)')
+            for currency in ('usd', 'btc'):
+                self.__connection.execute(LATEST_PRICES_TRIGGER.format(currency=currency))
+                targets = [target for target, (source, _, _) in CONSOLIDATION_TARGETS.items() if source == f'continuous_{currency}_prices']
+                self.__connection.execute(REWIND_WATERMARKS_TRIGGER.format(currency=currency, targets=', '.join(f"'{target}'" for target in targets)))
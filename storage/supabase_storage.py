@@ -0,0 +1,57 @@
+from supabase import create_client, Client
+from supabase.client import ClientOptions
+from postgrest.exceptions import APIError
+from storage.base import Storage, TRANSIENT_SQLSTATES, group_by_columns
+
+# Supabase (PostgREST) backend, one HTTP round trip per write, select page or function call
+# PostgREST takes the columns of a bulk write from its first row (missing keys become NULL),
+# so rows are written in groups that share their columns, like the COPY groups of PostgresStorage.
+class SupabaseStorage(Storage):
+    name = 'supabase'
+
+    def __init__(self, url, key, schema = 'coingecko', timeout = 30):
+        self.client: Client = create_client(url, key,
+          options=ClientOptions(
+            postgrest_client_timeout=timeout,
+            schema=schema,
+          ))
+
+    def write(self, table, rows, upsert = False, ignore_duplicates = False):
+        written = 0
+        for _, group in group_by_columns(rows):
+            query = self.client.table(table)
+            query = query.upsert(group, ignore_duplicates = ignore_duplicates) if upsert else query.insert(group)
+            written += len(query.execute().data or [])
+        return written
+
+    def select(self, table, columns = '*', filters = None, order = None, offset = 0, limit = None):
+        query = self.client.table(table).select(columns if isinstance(columns, str) else ','.join(columns))
+        for column, value in (filters or {}).items():
+            query = query.eq(column, value)
+        for column in self.order_columns(order):
+            query = query.order(column)
+        if limit is not None:
+            query = query.range(offset, offset + limit - 1)
+        elif offset:
+            query = query.offset(offset)
+        return query.execute().data
+
+    def select_after(self, table, columns, time_column, after, until, limit):
+        query = self.client.table(table).select(','.join(columns)).lt(time_column, until)
+        if after:
+            time, coin_id = after
+            query = query.or_(f'{time_column}.gt."{time}",and({time_column}.eq."{time}",coin_id.gt."{coin_id}")')
+        return query.order(time_column).order('coin_id').limit(limit).execute().data
+
+    def rpc(self, function, params = None, offset = 0, limit = None):
+        query = self.client.rpc(function, params or {})
+        if limit is not None:
+            query = query.range(offset, offset + limit - 1)
+        return query.execute().data
+
+    def is_transient(self, exception):
+        if isinstance(exception, APIError):
+            return str(exception.code or '')[:2] in TRANSIENT_SQLSTATES
+        if isinstance(exception, (ValueError, TypeError, KeyError)):
+            return False
+        return True
@@ -0,0 +1,68 @@
+import pytest
+from utils.testing import create_coingecko_database
+
+# PostgresStorage against the coingecko schema on an embedded PostgreSQL (pgserver)
+@pytest.fixture(scope = 'module')
+def storage(postgres_server):
+    pytest.importorskip('psycopg_pool')
+    from storage.postgres_storage import PostgresStorage
+    storage = PostgresStorage(create_coingecko_database(postgres_server, 'postgres_storage'))
+    yield storage
+    storage.close()
+
+def price_rows(coin_id, timestamps, price = 1.0):
+    return [{'coin_id': coin_id, 'created_at': timestamp, 'api_last_updated': timestamp + 'Z', 'price': price + i, 'vol_24h': 24000 + i}
+        for i, timestamp in enumerate(timestamps)]
+
+def test_copy_fires_the_latest_prices_trigger(storage):
+    storage.write('coins', [{'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin', 'track_prices': True}])
+    rows = price_rows('bitcoin', ['2026-01-01T10:30:00', '2026-01-01T11:30:00', '2026-01-01T11:10:00'])
+    assert storage.write('continuous_usd_prices', rows) == 3
+
+    latest = storage.select('latest_prices', 'coin_id, currency, created_at, price', {'currency': 'usd'})
+    assert latest == [{'coin_id': 'bitcoin', 'currency': 'usd', 'created_at': '2026-01-01T11:30:00', 'price': 2.0}]
+    freshness = storage.rpc('price_freshness')
+    assert [(row['coin_id'], row['usd_created_at'], row['btc_created_at']) for row in freshness] == [('bitcoin', '2026-01-01T11:30:00', None)]
+
+def test_upsert_groups_rows_by_their_columns(storage):
+    storage.write('coins', [
+        {'id': 'ethereum', 'symbol': 'eth', 'name': 'Ethereum', 'market_cap_rank': 2},
+        {'id': 'solana', 'symbol': 'sol', 'name': 'Solana', 'market_cap_rank': 5, 'platforms': {'solana': 'native'}}
+    ], upsert = True)
+    # A row without market_cap_rank keeps the stored one, ignore_duplicates keeps existing rows as they are
+    storage.write('coins', [
+        {'id': 'ethereum', 'symbol': 'eth', 'name': 'Ether'},
+        {'id': 'solana', 'symbol': 'sol', 'name': 'Solana', 'archived': True}
+    ], upsert = True)
+    storage.write('coins', [{'id': 'ethereum', 'symbol': 'eth', 'name': 'Ignored'}], upsert = True, ignore_duplicates = True)
+
+    coins = storage.select('coins', 'id, name, market_cap_rank, platforms, archived', order = 'id', offset = 1)
+    assert coins == [
+        {'id': 'ethereum', 'name': 'Ether', 'market_cap_rank': 2, 'platforms': None, 'archived': False},
+        {'id': 'solana', 'name': 'Solana', 'market_cap_rank': 5, 'platforms': {'solana': 'native'}, 'archived': True}
+    ]
+    assert [coin['id'] for coin in storage.rpc('coins_to_update', {'p_limit': 10})] != []
+    with pytest.raises(ValueError):
+        storage.write('coins', [{'id': 'bitcoin', 'unknown': 1}])
+
+def test_consolidate_prices_and_late_rows_rewind_the_watermark(storage):
+    result = storage.rpc('consolidate_prices', {'p_target': 'hourly_usd_prices', 'p_max_window': '1 day'})
+    assert result == [{'bars_upserted': 2, 'window_end': '2026-01-02T10:00:00', 'caught_up': False}]
+    bars = storage.select('hourly_usd_prices', 'coin_id, hour, price_snapshots', order = 'hour')
+    assert bars == [
+        {'coin_id': 'bitcoin', 'hour': '2026-01-01T10:00:00', 'price_snapshots': 1},
+        {'coin_id': 'bitcoin', 'hour': '2026-01-01T11:00:00', 'price_snapshots': 2}
+    ]
+
+    storage.write('continuous_usd_prices', price_rows('bitcoin', ['2026-01-01T12:45:00']))
+    watermark = storage.select('consolidation_watermarks', 'consolidated_until', {'target_table': 'hourly_usd_prices'})
+    assert watermark == [{'consolidated_until': '2026-01-01T12:00:00'}]
+
+def test_select_after_pages_in_time_and_coin_order(storage):
+    storage.write('continuous_btc_prices', price_rows('ethereum', ['2026-01-01T00:00:00', '2026-01-01T00:05:00']) +
+        price_rows('bitcoin', ['2026-01-01T00:00:00', '2026-01-01T00:10:00']))
+    columns = ['coin_id', 'created_at']
+    page = storage.select_after('continuous_btc_prices', columns, 'created_at', None, '2026-01-01T00:10:00', 2)
+    assert [(row['coin_id'], row['created_at']) for row in page] == [('bitcoin', '2026-01-01T00:00:00'), ('ethereum', '2026-01-01T00:00:00')]
+    page = storage.select_after('continuous_btc_prices', columns, 'created_at', ('2026-01-01T00:00:00', 'ethereum'), '2026-01-01T00:10:00', 2)
+    assert [(row['coin_id'], row['created_at']) for row in page] == [('ethereum', '2026-01-01T00:05:00')]
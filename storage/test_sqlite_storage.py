@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from storage.sqlite_storage import SqliteStorage
+from utils.price_rollups import price_bars, HOUR
+
+def price_rows(coin_id, timestamps, prices, volumes):
+    return [{'coin_id': coin_id, 'created_at': timestamp, 'api_last_updated': timestamp, 'price': price, 'vol_24h': volume}
+        for timestamp, price, volume in zip(timestamps, prices, volumes)]
+
+def test_consolidation_after_a_long_gap_keeps_the_carried_over_interval(tmp_path):
+    storage = SqliteStorage(str(tmp_path / 'coingecko.sqlite'))
+    # The coin was paused for three days, the interval into the window starts long before it
+    timestamps = ['2026-01-01T10:30:00', '2026-01-01T11:30:00', '2026-01-04T10:10:00', '2026-01-04T10:50:00']
+    prices, volumes = [10.0, 11.0, 14.0, 15.0], [24000, 24100, 30000, 30100]
+    storage.write('continuous_usd_prices', price_rows('bitcoin', timestamps, prices, volumes))
+    storage.write('consolidation_watermarks', [{'target_table': 'hourly_usd_prices', 'consolidated_until': '2026-01-04T01:00:00', 'updated_at': '2026-01-04T01:00:00'}])
+
+    storage.rpc('consolidate_prices', {'p_target': 'hourly_usd_prices'})
+    bars = storage.select('hourly_usd_prices', order = 'hour')
+    expected = price_bars(['bitcoin'] * 4, np.array(timestamps, dtype='datetime64[s]'), prices, np.array(volumes, dtype=np.float64), HOUR)
+    in_window = expected['bucket_start'] >= np.datetime64('2026-01-04T00:00:00', 's')
+
+    assert [bar['hour'] for bar in bars] == expected['bucket_start'][in_window].astype(str).tolist()
+    assert bars[0]['volume'] > 1000 # a share of the 2.9 day interval's volume
+    assert [bar['volume'] for bar in bars] == expected['volume'][in_window].tolist()
+    storage.close()
+
+def test_rows_round_trip_in_postgrest_form(tmp_path):
+    storage = SqliteStorage(str(tmp_path / 'coingecko.sqlite'))
+    storage.write('coins', [
+        {'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin', 'market_cap_rank': 1, 'platforms': {}, 'track_prices': True},
+        {'id': 'solana', 'symbol': 'sol', 'name': 'Solana', 'market_cap_rank': 5}
+    ])
+    # Upserts only set the columns of each row group, ignore_duplicates keeps existing rows
+    storage.write('coins', [{'id': 'solana', 'archived': True}, {'id': 'bitcoin', 'name': 'Bitcoin Core'}], upsert = True)
+    storage.write('coins', [{'id': 'bitcoin', 'name': 'Ignored'}], upsert = True, ignore_duplicates = True)
+
+    coins = storage.select('coins', 'id, name, market_cap_rank, platforms, track_prices, archived', order = 'id')
+    assert coins == [
+        {'id': 'bitcoin', 'name': 'Bitcoin Core', 'market_cap_rank': 1, 'platforms': {}, 'track_prices': True, 'archived': False},
+        {'id': 'solana', 'name': 'Solana', 'market_cap_rank': 5, 'platforms': None, 'track_prices': False, 'archived': True}
+    ]
+    assert storage.select('coins', 'id', {'archived': True}) == [{'id': 'solana'}]
+    assert [coin['id'] for coin in storage.rpc('coins_to_update', {'p_limit': 1})] == ['bitcoin']
+    with pytest.raises(ValueError):
+        storage.write('coins', [{'id': 'bitcoin', 'unknown': 1}])
+    storage.close()
+
+def test_latest_prices_and_late_rows_follow_the_postgres_triggers(tmp_path):
+    storage = SqliteStorage(str(tmp_path / 'coingecko.sqlite'))
+    storage.write('coins', [{'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin', 'track_prices': True}])
+    timestamps = ['2026-01-01T10:30:00', '2026-01-01T11:30:00', '2026-01-01T11:10:00']
+    storage.write('continuous_usd_prices', price_rows('bitcoin', timestamps, [1.0, 2.0, 3.0], [24000, 24100, 24200]))
+
+    freshness = storage.rpc('price_freshness')
+    assert [(row['coin_id'], row['price'], row['usd_created_at'], row['btc_created_at']) for row in freshness] == [
+        ('bitcoin', 2.0, '2026-01-01T11:30:00', None)]
+
+    assert storage.rpc('consolidate_prices', {'p_target': 'daily_usd_prices'})[0]['bars_upserted'] == 1
+    storage.write('consolidation_watermarks', [{'target_table': 'hourly_usd_prices', 'consolidated_until': '2026-01-01T12:00:00',
+        'updated_at': '2026-01-01T12:00:00'}], upsert = True)
+    storage.write('continuous_usd_prices', price_rows('bitcoin', ['2026-01-01T10:45:00'], [4.0], [24300]))
+    watermarks = storage.select('consolidation_watermarks', 'target_table, consolidated_until', order = 'target_table')
+    assert watermarks == [
+        {'target_table': 'daily_usd_prices', 'consolidated_until': '2026-01-01T00:00:00'},
+        {'target_table': 'hourly_usd_prices', 'consolidated_until': '2026-01-01T10:00:00'}
+    ]
+    storage.close()
+
+def test_select_after_pages_in_time_and_coin_order(tmp_path):
+    storage = SqliteStorage(str(tmp_path / 'coingecko.sqlite'))
+    storage.write('continuous_btc_prices', price_rows('ethereum', ['2026-01-01T00:00:00', '2026-01-01T00:05:00'], [1.0, 2.0], [None, None]) +
+        price_rows('bitcoin', ['2026-01-01T00:00:00', '2026-01-01T00:10:00'], [1.0, 2.0], [None, None]))
+    columns = ['coin_id', 'created_at']
+    page = storage.select_after('continuous_btc_prices', columns, 'created_at', None, '2026-01-01T00:10:00', 2)
+    assert page == [{'coin_id': 'bitcoin', 'created_at': '2026-01-01T00:00:00'}, {'coin_id': 'ethereum', 'created_at': '2026-01-01T00:00:00'}]
+    page = storage.select_after('continuous_btc_prices', columns, 'created_at', ('2026-01-01T00:00:00', 'ethereum'), '2026-01-01T00:10:00', 2)
+    assert page == [{'coin_id': 'ethereum', 'created_at': '2026-01-01T00:05:00'}]
+    storage.close()
@@ -0,0 +1,71 @@
+import pytest
+
+pytest.importorskip('supabase')
+from postgrest.exceptions import APIError
+from storage.supabase_storage import SupabaseStorage
+
+class FakeQuery:
+    """Records the query builder calls of one request, execute() returns the written rows"""
+    def __init__(self, client, table):
+        self.calls = [('table', table)]
+        self.rows = []
+        client.queries.append(self)
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            if name in ('insert', 'upsert'):
+                self.rows = args[0]
+            return self
+        return call
+
+    def execute(self):
+        return type('Response', (), {'data': self.rows})()
+
+class FakeClient:
+    def __init__(self):
+        self.queries = []
+
+    def table(self, table):
+        return FakeQuery(self, table)
+
+    def rpc(self, function, params):
+        return FakeQuery(self, function)
+
+def fake_storage():
+    storage = SupabaseStorage('http://localhost:54321', 'test-key')
+    storage.client = FakeClient()
+    return storage
+
+def test_write_sends_one_request_per_column_set():
+    storage = fake_storage()
+    rows = [
+        {'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin'},
+        {'id': 'ethereum', 'archived': True},
+        {'id': 'solana', 'symbol': 'sol', 'name': 'Solana'}
+    ]
+    assert storage.write('coins', rows, upsert = True, ignore_duplicates = True) == 3
+
+    requests = [query.calls[1] for query in storage.client.queries]
+    assert requests == [
+        ('upsert', ([rows[0], rows[2]],), {'ignore_duplicates': True}),
+        ('upsert', ([rows[1]],), {'ignore_duplicates': True})
+    ]
+
+    storage.write('continuous_usd_prices', [{'coin_id': 'bitcoin', 'price': 1.0}])
+    assert storage.client.queries[-1].calls[1][0] == 'insert'
+
+def test_reads_page_with_ranges():
+    storage = fake_storage()
+    storage.select('coins', ['id', 'symbol'], {'archived': False}, order = 'id', offset = 1000, limit = 1000)
+    storage.rpc('price_freshness', offset = 2000, limit = 1000)
+    select, rpc = storage.client.queries
+    assert select.calls[1:] == [('select', ('id,symbol',), {}), ('eq', ('archived', False), {}), ('order', ('id',), {}), ('range', (1000, 1999), {})]
+    assert rpc.calls[1:] == [('range', (2000, 2999), {})]
+
+def test_transient_errors():
+    storage = fake_storage()
+    assert storage.is_transient(APIError({'code': '40001', 'message': 'serialization failure'}))
+    assert not storage.is_transient(APIError({'code': '23505', 'message': 'duplicate key'}))
+    assert not storage.is_transient(ValueError("bad row"))
+    assert storage.is_transient(ConnectionError("reset"))
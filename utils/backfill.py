@@ -0,0 +1,138 @@
+import os
+import time
+import sqlite3
+import threading
+import datetime
+import numpy as np
+
+# Planning and checkpointing for historical price backfills
+# /coins/{id}/market_chart/range picks its granularity from the length of the range:
+#   up to 1 day -> 5 minutely, 1 to 90 days -> hourly, above 90 days -> daily
+# so a coin's span is split into windows that stay inside the wanted granularity.
+# Windows are aligned to UTC days, so every daily bar is computed from one window.
+
+# Window length in days per granularity
+WINDOW_DAYS = {
+    'hourly': 85,
+    'daily': 365,
+}
+
+# Snapshot spacing per granularity, fetched before each window so its first bucket is complete
+LEAD_SECONDS = {
+    'hourly': 3600,
+    'daily': 86400,
+}
+
+def to_utc_day(value):
+    """Floor a date, datetime or 'YYYY-MM-DD' string to a naive UTC midnight datetime"""
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    elif not isinstance(value, datetime.datetime):
+        value = datetime.datetime(value.year, value.month, value.day)
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def epoch_seconds(value):
+    """Epoch seconds of a naive UTC datetime"""
+    return int(value.replace(tzinfo=datetime.timezone.utc).timestamp())
+
+def backfill_windows(start, end, granularity = 'hourly'):
+    """Split [start, end) into day aligned windows of WINDOW_DAYS[granularity], returns [(window_start, window_end)]"""
+    if granularity not in WINDOW_DAYS:
+        raise ValueError(f"Unknown granularity {granularity}, expected one of {', '.join(WINDOW_DAYS)}")
+
+    start, end = to_utc_day(start), to_utc_day(end)
+    step = datetime.timedelta(days=WINDOW_DAYS[granularity])
+    windows = []
+    while start < end:
+        windows.append((start, min(start + step, end)))
+        start += step
+    return windows
+
+def chart_snapshots(chart, start = None, end = None):
+    """
+        Convert a market_chart response to sorted (timestamps, prices, volumes_24h) arrays
+        timestamps are datetime64[ms], snapshots outside [start, end) (epoch seconds) are dropped
+    """
+    prices = np.array(chart.get('prices') or [], dtype=np.float64).reshape(-1, 2)
+    volumes = np.array(chart.get('total_volumes') or [], dtype=np.float64).reshape(-1, 2)
+
+    timestamps = prices[:, 0].astype(np.int64)
+    keep = np.ones(len(timestamps), dtype=bool)
+    if start is not None:
+        keep &= timestamps >= start * 1000
+    if end is not None:
+        keep &= timestamps < end * 1000
+
+    timestamps, values = timestamps[keep], prices[keep, 1]
+    order = np.argsort(timestamps, kind='stable')
+    timestamps, values = timestamps[order], values[order]
+
+    # total_volumes normally shares the price timestamps, match them to be safe
+    volumes_24h = np.full(len(timestamps), np.nan)
+    if len(volumes):
+        volume_timestamps = volumes[:, 0].astype(np.int64)
+        volume_order = np.argsort(volume_timestamps, kind='stable')
+        volume_timestamps, volume_values = volume_timestamps[volume_order], volumes[volume_order, 1]
+        positions = np.minimum(np.searchsorted(volume_timestamps, timestamps), len(volume_timestamps) - 1)
+        matched = volume_timestamps[positions] == timestamps
+        volumes_24h[matched] = volume_values[positions[matched]]
+
+    return timestamps.astype('datetime64[ms]'), values, volumes_24h
+
+# BackfillCheckpoint records finished windows in a SQLite file
+# A window is only marked done after its bars are written, so an interrupted
+# backfill resumes at the first unfinished window of every coin.
+class BackfillCheckpoint:
+    def __init__(self, state_file):
+        directory = os.path.dirname(os.path.abspath(state_file))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.state_file = state_file
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(state_file, timeout = 30, isolation_level = None, check_same_thread = False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute("""
+            CREATE TABLE IF NOT EXISTS backfill_windows (
+                coin_id TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                granularity TEXT NOT NULL,
+                window_start TEXT NOT NULL,
+                window_end TEXT NOT NULL,
+                bars INTEGER NOT NULL,
+                finished_at REAL NOT NULL,
+                PRIMARY KEY (coin_id, currency, granularity, window_start)
+            )
+        """)
+
+    def finished_windows(self, currency, granularity):
+        """Return {(coin_id, window_start)} of finished windows"""
+        with self.__lock:
+            rows = self.__connection.execute(
+                'SELECT coin_id, window_start FROM backfill_windows WHERE currency = ? AND granularity = ?',
+                (currency, granularity)
+            ).fetchall()
+        return {(coin_id, datetime.datetime.fromisoformat(window_start)) for coin_id, window_start in rows}
+
+    def mark_finished(self, coin_id, currency, granularity, window_start, window_end, bars):
+        with self.__lock:
+            self.__connection.execute(
+                'INSERT OR REPLACE INTO backfill_windows VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (coin_id, currency, granularity, window_start.isoformat(), window_end.isoformat(), bars, time.time())
+            )
+
+    def reset(self, currency, granularity, coin_ids = None):
+        """Forget finished windows, for all coins or the given coin ids"""
+        with self.__lock:
+            if coin_ids is None:
+                self.__connection.execute('DELETE FROM backfill_windows WHERE currency = ? AND granularity = ?', (currency, granularity))
+            else:
+                self.__connection.executemany(
+                    'DELETE FROM backfill_windows WHERE currency = ? AND granularity = ? AND coin_id = ?',
+                    [(currency, granularity, coin_id) for coin_id in coin_ids]
+                )
+
+    def close(self):
+        self.__connection.close()
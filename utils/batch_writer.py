@@ -0,0 +1,136 @@
+import time
+
+# BatchWriter collects rows per table and writes them to the storage backend in bulk
+# Rows are flushed in chunks (one round trip per chunk, see storage/). If the
+# database rejects a chunk (constraint or data error) it is split in half and
+# retried, so only the failing rows are dropped and logged instead of the whole
+# batch. Transient errors (timeouts, connection errors, overload) are retried
+# with the chunk intact, rows a lasting outage leaves unwritten stay queued.
+# Upserts with ignore_duplicates keep existing rows (ON CONFLICT DO NOTHING).
+# With a metrics registry, every round trip's latency, rows and errors are recorded per table.
+# on_written(table, rows) is called with every chunk that made it to the database.
+class BatchWriter:
+    def __init__(self, storage, log, chunk_size = 500, chunk_sizes = None, metrics = None, retries = 2, retry_seconds = 1.0):
+        self.storage = storage
+        self.log = log
+        self.metrics = metrics
+        self.chunk_size = chunk_size
+        self.chunk_sizes = chunk_sizes or {}
+        self.retries = retries # extra attempts of a chunk failing with a transient error
+        self.retry_seconds = retry_seconds # backoff before the first retry, doubled for every further one
+
+        # COPY and local backends take far larger chunks than PostgREST requests
+        if getattr(storage, 'bulk_chunk_size', None):
+            self.chunk_size = storage.bulk_chunk_size
+            self.chunk_sizes = {}
+        self.failed_rows = 0
+        self.on_written = None
+        self.__pending = {} # (table, upsert, ignore_duplicates) -> rows
+
+    def add(self, table, row, upsert = False, ignore_duplicates = False):
+        """Queue a row to be inserted (or upserted) into table"""
+        self.__pending.setdefault((table, upsert, ignore_duplicates), []).append(row)
+
+    def add_many(self, table, rows, upsert = False, ignore_duplicates = False):
+        """Queue several rows to be inserted (or upserted) into table"""
+        if rows:
+            self.__pending.setdefault((table, upsert, ignore_duplicates), []).extend(rows)
+
+    def pending_rows(self, table = None):
+        """Return the number of queued rows, for one table or all tables"""
+        return sum(len(rows) for (pending_table, _, _), rows in self.__pending.items() if table in (None, pending_table))
+
+    def flush(self, table = None):
+        """
+            Write queued rows (for one table or all tables), returns {table: rows written}
+            A transient error outlasting the retries is raised, the rows it left unwritten stay queued
+        """
+        rows_written = {}
+        for key in list(self.__pending):
+            pending_table, upsert, ignore_duplicates = key
+            if table is not None and pending_table != table:
+                continue
+
+            rows = self.__pending.pop(key)
+            written, unwritten, error = self.write_isolated(pending_table, rows, upsert, ignore_duplicates)
+            rows_written[pending_table] = rows_written.get(pending_table, 0) + written
+            if error:
+                self.__pending[key] = unwritten + self.__pending.get(key, [])
+                raise error
+
+        return rows_written
+
+    def write_isolated(self, table, rows, upsert = False, ignore_duplicates = False):
+        """
+            Write rows in chunks, splitting the chunks the database rejects to drop (and log) only the failing rows
+            Stops at a transient error outlasting the retries, returns (rows written, rows not written, the error or None)
+        """
+        chunk_size = self.chunk_sizes.get(table, self.chunk_size)
+        written = 0
+        unwritten = []
+        error = None
+
+        def write_chunk(chunk):
+            nonlocal written, error
+            if error:
+                unwritten.extend(chunk)
+                return
+            try:
+                chunk_written = self.__execute_retrying(table, chunk, upsert, ignore_duplicates)
+            except Exception as exception:
+                if self.storage.is_transient(exception):
+                    error = exception
+                    unwritten.extend(chunk)
+                elif len(chunk) == 1:
+                    self.failed_rows += 1
+                    self.__log_error(f"Error writing {chunk[0].get('id', chunk[0].get('coin_id'))} to {table}: {chunk[0]}", exception)
+                else:
+                    middle = len(chunk) // 2
+                    write_chunk(chunk[:middle])
+                    write_chunk(chunk[middle:])
+                return
+
+            # Skipped duplicates are not counted, nothing written is expected when all rows exist
+            if not chunk_written and not ignore_duplicates:
+                self.failed_rows += len(chunk)
+                self.__log_error(f"Unknown Response when writing {len(chunk)} rows to {table}, no rows written")
+                return
+            written += chunk_written
+            if self.on_written:
+                self.on_written(table, chunk)
+
+        for i in range(0, len(rows), chunk_size):
+            write_chunk(rows[i:i + chunk_size])
+        return written, unwritten, error
+
+    def __execute_retrying(self, table, rows, upsert, ignore_duplicates):
+        """__execute, retrying transient errors with exponential backoff"""
+        for attempt in range(self.retries + 1):
+            try:
+                return self.__execute(table, rows, upsert, ignore_duplicates)
+            except Exception as exception:
+                if attempt == self.retries or not self.storage.is_transient(exception):
+                    raise
+            time.sleep(self.retry_seconds * (2 ** attempt))
+
+    def __log_error(self, message, exception = ""):
+        if self.log:
+            self.log.error(message, exception)
+
+    def __execute(self, table, rows, upsert, ignore_duplicates):
+        """One insert or upsert round trip, returns the rows written"""
+        operation = 'upsert' if upsert else 'insert'
+        started = time.monotonic()
+        try:
+            written = self.storage.write(table, rows, upsert, ignore_duplicates)
+        except Exception:
+            if self.metrics:
+                self.metrics.increment('db_write_errors_total', table = table, operation = operation)
+            raise
+        finally:
+            if self.metrics:
+                self.metrics.observe('db_write_seconds', time.monotonic() - started, table = table, operation = operation)
+
+        if self.metrics:
+            self.metrics.increment('db_rows_written_total', written, table = table, operation = operation)
+        return written
@@ -0,0 +1,120 @@
+import os
+import json
+import hashlib
+import sqlite3
+
+# Local copy of the coin universe (/coins/list) last written to the coins table
+# The fingerprint of a new coins list is compared first: if nothing changed the
+# database is not touched at all. Otherwise the lists are diffed in memory and
+# only new coins, delisted coins (archived), relisted coins and coins whose
+# symbol, name or platforms changed are written.
+# The state is only committed after a successful write, so a failed sync is
+# simply diffed again on the next run.
+
+def coin_row(coin):
+    """Canonical (id, symbol, name, platforms JSON) of a /coins/list entry or coins table row"""
+    platforms = coin.get('platforms') or {}
+    return (coin['id'], coin.get('symbol') or '', coin.get('name') or '', json.dumps(platforms, sort_keys=True))
+
+def fingerprint(coins):
+    """Order independent hash of a coins list"""
+    digest = hashlib.sha256()
+    for row in sorted(coin_row(coin) for coin in coins):
+        digest.update(json.dumps(row).encode('utf-8'))
+    return digest.hexdigest()
+
+class CoinUniverseDiff:
+    def __init__(self, added, archived, restored, changed):
+        self.added = added # new coins (rows)
+        self.archived = archived # delisted coins (rows)
+        self.restored = restored # archived coins listed again (rows)
+        self.changed = changed # symbol, name or platforms changed (rows)
+
+    def is_empty(self):
+        return not (self.added or self.archived or self.restored or self.changed)
+
+    def __str__(self):
+        return f"{len(self.added)} added, {len(self.archived)} archived, {len(self.restored)} restored, {len(self.changed)} changed"
+
+class CoinUniverse:
+    def __init__(self, state_file):
+        directory = os.path.dirname(os.path.abspath(state_file))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.state_file = state_file
+        self.__connection = sqlite3.connect(state_file, timeout = 30, isolation_level = None)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute("""
+            CREATE TABLE IF NOT EXISTS known_coins (
+                id TEXT PRIMARY KEY,
+                symbol TEXT NOT NULL,
+                name TEXT NOT NULL,
+                platforms TEXT NOT NULL,
+                archived INTEGER NOT NULL
+            )
+        """)
+        self.__connection.execute('CREATE TABLE IF NOT EXISTS universe (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    def fingerprint(self):
+        """Fingerprint of the last committed coins list, None before the first sync"""
+        row = self.__connection.execute("SELECT value FROM universe WHERE key = 'fingerprint'").fetchone()
+        return row[0] if row else None
+
+    def is_empty(self):
+        return self.__connection.execute('SELECT COUNT(*) FROM known_coins').fetchone()[0] == 0
+
+    def seed(self, coins):
+        """Replace the known coins with coins table rows (id, symbol, name, platforms, archived)"""
+        self.__connection.execute('BEGIN')
+        self.__connection.execute('DELETE FROM known_coins')
+        self.__connection.execute("DELETE FROM universe WHERE key = 'fingerprint'")
+        self.__connection.executemany(
+            'INSERT OR REPLACE INTO known_coins VALUES (?, ?, ?, ?, ?)',
+            [coin_row(coin) + (int(bool(coin.get('archived'))),) for coin in coins]
+        )
+        self.__connection.execute('COMMIT')
+
+    def diff(self, coins):
+        """Compare a /coins/list response to the known coins, returns a CoinUniverseDiff of coins table rows"""
+        known = {row[0]: (row[1:4], bool(row[4])) for row in self.__connection.execute('SELECT * FROM known_coins')}
+
+        added, restored, changed = [], [], []
+        listed = set()
+        for coin in coins:
+            row = coin_row(coin)
+            listed.add(row[0])
+            if row[0] not in known:
+                added.append(self.__db_row(row))
+                continue
+            values, archived = known[row[0]]
+            if archived:
+                restored.append(dict(self.__db_row(row), archived=False))
+            elif values != row[1:]:
+                changed.append(dict(self.__db_row(row), archived=False))
+
+        archived = [dict(self.__db_row((coin_id,) + values), archived=True)
+            for coin_id, (values, is_archived) in known.items() if coin_id not in listed and not is_archived]
+
+        return CoinUniverseDiff(added, archived, restored, changed)
+
+    def commit(self, coins, coins_fingerprint = None):
+        """Make coins (a /coins/list response) the known universe, unlisted known coins become archived"""
+        self.__connection.execute('BEGIN')
+        self.__connection.execute('UPDATE known_coins SET archived = 1')
+        self.__connection.executemany(
+            'INSERT OR REPLACE INTO known_coins VALUES (?, ?, ?, ?, 0)',
+            [coin_row(coin) for coin in coins]
+        )
+        self.__connection.execute(
+            "INSERT OR REPLACE INTO universe VALUES ('fingerprint', ?)",
+            (coins_fingerprint or fingerprint(coins),)
+        )
+        self.__connection.execute('COMMIT')
+
+    def close(self):
+        self.__connection.close()
+
+    @staticmethod
+    def __db_row(row):
+        return {'id': row[0], 'symbol': row[1], 'name': row[2], 'platforms': json.loads(row[3])}
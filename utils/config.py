@@ -0,0 +1,16 @@
+import os
+import json
+
+BASE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_PATH = os.path.join(BASE_DIRECTORY, 'config.json')
+
+def load_config():
+    """Load config.json from the project root, or the file named by the COINGECKO_DATA_CONFIG environment variable"""
+    with open(os.getenv('COINGECKO_DATA_CONFIG', CONFIG_PATH), 'r') as config_file:
+        return json.load(config_file)
+
+def resolve_path(path):
+    """Return path relative to the project root (absolute paths are returned unchanged)"""
+    if path is None:
+        return None
+    return os.path.join(BASE_DIRECTORY, path)
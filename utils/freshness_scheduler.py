@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import numpy as np
+
+# Deterministic per-coin refresh scheduling for the real time price collector
+# Every tracked coin gets a target refresh interval between min_interval and
+# max_interval, shorter for high volume and volatile coins (log interpolated).
+# Urgency is staleness / target interval: coins with urgency >= 1 are due.
+# Each run takes the most urgent (coin, currency) prices that the fetch plan
+# can cover within the run's call budget, which comes from the time budget,
+# the per-call cost measured over past runs and the rate limiter's quota.
+# Coins not due yet are added only where they ride along for free (no extra calls).
+class FreshnessScheduler:
+    CURRENCIES = ('usd', 'btc')
+
+    def __init__(self, min_interval = 60, max_interval = 3600, volume_weight = 0.7, volatility_scale = 0.1,
+            fill_urgency = 0.5, state_file = None):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.volume_weight = volume_weight # the rest of the weight goes to volatility
+        self.volatility_scale = volatility_scale # 24h range / price at which volatility counts fully
+        self.fill_urgency = fill_urgency
+        self.state_file = state_file
+
+        # Wall seconds per API call, EWMA over past runs (persisted in state_file between processes)
+        self.seconds_per_call = None
+        self.__cost_alpha = 0.3
+        if state_file and os.path.exists(state_file):
+            with open(state_file, 'r') as file:
+                self.seconds_per_call = json.load(file).get('seconds_per_call')
+
+        self.ids = np.array([], dtype=str)
+        self.target_interval = np.array([])
+        self.refreshed_at = {currency: np.array([]) for currency in self.CURRENCIES}
+
+    def load(self, coins):
+        """Load price_freshness() rows (custom_db_functions.sql), refreshed times default to never"""
+        self.ids = np.array([coin['coin_id'] for coin in coins], dtype=str)
+        volume = self.__float_column(coins, 'vol_24h')
+        price = self.__float_column(coins, 'price')
+        high = self.__float_column(coins, 'high_24h')
+        low = self.__float_column(coins, 'low_24h')
+        change = self.__float_column(coins, 'price_change_percentage_24h')
+
+        # Volatility: 24h range relative to the price, the 24h change if there is no range
+        with np.errstate(divide='ignore', invalid='ignore'):
+            volatility = (high - low) / price
+        volatility = np.where(np.isfinite(volatility), volatility, np.abs(change) / 100.0)
+        self.target_interval = self.target_intervals(volume, np.nan_to_num(volatility, nan=0.0))
+
+        for currency in self.CURRENCIES:
+            self.refreshed_at[currency] = np.array([self.__epoch(coin.get(f'{currency}_created_at')) for coin in coins], dtype=np.float64)
+
+    def target_intervals(self, volume, volatility):
+        """Refresh interval per coin from its 24h volume (percentile rank) and volatility"""
+        volume = np.nan_to_num(np.asarray(volume, dtype=np.float64), nan=0.0)
+        if len(volume) > 1:
+            volume_score = np.argsort(np.argsort(volume, kind='stable'), kind='stable') / (len(volume) - 1)
+        else:
+            volume_score = np.ones(len(volume))
+        volatility_score = np.minimum(np.asarray(volatility, dtype=np.float64) / self.volatility_scale, 1.0)
+
+        score = self.volume_weight * volume_score + (1 - self.volume_weight) * volatility_score
+        return self.max_interval * (self.min_interval / self.max_interval) ** score
+
+    def staleness(self, currency, now = None):
+        """Seconds since each coin's last refresh in currency (inf if never refreshed)"""
+        now = time.time() if now is None else now
+        return np.where(np.isnan(self.refreshed_at[currency]), np.inf, now - self.refreshed_at[currency])
+
+    def urgency(self, currency, now = None):
+        return self.staleness(currency, now) / self.target_interval
+
+    def mark_refreshed(self, currency, ids, now = None):
+        """Record the coins refreshed in currency by this run"""
+        now = time.time() if now is None else now
+        self.refreshed_at[currency][np.isin(self.ids, ids)] = now
+
+    def record_run(self, calls, seconds):
+        """Update the per-call cost estimate from a run's fetch (calls made, wall seconds)"""
+        if calls <= 0:
+            return
+        observed = seconds / calls
+        if self.seconds_per_call is None:
+            self.seconds_per_call = observed
+        else:
+            self.seconds_per_call += self.__cost_alpha * (observed - self.seconds_per_call)
+
+        if self.state_file:
+            with open(self.state_file, 'w') as file:
+                json.dump({'seconds_per_call': self.seconds_per_call}, file)
+
+    def call_budget(self, time_budget, quota_calls, default_seconds_per_call = 1.0):
+        """Number of API calls a run can make within time_budget seconds and the rate limit quota"""
+        seconds_per_call = self.seconds_per_call or default_seconds_per_call
+        return max(0, int(min(time_budget / seconds_per_call, quota_calls)))
+
+    def select(self, planner, market_data_ids, call_budget, now = None):
+        """
+            Choose this run's fetches, returns (plan, {currency: price ids}, market data ids)
+            Due prices come first (most urgent first), then market_data_ids in their given order
+        """
+        now = time.time() if now is None else now
+
+        # (currency, coin) tasks, most urgent first, ties by shorter target interval then id
+        currencies = np.repeat(np.arange(len(self.CURRENCIES)), len(self.ids))
+        coins = np.tile(np.arange(len(self.ids)), len(self.CURRENCIES))
+        urgency = np.concatenate([self.urgency(currency, now) for currency in self.CURRENCIES])
+        order = np.lexsort((self.ids[coins], self.target_interval[coins], -urgency))
+        currencies, coins, urgency = currencies[order], coins[order], urgency[order]
+        market_data_ids = list(market_data_ids)
+
+        def price_ids(count):
+            return {currency: self.ids[coins[:count][currencies[:count] == index]].tolist()
+                for index, currency in enumerate(self.CURRENCIES)}
+
+        def plan_for(count, market_count = 0):
+            ids = price_ids(count)
+            return planner.plan(market_data_ids[:market_count], ids['usd'], ids['btc'])
+
+        def largest(low, high, fits):
+            """Largest n in [low, high] with fits(n), assuming fits is monotone and fits(low)"""
+            while low < high:
+                middle = (low + high + 1) // 2
+                if fits(middle):
+                    low = middle
+                else:
+                    high = middle - 1
+            return low
+
+        # Due prices within the budget, then prices that fill the planned calls
+        due = int(np.count_nonzero(urgency >= 1))
+        count = largest(0, due, lambda n: len(plan_for(n)) <= call_budget)
+        if count == due:
+            calls = len(plan_for(count))
+            fill = int(np.count_nonzero(urgency >= self.fill_urgency))
+            count = largest(count, max(count, fill), lambda n: len(plan_for(n)) <= calls)
+
+        # Market data (coins table) with the remaining budget
+        market_count = largest(0, len(market_data_ids), lambda n: len(plan_for(count, n)) <= call_budget)
+
+        return plan_for(count, market_count), price_ids(count), market_data_ids[:market_count]
+
+    def staleness_distribution(self, now = None, percentiles = (50, 90, 99)):
+        """Staleness percentiles (seconds), overdue and never refreshed coins per currency"""
+        distribution = {}
+        for currency in self.CURRENCIES:
+            staleness = self.staleness(currency, now)
+            refreshed = staleness[np.isfinite(staleness)]
+            summary = {f'p{percentile}': float(np.percentile(refreshed, percentile)) if len(refreshed) else None for percentile in percentiles}
+            summary['max'] = float(refreshed.max()) if len(refreshed) else None
+            summary['overdue'] = int(np.count_nonzero(self.urgency(currency, now) >= 1))
+            summary['never'] = int(len(staleness) - len(refreshed))
+            distribution[currency] = summary
+        return distribution
+
+    def staleness_summary(self, now = None):
+        """One line staleness distribution for run logs"""
+        parts = []
+        for currency, summary in self.staleness_distribution(now).items():
+            percentiles = ' '.join(f"{name} {round(value)}s" for name, value in summary.items() if name.startswith('p') and value is not None)
+            parts.append(f"{currency.upper()} staleness {percentiles or 'n/a'}, {summary['overdue']} overdue, {summary['never']} never")
+        return ', '.join(parts)
+
+    @staticmethod
+    def __float_column(coins, key):
+        return np.array([np.nan if coin.get(key) is None else coin[key] for coin in coins], dtype=np.float64)
+
+    @staticmethod
+    def __epoch(timestamp):
+        """Epoch seconds of a naive UTC timestamp string from the database, NaN if None"""
+        if timestamp is None:
+            return np.nan
+        return np.datetime64(timestamp.rstrip('Z').split('+')[0], 'us').astype(np.int64) / 1e6
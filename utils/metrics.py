@@ -0,0 +1,172 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# In-process metrics: labeled counters and histograms
+# Recorded by CoinGeckoAPI (request latency, rate limit waits, retries, response sizes,
+# cache results) and BatchWriter (write latency, rows, errors), exported as a Prometheus
+# textfile (node_exporter textfile collector) and as a JSON summary in the run log.
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside its bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+class MetricsRegistry:
+    def __init__(self, prefix = 'coingecko_'):
+        self.prefix = prefix
+        self.__lock = threading.Lock()
+        self.__counters = {} # (name, labels) -> value
+        self.__histograms = {} # (name, labels) -> Histogram
+        self.__help = {}
+        self.__buckets = {} # name -> bucket bounds, SECONDS_BUCKETS by default
+
+    def increment(self, name, value = 1, **labels):
+        key = (name, self.__labels(labels))
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, self.__labels(labels))
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = self.__histograms[key] = Histogram(self.__buckets.get(name, SECONDS_BUCKETS))
+            histogram.observe(value)
+
+    @contextmanager
+    def time(self, name, **labels):
+        """Observe the duration of a block in seconds"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started, **labels)
+
+    def describe(self, name, help_text, buckets = None):
+        self.__help[name] = help_text
+        if buckets:
+            self.__buckets[name] = buckets
+
+    def reset(self):
+        with self.__lock:
+            self.__counters.clear()
+            self.__histograms.clear()
+
+    def summary(self):
+        """JSON friendly summary: counters and histogram count/sum/p50/p95 per name and labels"""
+        with self.__lock:
+            counters = {}
+            for (name, labels), value in sorted(self.__counters.items()):
+                counters.setdefault(name, []).append({**dict(labels), 'value': value})
+
+            histograms = {}
+            for (name, labels), histogram in sorted(self.__histograms.items(), key=lambda item: item[0]):
+                histograms.setdefault(name, []).append({
+                    **dict(labels),
+                    'count': histogram.count,
+                    'sum': round(histogram.sum, 6),
+                    'p50': self.__round(histogram.quantile(0.5)),
+                    'p95': self.__round(histogram.quantile(0.95))
+                })
+        return {'counters': counters, 'histograms': histograms}
+
+    def to_prometheus(self):
+        """Prometheus text exposition format"""
+        lines = []
+        with self.__lock:
+            for name in sorted({name for name, _ in self.__counters}):
+                metric = f'{self.prefix}{name}'
+                lines += self.__header(name, metric, 'counter')
+                for (counter_name, labels), value in sorted(self.__counters.items()):
+                    if counter_name == name:
+                        lines.append(f'{metric}{self.__format_labels(labels)} {value}')
+
+            for name in sorted({name for name, _ in self.__histograms}):
+                metric = f'{self.prefix}{name}'
+                lines += self.__header(name, metric, 'histogram')
+                for (histogram_name, labels), histogram in sorted(self.__histograms.items(), key=lambda item: item[0]):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{self.__format_labels(labels + (("le", str(bound)),))} {cumulative}')
+                    lines.append(f'{metric}_sum{self.__format_labels(labels)} {histogram.sum}')
+                    lines.append(f'{metric}_count{self.__format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """Atomically write the Prometheus textfile (the collector must never read a partial file)"""
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as file:
+            file.write(self.to_prometheus())
+        os.replace(temporary_path, path)
+
+    def __header(self, name, metric, metric_type):
+        lines = [f'# HELP {metric} {self.__help[name]}'] if name in self.__help else []
+        return lines + [f'# TYPE {metric} {metric_type}']
+
+    @staticmethod
+    def __labels(labels):
+        return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+    @staticmethod
+    def __format_labels(labels):
+        if not labels:
+            return ''
+        def escape(value):
+            return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels) + '}'
+
+    @staticmethod
+    def __round(value):
+        return None if value is None else round(value, 6)
+
+# Registry shared by the clients and writers of a script
+metrics = MetricsRegistry()
+metrics.describe('api_request_seconds', 'CoinGecko HTTP request latency per attempt')
+metrics.describe('api_rate_limit_wait_seconds', 'Time spent waiting for the rate limiter')
+metrics.describe('api_requests_total', 'CoinGecko HTTP responses by status')
+metrics.describe('api_retries_total', 'CoinGecko requests retried (429 and 5xx)')
+metrics.describe('api_response_bytes', 'CoinGecko response body size', BYTES_BUCKETS)
+metrics.describe('api_cache_total', 'Response cache results (hit, revalidated, miss)')
+metrics.describe('db_write_seconds', 'Database write latency per chunk')
+metrics.describe('db_rows_written_total', 'Rows written to the database')
+metrics.describe('db_write_errors_total', 'Failed database write requests')
+metrics.describe('db_read_seconds', 'Database select latency per page')
+metrics.describe('db_rpc_seconds', 'Database function (RPC) call latency')
@@ -0,0 +1,253 @@
+import os
+import json
+import zlib
+import datetime
+import numpy as np
+
+# pyarrow is only needed to export and read, the rest of the project runs without it
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Incremental export of the price tables to Parquet files
+# Rows after a table's watermark (its time column and coin_id, the order they are
+# read in) are written in batches to hive partitioned files:
+#   {directory}/continuous_prices/currency=usd/date=2024-05-01/part-{start}-{coin}.parquet
+# (daily bars are partitioned by month). The watermark is saved after each batch's
+# files, a batch written again after a crash starts at the same watermark, gets the
+# same file names and replaces its files, so no row is exported twice.
+# read_prices() memory maps the files of a date range back into one Arrow table.
+
+# Arrow type per column of the price tables (coingecko_schema.sql)
+COLUMN_TYPES = {
+    'coin_id': 'string',
+    'api_last_updated': 'timestamp',
+    'created_at': 'timestamp',
+    'hour': 'timestamp',
+    'day': 'date',
+    'price': 'float64',
+    'vol_24h': 'int64',
+    'high_24h': 'float64',
+    'low_24h': 'float64',
+    'price_change_percentage_24h': 'float32',
+    'open': 'float64',
+    'high': 'float64',
+    'low': 'float64',
+    'close': 'float64',
+    'vwap': 'float64',
+    'twap': 'float64',
+    'volume': 'int64',
+    'price_snapshots': 'int16'
+}
+
+CONTINUOUS_COLUMNS = ['coin_id', 'api_last_updated', 'created_at', 'price', 'vol_24h', 'high_24h', 'low_24h', 'price_change_percentage_24h']
+BAR_COLUMNS = ['coin_id', '{time}', 'open', 'high', 'low', 'close', 'vwap', 'twap', 'volume', 'price_snapshots']
+
+class ExportTable:
+    """Export layout of a price table, e.g. continuous_usd_prices -> continuous_prices/currency=usd"""
+    TIME_COLUMNS = {'continuous': 'created_at', 'hourly': 'hour', 'daily': 'day'}
+    PARTITION_UNITS = {'continuous': 'D', 'hourly': 'D', 'daily': 'M'}
+
+    def __init__(self, name):
+        kind, currency, suffix = (name.split('_') + ['', ''])[:3]
+        if kind not in self.TIME_COLUMNS or suffix != 'prices':
+            raise ValueError(f"Can't export {name}, expected a continuous, hourly or daily price table")
+        self.name = name
+        self.currency = currency
+        self.dataset = f'{kind}_prices'
+        self.time_column = self.TIME_COLUMNS[kind]
+        self.partition_unit = self.PARTITION_UNITS[kind]
+        if kind == 'continuous':
+            self.columns = list(CONTINUOUS_COLUMNS)
+        else:
+            self.columns = [column.format(time=self.time_column) for column in BAR_COLUMNS]
+            if name == 'hourly_btc_prices':
+                self.columns.remove('volume')
+
+    def directory(self, root):
+        return os.path.join(root, self.dataset, f'currency={self.currency}')
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("Parquet export needs pyarrow (pip install pyarrow)")
+
+def arrow_type(name):
+    return {
+        'string': pa.string(),
+        'timestamp': pa.timestamp('us'),
+        'date': pa.date32(),
+        'float64': pa.float64(),
+        'float32': pa.float32(),
+        'int64': pa.int64(),
+        'int16': pa.int16()
+    }[name]
+
+def rows_to_arrow(rows, columns):
+    """Arrow table of PostgREST rows, timestamps are naive UTC ISO strings"""
+    require_pyarrow()
+    arrays = []
+    for column in columns:
+        values = [row.get(column) for row in rows]
+        kind = COLUMN_TYPES[column]
+        if kind == 'timestamp':
+            arrays.append(pa.array(np.array(values, dtype='datetime64[us]'), type=pa.timestamp('us'), from_pandas=True))
+        elif kind == 'date':
+            arrays.append(pa.array(np.array(values, dtype='datetime64[D]'), type=pa.date32(), from_pandas=True))
+        else:
+            arrays.append(pa.array(values, type=arrow_type(kind)))
+    return pa.Table.from_arrays(arrays, names=columns)
+
+class ExportWatermarks:
+    """Last exported (time, coin_id) per table, kept in a JSON file next to the exported files"""
+    def __init__(self, path):
+        self.path = path
+        self.__watermarks = {}
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                self.__watermarks = json.load(file)
+
+    def get(self, table):
+        """(time, coin_id) of the last exported row, None if nothing is exported"""
+        watermark = self.__watermarks.get(table)
+        return (watermark['time'], watermark['coin_id']) if watermark else None
+
+    def set(self, table, time, coin_id):
+        self.__watermarks[table] = {'time': time, 'coin_id': coin_id}
+        self.__save()
+
+    def reset(self, table):
+        self.__watermarks.pop(table, None)
+        self.__save()
+
+    def __save(self):
+        temporary_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(self.__watermarks, file, indent=4)
+        os.replace(temporary_path, self.path)
+
+class PriceExporter:
+    """
+        Export price tables after their watermark
+        fetch_page(table, columns, after, until, limit) returns up to limit rows of table ordered by
+        (time column, coin_id) after the (time, coin_id) after (None for the start) and before until
+    """
+    def __init__(self, directory, fetch_page, page_size = 1000, batch_rows = 200000):
+        require_pyarrow()
+        self.directory = directory
+        self.fetch_page = fetch_page
+        self.page_size = page_size
+        self.batch_rows = batch_rows
+        os.makedirs(directory, exist_ok=True)
+        self.watermarks = ExportWatermarks(os.path.join(directory, '_watermarks.json'))
+
+    def export(self, name, until, should_stop = None):
+        """Export the rows of table name before until, batch by batch, returns (rows exported, caught up)"""
+        table = ExportTable(name)
+        exported = 0
+        while not (should_stop and should_stop()):
+            start = self.watermarks.get(name)
+            rows, caught_up = self.__read_batch(table, start, until)
+            if rows:
+                self.write_batch(table, rows, start)
+                last = rows[-1]
+                self.watermarks.set(name, last[table.time_column], last['coin_id'])
+                exported += len(rows)
+            if caught_up:
+                return exported, True
+        return exported, False
+
+    def write_batch(self, table, rows, start):
+        """Write rows to their partitions, file names derive from the batch's start watermark"""
+        data = rows_to_arrow(rows, table.columns)
+        times = np.array([row[table.time_column] for row in rows], dtype=f'datetime64[{table.partition_unit}]')
+        partitions, codes = np.unique(times, return_inverse=True)
+        stamp = 'start' if start is None else f"{start[0].replace(':', '').replace('-', '')}-{zlib.crc32(start[1].encode('utf-8')):08x}"
+
+        for code, partition in enumerate(partitions.astype(str)):
+            directory = os.path.join(table.directory(self.directory), f'date={partition}')
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'part-{stamp}.parquet')
+            temporary_path = f'{path}.{os.getpid()}.tmp'
+            pq.write_table(data.filter(pa.array(codes == code)), temporary_path, compression='zstd')
+            os.replace(temporary_path, path)
+
+    def reset(self, name):
+        """Forget a table's watermark and delete its files, the next export starts over"""
+        table = ExportTable(name)
+        self.watermarks.reset(name)
+        for path, _, files in os.walk(table.directory(self.directory)):
+            for file in files:
+                if file.endswith('.parquet'):
+                    os.remove(os.path.join(path, file))
+
+    def __read_batch(self, table, start, until):
+        rows = []
+        after = start
+        while len(rows) < self.batch_rows:
+            page = self.fetch_page(table.name, table.columns, after, until, self.page_size)
+            rows.extend(page)
+            if len(page) < self.page_size:
+                return rows, True
+            after = (page[-1][table.time_column], page[-1]['coin_id'])
+        return rows, False
+
+def partition_files(directory, name, start = None, end = None):
+    """Parquet files of table name, oldest first, of the partitions overlapping [start, end] ('YYYY-MM-DD' or dates)"""
+    root = ExportTable(name).directory(directory)
+    if not os.path.isdir(root):
+        return []
+    start = str(start)[:10] if start is not None else None
+    end = str(end)[:10] if end is not None else None
+
+    files = []
+    for partition in sorted(os.listdir(root)):
+        if not partition.startswith('date='):
+            continue
+        value = partition[len('date='):] # YYYY-MM-DD, or YYYY-MM for monthly partitions
+        if start and value < start[:len(value)]:
+            continue
+        if end and value > end[:len(value)]:
+            continue
+        path = os.path.join(root, partition)
+        files.extend(os.path.join(path, file) for file in sorted(os.listdir(path)) if file.endswith('.parquet'))
+    return files
+
+def time_scalar(value, arrow_type):
+    """Arrow timestamp or date scalar of a 'YYYY-MM-DD[THH:MM:SS]' string, date or naive UTC datetime"""
+    if isinstance(value, datetime.date):
+        value = value.isoformat()
+    unit = 'D' if arrow_type == pa.date32() else 'us'
+    return pa.scalar(np.datetime64(value).astype(f'datetime64[{unit}]').item(), type=arrow_type)
+
+def read_prices(directory, name, start = None, end = None, coin_ids = None, columns = None):
+    """
+        Read exported rows of table name into one Arrow table, files are memory mapped
+        start and end ('YYYY-MM-DD', dates or datetimes) bound the time column, end is exclusive
+    """
+    require_pyarrow()
+    table = ExportTable(name)
+    if columns is not None and table.time_column not in columns:
+        columns = list(columns) + [table.time_column]
+
+    parts = [pq.read_table(path, columns=columns, memory_map=True) for path in partition_files(directory, name, start, end)]
+    if not parts:
+        return rows_to_arrow([], columns or table.columns)
+    data = pa.concat_tables(parts)
+
+    times = data.column(table.time_column)
+    mask = None
+    for bound, compare in ((start, pc.greater_equal), (end, pc.less)):
+        if bound is not None:
+            condition = compare(times, time_scalar(bound, times.type))
+            mask = condition if mask is None else pc.and_(mask, condition)
+    if coin_ids is not None:
+        condition = pc.is_in(data.column('coin_id'), value_set=pa.array(list(coin_ids), type=pa.string()))
+        mask = condition if mask is None else pc.and_(mask, condition)
+    return data.filter(mask) if mask is not None else data
+
+def to_numpy(data):
+    """{column: NumPy array} of an Arrow table, timestamps as datetime64"""
+    return {name: data.column(name).to_numpy() for name in data.column_names}
@@ -0,0 +1,152 @@
+import numpy as np
+
+# Vectorized OHLC / TWAP / VWAP / volume rollups of continuous price snapshots
+# NumPy port of db_scripts/hourly_prices.sql and daily_prices.sql:
+#   - intervals between consecutive snapshots of a coin (the SQL LAG window)
+#   - interval volume from the difference method:
+#       max(0, vol_24h_end - vol_24h_start + vol_24h_start / 24 * interval_hours)
+#   - interval volume distributed over the buckets it overlaps, by overlap fraction
+#   - VWAP from the interval midpoint prices, TWAP (simple average) if the volume is 0
+#   - OHLC and snapshot counts from the snapshots inside each bucket
+# Input arrays must be sorted by (coin_id, timestamp) and may hold many coins.
+
+HOUR = 3600
+DAY = 86400
+
+def to_epoch_seconds(timestamps):
+    """Convert datetime64 (or numeric epoch seconds) to float64 epoch seconds"""
+    timestamps = np.asarray(timestamps)
+    if np.issubdtype(timestamps.dtype, np.datetime64):
+        return timestamps.astype('datetime64[us]').astype(np.int64) / 1e6
+    return timestamps.astype(np.float64)
+
+class SnapshotIntervals:
+    """Consecutive snapshot pairs per coin with their estimated volume, shared by every bucket size"""
+
+    def __init__(self, coin_ids, timestamps, prices, volumes_24h):
+        self.coin_ids = np.asarray(coin_ids)
+        self.timestamps = to_epoch_seconds(timestamps)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        volumes_24h = np.asarray(volumes_24h, dtype=np.float64)
+
+        size = len(self.coin_ids)
+        self.new_coin = np.ones(size, dtype=bool)
+        self.new_coin[1:] = self.coin_ids[1:] != self.coin_ids[:-1]
+        self.coin_codes = np.cumsum(self.new_coin) - 1
+
+        # Interval i ends at snapshot i and starts at snapshot i-1 of the same coin
+        end = np.flatnonzero(~self.new_coin)
+        start = end - 1
+        duration = self.timestamps[end] - self.timestamps[start]
+        valid = (duration > 0) & ~np.isnan(self.prices[start]) & ~np.isnan(self.prices[end])
+        start, end, duration = start[valid], end[valid], duration[valid]
+
+        # COALESCE(vol_24h_start, 0), a missing vol_24h_end gives no volume (GREATEST ignores NULL)
+        volume_start = np.nan_to_num(volumes_24h[start], nan=0.0)
+        volume_end = volumes_24h[end]
+        estimated = volume_end - volume_start + (volume_start / 24.0) * (duration / 3600.0)
+
+        self.coin_code = self.coin_codes[end]
+        self.ts_start = self.timestamps[start]
+        self.ts_end = self.timestamps[end]
+        self.duration = duration
+        self.avg_price = (self.prices[start] + self.prices[end]) / 2.0
+        self.volume = np.maximum(0.0, np.nan_to_num(estimated, nan=0.0))
+
+    def bars(self, bucket_seconds = HOUR):
+        """Return OHLC, VWAP, TWAP, volume and snapshot count per (coin, bucket) as column arrays"""
+        timestamps, prices = self.timestamps, self.prices
+        bucket = np.floor(timestamps / bucket_seconds).astype(np.int64)
+
+        # Snapshot groups per (coin, bucket), input order keeps them contiguous
+        new_group = self.new_coin.copy()
+        new_group[1:] |= bucket[1:] != bucket[:-1]
+        starts = np.flatnonzero(new_group)
+        ends = np.append(starts[1:], len(prices))
+        counts = ends - starts
+
+        if len(starts) == 0:
+            return self.__empty_bars()
+
+        opens = prices[starts]
+        closes = prices[ends - 1]
+        highs = np.maximum.reduceat(prices, starts)
+        lows = np.minimum.reduceat(prices, starts)
+        twaps = np.add.reduceat(prices, starts) / counts
+
+        # Composite (coin, bucket) keys, ascending because the input is sorted
+        min_bucket = bucket.min()
+        bucket_span = bucket.max() - min_bucket + 1
+        group_keys = self.coin_codes[starts] * bucket_span + (bucket[starts] - min_bucket)
+
+        # Expand every interval into the buckets it touches (generate_series in the SQL)
+        first_bucket = np.floor(self.ts_start / bucket_seconds).astype(np.int64)
+        last_bucket = np.floor(self.ts_end / bucket_seconds).astype(np.int64)
+        touched = last_bucket - first_bucket + 1
+        interval_index = np.repeat(np.arange(len(touched)), touched)
+        offsets = np.arange(touched.sum()) - np.repeat(np.cumsum(touched) - touched, touched)
+        bucket_number = first_bucket[interval_index] + offsets
+        bucket_start = bucket_number * float(bucket_seconds)
+
+        overlap = np.minimum(self.ts_end[interval_index], bucket_start + bucket_seconds) \
+            - np.maximum(self.ts_start[interval_index], bucket_start)
+        fraction = overlap / self.duration[interval_index]
+
+        # Buckets without snapshots are dropped, as by the LEFT JOIN from the OHLC buckets
+        in_range = (overlap > 0) & (bucket_number >= min_bucket) & (bucket_number < min_bucket + bucket_span)
+        contribution_keys = self.coin_code[interval_index] * bucket_span + (bucket_number - min_bucket)
+        positions = np.searchsorted(group_keys, contribution_keys)
+        positions = np.minimum(positions, len(group_keys) - 1)
+        matched = in_range & (group_keys[positions] == contribution_keys)
+
+        interval_volume = self.volume[interval_index] * fraction
+        volumes = np.bincount(positions[matched], weights=interval_volume[matched], minlength=len(starts))
+        volume_price = np.bincount(positions[matched], weights=(interval_volume * self.avg_price[interval_index])[matched], minlength=len(starts))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vwaps = np.where(volumes == 0, twaps, volume_price / volumes)
+
+        return {
+            'coin_id': self.coin_ids[starts],
+            'bucket_start': (bucket[starts] * bucket_seconds).astype('datetime64[s]'),
+            'open': opens,
+            'high': highs,
+            'low': lows,
+            'close': closes,
+            'vwap': vwaps,
+            'twap': twaps,
+            'volume': np.rint(volumes).astype(np.int64),
+            'price_snapshots': counts
+        }
+
+    def __empty_bars(self):
+        return {
+            'coin_id': self.coin_ids[:0],
+            'bucket_start': np.array([], dtype='datetime64[s]'),
+            'open': np.array([]),
+            'high': np.array([]),
+            'low': np.array([]),
+            'close': np.array([]),
+            'vwap': np.array([]),
+            'twap': np.array([]),
+            'volume': np.array([], dtype=np.int64),
+            'price_snapshots': np.array([], dtype=np.int64)
+        }
+
+def price_bars(coin_ids, timestamps, prices, volumes_24h, bucket_seconds = HOUR):
+    """Bars of one bucket size (HOUR, DAY, ...) for sorted (coin_id, timestamp) snapshots"""
+    return SnapshotIntervals(coin_ids, timestamps, prices, volumes_24h).bars(bucket_seconds)
+
+def hourly_and_daily_bars(coin_ids, timestamps, prices, volumes_24h):
+    """Hourly and daily bars, the snapshot intervals are computed once for both"""
+    intervals = SnapshotIntervals(coin_ids, timestamps, prices, volumes_24h)
+    return intervals.bars(HOUR), intervals.bars(DAY)
+
+def bars_to_rows(bars, bucket_column = 'hour'):
+    """Convert bar columns to a list of dicts for database inserts (bucket_start renamed to bucket_column)"""
+    columns = {bucket_column if name == 'bucket_start' else name: values for name, values in bars.items()}
+    if bucket_column == 'day':
+        columns['day'] = columns['day'].astype('datetime64[D]')
+    columns = {name: np.datetime_as_string(values).tolist() if np.issubdtype(values.dtype, np.datetime64) else values.tolist() for name, values in columns.items()}
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
@@ -0,0 +1,185 @@
+import os
+import time
+import numpy as np
+
+# In-process time series of the prices the collector has just stored
+# One ring buffer per (coin, currency) of capacity slots at resolution seconds:
+# a price in the same slot as the previous one replaces it, older prices are
+# ignored, the oldest slot is overwritten once the buffer is full. Buffers are
+# rows of one NumPy structured array (uint32 epoch seconds and float64 prices,
+# 12 bytes per slot), so 720 one-minute slots of 2000 coins in two currencies
+# take about 35 MB. snapshot() writes the array to an .npy file, load() maps it
+# back, so a restarted collector gets its hot window without a database query.
+
+class PriceSeries:
+    """Ring buffer position of one (coin, currency) in the store's array"""
+    __slots__ = ('coin_id', 'currency', 'row')
+
+    def __init__(self, coin_id, currency, row):
+        self.coin_id = coin_id
+        self.currency = currency
+        self.row = row
+
+class PriceStore:
+    MAX_ID_BYTES = 128
+
+    def __init__(self, capacity = 720, resolution = 60):
+        self.capacity = capacity
+        self.resolution = resolution
+        self.dtype = np.dtype([
+            ('coin_id', f'S{self.MAX_ID_BYTES}'),
+            ('currency', 'S8'),
+            ('head', '<u4'), # next slot to write
+            ('count', '<u4'),
+            ('timestamps', '<u4', (capacity,)),
+            ('prices', '<f8', (capacity,))
+        ])
+        self.__buffers = np.zeros(0, dtype=self.dtype)
+        self.__series = {} # (coin_id, currency) -> PriceSeries
+
+    def __len__(self):
+        return len(self.__series)
+
+    def memory_bytes(self):
+        return self.__buffers.nbytes
+
+    def add(self, coin_id, currency, timestamp, price):
+        """Add one price (epoch seconds), returns False if it is older than the series' latest"""
+        if price is None or timestamp is None:
+            return False
+        series = self.__series.get((coin_id, currency)) or self.__new_series(coin_id, currency)
+        buffer = self.__buffers[series.row]
+        count, head = int(buffer['count']), int(buffer['head'])
+        timestamp = int(timestamp)
+
+        if count:
+            last = (head - 1) % self.capacity
+            last_timestamp = int(buffer['timestamps'][last])
+            if timestamp < last_timestamp:
+                return False
+            if timestamp // self.resolution == last_timestamp // self.resolution:
+                buffer['timestamps'][last] = timestamp
+                buffer['prices'][last] = price
+                return True
+
+        buffer['timestamps'][head] = timestamp
+        buffer['prices'][head] = price
+        buffer['head'] = (head + 1) % self.capacity
+        buffer['count'] = min(count + 1, self.capacity)
+        return True
+
+    def add_rows(self, currency, rows, time_column = 'api_last_updated'):
+        """Add continuous price rows (coin_id, price and an ISO time column), returns the prices added"""
+        added = 0
+        for row in rows:
+            timestamp = self.__epoch(row.get(time_column))
+            if timestamp is not None and self.add(row['coin_id'], currency, timestamp, row.get('price')):
+                added += 1
+        return added
+
+    def series(self, coin_id, currency, seconds = None, now = None):
+        """Timestamps and prices (oldest first) of the last seconds before now, or the whole buffer"""
+        series = self.__series.get((coin_id, currency))
+        if series is None:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+        buffer = self.__buffers[series.row]
+        count, head = int(buffer['count']), int(buffer['head'])
+        order = (head - count + np.arange(count)) % self.capacity
+        timestamps = buffer['timestamps'][order].astype(np.int64)
+        prices = buffer['prices'][order]
+        if seconds is not None:
+            now = time.time() if now is None else now
+            inside = (timestamps >= now - seconds) & (timestamps <= now)
+            timestamps, prices = timestamps[inside], prices[inside]
+        return timestamps, prices
+
+    def latest(self, coin_id, currency):
+        """(epoch seconds, price) of the latest price, None if there is none"""
+        timestamps, prices = self.series(coin_id, currency)
+        if not len(prices):
+            return None
+        return int(timestamps[-1]), float(prices[-1])
+
+    def ohlc(self, coin_id, currency, seconds, now = None):
+        """Open, high, low, close and price count of the last seconds, None without prices"""
+        timestamps, prices = self.series(coin_id, currency, seconds, now)
+        if not len(prices):
+            return None
+        return {
+            'open': float(prices[0]),
+            'high': float(prices.max()),
+            'low': float(prices.min()),
+            'close': float(prices[-1]),
+            'count': len(prices)
+        }
+
+    def twap(self, coin_id, currency, seconds, now = None):
+        """Time weighted average price of the last seconds, each price holds until the next one (the last until now)"""
+        now = time.time() if now is None else now
+        timestamps, prices = self.series(coin_id, currency, seconds, now)
+        if not len(prices):
+            return None
+        durations = np.diff(np.append(timestamps, now)).astype(np.float64)
+        if durations.sum() <= 0:
+            return float(prices.mean())
+        return float(np.average(prices, weights=durations))
+
+    def percent_change(self, coin_id, currency, lookback, now = None):
+        """Change of the latest price against the price lookback seconds before now, None if the buffer is shorter"""
+        now = time.time() if now is None else now
+        timestamps, prices = self.series(coin_id, currency)
+        before = np.flatnonzero(timestamps <= now - lookback)
+        current = np.flatnonzero(timestamps <= now)
+        if not len(before) or not len(current) or prices[before[-1]] == 0:
+            return None
+        reference = prices[before[-1]]
+        return float((prices[current[-1]] - reference) / reference * 100.0)
+
+    def snapshot(self, path):
+        """Write the buffers to an .npy file (atomically), it can be memory mapped by load()"""
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        buffers = np.lib.format.open_memmap(temporary_path, mode='w+', dtype=self.dtype, shape=(len(self.__series),))
+        buffers[:] = self.__buffers[:len(self.__series)]
+        buffers.flush()
+        del buffers
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path, capacity = 720, resolution = 60):
+        """Store of a snapshot, an empty store if there is none or its capacity differs"""
+        store = cls(capacity, resolution)
+        if not path or not os.path.exists(path):
+            return store
+        try:
+            buffers = np.load(path, mmap_mode='r')
+        except (ValueError, OSError) as exception:
+            print(f"Ignoring price store snapshot {path}: {exception}")
+            return store
+        if buffers.dtype != store.dtype:
+            return store
+
+        store.__buffers = np.array(buffers)
+        for row, (coin_id, currency) in enumerate(zip(store.__buffers['coin_id'].tolist(), store.__buffers['currency'].tolist())):
+            coin_id, currency = coin_id.decode('utf-8'), currency.decode('utf-8')
+            store.__series[(coin_id, currency)] = PriceSeries(coin_id, currency, row)
+        return store
+
+    def __new_series(self, coin_id, currency):
+        row = len(self.__series)
+        if row == len(self.__buffers):
+            # Grow by doubling, new rows start empty
+            buffers = np.zeros(max(64, 2 * len(self.__buffers)), dtype=self.dtype)
+            buffers[:row] = self.__buffers
+            self.__buffers = buffers
+        self.__buffers[row]['coin_id'] = coin_id.encode('utf-8')[:self.MAX_ID_BYTES]
+        self.__buffers[row]['currency'] = currency.encode('utf-8')
+        series = PriceSeries(coin_id, currency, row)
+        self.__series[(coin_id, currency)] = series
+        return series
+
+    @staticmethod
+    def __epoch(timestamp):
+        """Epoch seconds of an ISO timestamp string (UTC), None if None"""
+        if timestamp is None:
+            return None
+        return int(np.datetime64(timestamp.rstrip('Z').split('+')[0], 's').astype(np.int64))
@@ -1,24 +1,38 @@
 import datetime
-import os
 import json
+import os
+import time
+import threading
+from contextlib import contextmanager
+from utils.config import BASE_DIRECTORY, load_config
 
 # ScriptLogger class to log script runs and errors
 # run logs are grouped by script name and month
 # error logs are grouped by month
+# Every run is also recorded in a JSON lines file next to the run log (start, errors and
+# end with the run time and named timing spans), buffered and written at error/end.
+# With a metrics registry (utils.metrics), end() adds its summary to the end record and
+# writes it as a Prometheus textfile to config's metrics_directory.
+# Background threads (e.g. the write spool's flusher) may log errors into a run's
+# logger, writes to the log files and the event buffer are serialized by a lock.
 class ScriptLogger:
-    def __init__(self, script_name):
+    __BUFFERED_EVENTS = 100 # write JSON lines once this many events are buffered
+
+    def __init__(self, script_name, metrics = None):
         self.script_name = script_name
+        self.metrics = metrics
+        self.started = time.monotonic()
         self.start_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         current_month = datetime.datetime.now().strftime('%Y_%m')
-        
+        self.spans = {} # span name -> [total seconds, count]
+        self.__events = []
+        self.__lock = threading.RLock()
+
         # Load log_directory from config.json
-        base_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        config_path = os.path.join(base_directory, 'config.json')
-        with open(config_path, 'r') as config_file:
-            config = json.load(config_file)
-            
+        config = load_config()
+
         try:
-            log_directory = os.path.join(base_directory, config['log_directory'])
+            log_directory = os.path.join(BASE_DIRECTORY, config['log_directory'])
         except KeyError:
             raise ValueError("Missing required 'log_directory' setting in config.json")
 
@@ -28,65 +42,115 @@ class ScriptLogger:
             os.path.join(log_directory, 'error_logs'),
             os.path.join(log_directory, 'run_logs', script_name)
         ]
-        
+
         for directory in directories:
             if not os.path.exists(directory):
                 os.makedirs(directory)
-        
+
         self.run_log_file = f'{log_directory}/run_logs/{script_name}/{script_name}_{current_month}_runs.log'
         self.error_log_file = f'{log_directory}/error_logs/{current_month}_errors.log'
+        self.json_log_file = f'{log_directory}/run_logs/{script_name}/{script_name}_{current_month}_runs.jsonl'
+        self.metrics_file = os.path.join(BASE_DIRECTORY, config['metrics_directory'], f'{script_name}.prom') if config.get('metrics_directory') else None
+
+        # Create new line in run log file, remember where it starts so it can be rewritten in place
+        with open(self.run_log_file, 'ab') as file:
+            file.write(f'{os.linesep}START: {self.start_time} - UNKOWN ERROR'.encode())
+            self.__line_end = file.tell()
+        self.__line_start = self.__line_end - len(f'START: {self.start_time} - UNKOWN ERROR'.encode())
+
+        self.__event('start')
 
-        # Create new line in run log file
-        with open(self.run_log_file, 'a') as file:
-            file.write(f'{os.linesep}START: {self.start_time} - UNKOWN ERROR')
-    
     # Update the last line of the run log file
     def update_last_line(self, new_text):
-        with open(self.run_log_file, 'rb+') as file:
+        with self.__lock, open(self.run_log_file, 'rb+') as file:
             file.seek(0, os.SEEK_END)
-            file_size = file.tell()
-            buffer = bytearray()
-            newline = b'\n'
-            
-            while file_size > 0:
-                file_size -= 1
-                file.seek(file_size)
-                char = file.read(1)
-                
-                if char == newline:
-                    if buffer:
-                        break
-                elif char == b'\r':
-                    # Handle potential \r\n line ending
-                    next_char = file.read(1)
-                    if next_char == newline:
-                        file_size -= 1
-                    if buffer:
-                        break
-                buffer.extend(char)
-            
-            file.seek(file_size + 1)
-            file.truncate()
-            file.write(new_text.encode())
-    
+
+            # Another run appended after our line, add the update as a new line instead
+            if file.tell() != self.__line_end:
+                file.write(f'{os.linesep}{new_text}'.encode())
+                self.__line_start = file.tell() - len(new_text.encode())
+            else:
+                file.seek(self.__line_start)
+                file.truncate()
+                file.write(new_text.encode())
+            self.__line_end = file.tell()
+
     def error(self, error_message, exception=""):
         error_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         self.update_last_line(f'START: {self.start_time} - ERROR {error_message}: {error_time}')
         log_message = f'{os.linesep}{error_time} - {self.script_name} - {error_message}{os.linesep}'
         if exception:
             log_message += f'{os.linesep}{exception}{os.linesep}'
-        with open(self.error_log_file, 'a') as file:
-            file.write(f'{os.linesep}{log_message}')
-    
+        with self.__lock:
+            with open(self.error_log_file, 'a') as file:
+                file.write(f'{os.linesep}{log_message}')
+
+            self.__event('error', message=error_message, exception=str(exception) if exception else None)
+            self.flush()
+
     def end(self, message=""):
         end_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         log_message = f'START: {self.start_time} - SUCCESS: {end_time} - RUN TIME: {round(self.current_run_time_seconds())}s'
         if message:
             log_message += f' - {message}'
+        if self.spans:
+            log_message += f' - TIMINGS: {self.timings_summary()}'
         self.update_last_line(log_message)
 
+        self.__event('end', message=message, run_time=round(self.current_run_time_seconds(), 3),
+            spans={name: {'seconds': round(seconds, 3), 'count': count} for name, (seconds, count) in self.spans.items()},
+            metrics=self.metrics.summary() if self.metrics else None)
+        self.flush()
+
+        if self.metrics and self.metrics_file:
+            self.metrics.write_textfile(self.metrics_file)
+
     def current_run_time_seconds(self):
-        return (datetime.datetime.now() - datetime.datetime.fromisoformat(self.start_time)).total_seconds()
+        return time.monotonic() - self.started
+
+    @contextmanager
+    def span(self, name):
+        """Time a block of work, totals per span name are reported at end()"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.monotonic() - started)
+
+    def add_span(self, name, seconds):
+        with self.__lock:
+            totals = self.spans.setdefault(name, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+
+    def timings_summary(self):
+        """Span totals and the untracked rest of the run, e.g. 'fetch 12.1s, write 3.0s, other 0.4s'"""
+        run_time = self.current_run_time_seconds()
+        parts = [f'{name} {seconds:.1f}s' for name, (seconds, _) in self.spans.items()]
+        parts.append(f'other {max(0.0, run_time - sum(seconds for seconds, _ in self.spans.values())):.1f}s')
+        return ', '.join(parts)
+
+    def flush(self):
+        """Append the buffered JSON lines events"""
+        with self.__lock:
+            if not self.__events:
+                return
+            with open(self.json_log_file, 'a') as file:
+                file.write(''.join(json.dumps(event) + '\n' for event in self.__events))
+            self.__events = []
+
+    def __event(self, event, **fields):
+        with self.__lock:
+            self.__events.append({
+                'event': event,
+                'script': self.script_name,
+                'start_time': self.start_time,
+                'time': datetime.datetime.now().isoformat(timespec='milliseconds'),
+                'elapsed': round(self.current_run_time_seconds(), 3),
+                **{key: value for key, value in fields.items() if value is not None}
+            })
+            if len(self.__events) >= self.__BUFFERED_EVENTS:
+                self.flush()
 
 # Example usage
 if __name__ == "__main__":
@@ -95,5 +159,5 @@ if __name__ == "__main__":
         raise Exception("Test Exception")
     except Exception as e:
         log.error("Test Error", e)
-        
+
     log.end()
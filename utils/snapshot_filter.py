@@ -0,0 +1,63 @@
+import numpy as np
+
+# Change detection for continuous price snapshots
+# CoinGecko refreshes a coin's market data every minute or so, a coin fetched again
+# before that comes back with the same last_updated. Such a snapshot repeats the
+# stored row, it only adds storage and zero length intervals to the rollups.
+# The filter keeps the api_last_updated of the latest stored snapshot per (currency,
+# coin), seeded from the latest_prices table, and drops rows that don't change it.
+# A snapshot is only remembered by commit() once its row is written (or spooled), so
+# a row lost to a failed write is not mistaken for a stored one on the next run.
+
+class SnapshotFilter:
+    def __init__(self):
+        self.last_updated = {} # currency -> {coin_id: epoch milliseconds}
+        self.seeded = False
+        self.reset_counts()
+
+    def reset_counts(self):
+        self.checked = 0
+        self.skipped = 0
+
+    def seed(self, rows):
+        """Load latest_prices rows (coin_id, currency, api_last_updated)"""
+        for row in rows:
+            timestamp = self.epoch_milliseconds(row.get('api_last_updated'))
+            if timestamp is not None:
+                self.last_updated.setdefault(row['currency'], {})[row['coin_id']] = timestamp
+        self.seeded = True
+
+    def changed(self, currency, rows):
+        """Rows whose api_last_updated is newer than the last one stored for their coin"""
+        last_updated = self.last_updated.setdefault(currency, {})
+        changed = []
+        for row in rows:
+            timestamp = self.epoch_milliseconds(row.get('api_last_updated'))
+            previous = last_updated.get(row['coin_id'])
+            if timestamp is not None and previous is not None and timestamp <= previous:
+                continue
+            changed.append(row)
+        self.checked += len(rows)
+        self.skipped += len(rows) - len(changed)
+        return changed
+
+    def commit(self, currency, rows):
+        """Remember the api_last_updated of rows that were written"""
+        last_updated = self.last_updated.setdefault(currency, {})
+        for row in rows:
+            timestamp = self.epoch_milliseconds(row.get('api_last_updated'))
+            if timestamp is not None and timestamp > last_updated.get(row['coin_id'], timestamp - 1):
+                last_updated[row['coin_id']] = timestamp
+
+    def skip_rate(self):
+        return self.skipped / self.checked if self.checked else 0.0
+
+    def summary(self):
+        return f"{self.skipped} of {self.checked} snapshots unchanged ({self.skip_rate():.0%} skipped)"
+
+    @staticmethod
+    def epoch_milliseconds(timestamp):
+        """Epoch milliseconds of an API ('...Z', '+00:00') or database (naive UTC) timestamp string"""
+        if timestamp is None:
+            return None
+        return int(np.datetime64(timestamp.rstrip('Z').split('+')[0], 'ms').astype(np.int64))
@@ -0,0 +1,87 @@
+import pytest
+from utils.batch_writer import BatchWriter
+from utils.testing import FakeStorage
+
+def price_rows(count, bad = ()):
+    return [{'coin_id': 'bad' if i in bad else f'coin-{i}', 'price': float(i)} for i in range(count)]
+
+def test_flush_writes_queued_rows_in_chunks():
+    storage = FakeStorage()
+    writer = BatchWriter(storage, None, chunk_size = 2)
+    writer.add_many('continuous_usd_prices', price_rows(5))
+
+    assert writer.flush() == {'continuous_usd_prices': 5}
+    assert storage.writes == 3
+    assert len(storage.tables['continuous_usd_prices']) == 5
+    assert writer.pending_rows() == 0
+
+def test_rejected_rows_are_isolated_and_counted():
+    storage = FakeStorage(reject = lambda row: row['coin_id'] == 'bad')
+    writer = BatchWriter(storage, None, chunk_size = 8)
+    writer.add_many('continuous_usd_prices', price_rows(8, bad = (3,)))
+
+    assert writer.flush() == {'continuous_usd_prices': 7}
+    assert writer.failed_rows == 1
+    assert 'bad' not in [row['coin_id'] for row in storage.tables['continuous_usd_prices']]
+
+def test_transient_error_is_retried_with_the_chunk_intact():
+    storage = FakeStorage(failures = [ConnectionError("reset"), TimeoutError("timeout")])
+    writer = BatchWriter(storage, None, chunk_size = 10, retries = 2, retry_seconds = 0)
+    writer.add_many('continuous_usd_prices', price_rows(10))
+
+    assert writer.flush() == {'continuous_usd_prices': 10}
+    assert storage.writes == 3
+    assert writer.failed_rows == 0
+
+def test_outage_keeps_rows_queued_without_splitting():
+    storage = FakeStorage()
+    storage.down = True
+    writer = BatchWriter(storage, None, chunk_size = 4, retries = 1, retry_seconds = 0)
+    writer.add_many('continuous_usd_prices', price_rows(10))
+
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    # The first chunk and its retry, the other chunks are not tried during the outage
+    assert storage.writes == 2
+    assert writer.pending_rows() == 10
+    assert writer.failed_rows == 0
+
+    storage.down = False
+    assert writer.flush() == {'continuous_usd_prices': 10}
+    assert [row['coin_id'] for row in storage.tables['continuous_usd_prices']] == [f'coin-{i}' for i in range(10)]
+
+def test_outage_after_some_chunks_keeps_only_the_unwritten_rows():
+    storage = FakeStorage(failures = [None, ConnectionError("reset")])
+    writer = BatchWriter(storage, None, chunk_size = 4, retries = 0)
+    writer.add_many('continuous_usd_prices', price_rows(10))
+
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    assert len(storage.tables['continuous_usd_prices']) == 4
+    assert writer.pending_rows() == 6
+
+def test_nothing_written_counts_as_failed_unless_duplicates_are_ignored():
+    class NothingWritten(FakeStorage):
+        def write(self, table, rows, upsert = False, ignore_duplicates = False):
+            self.writes += 1
+            return 0
+
+    writer = BatchWriter(NothingWritten(), None)
+    writer.add_many('coins', [{'id': 'bitcoin'}, {'id': 'ethereum'}], upsert = True)
+    writer.flush()
+    assert writer.failed_rows == 2
+
+    writer = BatchWriter(NothingWritten(), None)
+    writer.add_many('coins', [{'id': 'bitcoin'}, {'id': 'ethereum'}], upsert = True, ignore_duplicates = True)
+    writer.flush()
+    assert writer.failed_rows == 0
+
+def test_on_written_reports_only_written_rows():
+    storage = FakeStorage(reject = lambda row: row['coin_id'] == 'bad')
+    writer = BatchWriter(storage, None, chunk_size = 4)
+    written = []
+    writer.on_written = lambda table, rows: written.extend(row['coin_id'] for row in rows)
+    writer.add_many('continuous_usd_prices', price_rows(4, bad = (0,)))
+
+    writer.flush()
+    assert sorted(written) == ['coin-1', 'coin-2', 'coin-3']
@@ -0,0 +1,70 @@
+from utils.coin_universe import CoinUniverse, fingerprint
+
+BITCOIN = {'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin', 'platforms': {}}
+ETHEREUM = {'id': 'ethereum', 'symbol': 'eth', 'name': 'Ethereum', 'platforms': {}}
+USDC = {'id': 'usd-coin', 'symbol': 'usdc', 'name': 'USDC', 'platforms': {'ethereum': '0xa0b8', 'solana': 'EPjF'}}
+
+def ids(rows):
+    return [row['id'] for row in rows]
+
+def test_fingerprint_ignores_order_but_not_content():
+    assert fingerprint([BITCOIN, USDC]) == fingerprint([USDC, dict(BITCOIN)])
+    # Platforms are compared as sorted JSON
+    assert fingerprint([dict(USDC, platforms={'solana': 'EPjF', 'ethereum': '0xa0b8'})]) == fingerprint([USDC])
+    assert fingerprint([BITCOIN]) != fingerprint([dict(BITCOIN, name='Bitcoin (old)')])
+
+def test_first_sync_adds_every_coin(tmp_path):
+    universe = CoinUniverse(str(tmp_path / 'universe.sqlite'))
+    assert universe.is_empty() and universe.fingerprint() is None
+    diff = universe.diff([BITCOIN, USDC])
+    assert ids(diff.added) == ['bitcoin', 'usd-coin']
+    assert diff.added[1]['platforms'] == USDC['platforms']
+    assert not (diff.archived or diff.restored or diff.changed)
+    universe.close()
+
+def test_diff_finds_added_archived_restored_and_changed_coins(tmp_path):
+    universe = CoinUniverse(str(tmp_path / 'universe.sqlite'))
+    universe.seed([BITCOIN, ETHEREUM, dict(USDC, archived=True)])
+
+    coins = [dict(BITCOIN, name='Bitcoin Core'), USDC, {'id': 'solana', 'symbol': 'sol', 'name': 'Solana'}]
+    diff = universe.diff(coins)
+    assert ids(diff.added) == ['solana']
+    assert diff.archived == [dict(ETHEREUM, archived=True)]
+    assert diff.restored == [dict(USDC, archived=False)]
+    assert diff.changed == [dict(BITCOIN, name='Bitcoin Core', archived=False)]
+    assert str(diff) == "1 added, 1 archived, 1 restored, 1 changed"
+    universe.close()
+
+def test_committed_universe_diffs_empty_until_the_list_changes(tmp_path):
+    state_file = str(tmp_path / 'universe.sqlite')
+    universe = CoinUniverse(state_file)
+    universe.commit([BITCOIN, ETHEREUM])
+    universe.close()
+
+    # The state survives a restart
+    universe = CoinUniverse(state_file)
+    assert universe.fingerprint() == fingerprint([ETHEREUM, BITCOIN])
+    assert universe.diff([ETHEREUM, BITCOIN]).is_empty()
+
+    # Delisted coins stay archived and come back as restored
+    universe.commit([BITCOIN])
+    assert universe.diff([BITCOIN]).is_empty()
+    assert ids(universe.diff([BITCOIN, ETHEREUM]).restored) == ['ethereum']
+    universe.close()
+
+def test_uncommitted_diff_is_found_again(tmp_path):
+    universe = CoinUniverse(str(tmp_path / 'universe.sqlite'))
+    universe.commit([BITCOIN])
+    # A failed write skips commit(), the next run sees the same changes
+    assert ids(universe.diff([BITCOIN, ETHEREUM]).added) == ['ethereum']
+    assert ids(universe.diff([BITCOIN, ETHEREUM]).added) == ['ethereum']
+    assert universe.fingerprint() == fingerprint([BITCOIN])
+    universe.close()
+
+def test_seed_replaces_the_known_coins_and_forgets_the_fingerprint(tmp_path):
+    universe = CoinUniverse(str(tmp_path / 'universe.sqlite'))
+    universe.commit([BITCOIN, ETHEREUM])
+    universe.seed([BITCOIN])
+    assert universe.fingerprint() is None
+    assert ids(universe.diff([BITCOIN, ETHEREUM]).added) == ['ethereum']
+    universe.close()
@@ -0,0 +1,94 @@
+import datetime
+import numpy as np
+import pytest
+from coingecko_api.fetch_planner import FetchPlanner
+from utils.freshness_scheduler import FreshnessScheduler
+
+NOW = 1_800_000_000.0
+
+def iso(epoch):
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).replace(tzinfo=None).isoformat()
+
+def freshness_rows(count, usd_age = None, btc_age = 0):
+    """price_freshness() rows, volume rising with the coin number, ages in seconds (None: never refreshed)"""
+    return [{
+        'coin_id': f'coin-{i:03d}', 'vol_24h': 1000 * (i + 1), 'price': 1.0, 'high_24h': 1.01, 'low_24h': 0.99,
+        'price_change_percentage_24h': 1.0,
+        'usd_created_at': None if usd_age is None else iso(NOW - usd_age),
+        'btc_created_at': None if btc_age is None else iso(NOW - btc_age)
+    } for i in range(count)]
+
+def five_ids_per_call():
+    # 'coin-000' is 8 characters, every further id adds 11 ('%2C' and the id)
+    return FetchPlanner(max_ids_length = 55)
+
+def test_target_interval_is_shorter_for_volume_and_volatility():
+    scheduler = FreshnessScheduler(min_interval = 60, max_interval = 3600)
+    intervals = scheduler.target_intervals([0.0, 5e5, 1e9], [0.0, 0.05, 0.5])
+    assert intervals[0] == pytest.approx(3600)
+    assert intervals[2] == pytest.approx(60)
+    assert 60 < intervals[1] < 3600
+
+def test_due_prices_are_cut_to_the_call_budget_most_urgent_first():
+    scheduler = FreshnessScheduler()
+    scheduler.load(freshness_rows(30))
+    plan, price_ids, market_ids = scheduler.select(five_ids_per_call(), [], call_budget = 2, now = NOW)
+
+    assert len(plan) <= 2
+    assert price_ids['btc'] == [] and market_ids == []
+    # Never refreshed coins are all due, ties go to the shortest target interval (the highest volume)
+    assert sorted(price_ids['usd']) == [f'coin-{i:03d}' for i in range(20, 30)]
+
+def test_coins_not_due_ride_along_in_the_planned_calls():
+    scheduler = FreshnessScheduler(fill_urgency = 0.5)
+    scheduler.load(freshness_rows(10, usd_age = 0))
+    usd_refreshed = NOW - 0.7 * scheduler.target_interval # urgency 0.7, not due but worth filling
+    usd_refreshed[:3] = np.nan # due
+    usd_refreshed[3:5] = NOW - 0.2 * scheduler.target_interval[3:5] # too fresh to fill
+    scheduler.refreshed_at['usd'] = usd_refreshed
+
+    plan, price_ids, _ = scheduler.select(five_ids_per_call(), [], call_budget = 10, now = NOW)
+    assert len(plan) == 1
+    assert len(price_ids['usd']) == 5
+    assert set(price_ids['usd'][:3]) == {'coin-000', 'coin-001', 'coin-002'}
+    assert not {'coin-003', 'coin-004'} & set(price_ids['usd'])
+
+def test_market_data_takes_the_remaining_budget():
+    scheduler = FreshnessScheduler()
+    scheduler.load(freshness_rows(20, usd_age = 0))
+    market_data_ids = [f'coin-{i:03d}' for i in reversed(range(20))]
+    plan, price_ids, market_ids = scheduler.select(five_ids_per_call(), market_data_ids, call_budget = 2, now = NOW)
+
+    assert price_ids == {'usd': [], 'btc': []}
+    assert market_ids == market_data_ids[:10]
+    assert len(plan) == 2
+
+def test_nothing_is_fetched_without_budget():
+    scheduler = FreshnessScheduler()
+    scheduler.load(freshness_rows(5))
+    plan, price_ids, market_ids = scheduler.select(five_ids_per_call(), ['coin-000'], call_budget = 0, now = NOW)
+    assert len(plan) == 0 and price_ids == {'usd': [], 'btc': []} and market_ids == []
+
+def test_call_budget_from_time_quota_and_measured_cost(tmp_path):
+    state_file = str(tmp_path / 'scheduler.json')
+    scheduler = FreshnessScheduler(state_file = state_file)
+    assert scheduler.call_budget(10, 100, default_seconds_per_call = 0.5) == 20
+    assert scheduler.call_budget(10, 5, default_seconds_per_call = 0.5) == 5
+
+    scheduler.record_run(calls = 4, seconds = 8)
+    scheduler.record_run(calls = 0, seconds = 3)
+    assert scheduler.call_budget(10, 100) == 5
+    # The cost estimate is an EWMA shared through the state file
+    scheduler.record_run(calls = 1, seconds = 12)
+    assert FreshnessScheduler(state_file = state_file).seconds_per_call == pytest.approx(2 + 0.3 * (12 - 2))
+
+def test_refreshed_coins_are_no_longer_stale():
+    scheduler = FreshnessScheduler()
+    scheduler.load(freshness_rows(4))
+    assert scheduler.staleness_distribution(NOW)['usd']['never'] == 4
+
+    scheduler.mark_refreshed('usd', ['coin-001', 'coin-002'], now = NOW)
+    distribution = scheduler.staleness_distribution(NOW + 30)
+    assert distribution['usd']['never'] == 2
+    assert distribution['usd']['max'] == pytest.approx(30)
+    assert distribution['btc']['never'] == 0
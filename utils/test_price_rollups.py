@@ -0,0 +1,116 @@
+import datetime
+import numpy as np
+import pytest
+from utils.price_rollups import price_bars, hourly_and_daily_bars, bars_to_rows, HOUR, DAY
+from utils.testing import create_coingecko_database
+
+def snapshots(seed = 7, coins = ('bitcoin', 'ethereum', 'solana'), hours = 60):
+    """Random snapshots sorted by (coin_id, created_at), a few without vol_24h"""
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2026-01-01T00:00:00', 's')
+    coin_ids, timestamps, prices, volumes = [], [], [], []
+    for coin in coins:
+        offsets = np.cumsum(rng.integers(60, 2400, size = hours * 3))
+        offsets = offsets[offsets < hours * 3600]
+        coin_ids += [coin] * len(offsets)
+        timestamps += list(start + offsets.astype('timedelta64[s]'))
+        prices += list(np.round(rng.uniform(1, 2, len(offsets)), 6))
+        coin_volumes = np.cumsum(rng.integers(-5000, 8000, len(offsets))).astype(np.float64) + 1e6
+        coin_volumes[rng.random(len(offsets)) < 0.05] = np.nan
+        volumes += list(coin_volumes)
+    return np.array(coin_ids), np.array(timestamps, dtype='datetime64[s]'), np.array(prices), np.array(volumes)
+
+def test_interval_volume_is_split_across_buckets():
+    # One hour between snapshots: 0 + 2400 / 24 * 1 = 100 volume, half in each hour at the interval's mid price
+    bars = price_bars(
+        ['bitcoin', 'bitcoin'],
+        np.array(['2026-01-01T00:30:00', '2026-01-01T01:30:00'], dtype='datetime64[s]'),
+        [10.0, 20.0],
+        [2400.0, 2400.0]
+    )
+    assert bars['bucket_start'].astype(str).tolist() == ['2026-01-01T00:00:00', '2026-01-01T01:00:00']
+    assert bars['volume'].tolist() == [50, 50]
+    assert bars['vwap'].tolist() == [15.0, 15.0]
+    assert bars['twap'].tolist() == [10.0, 20.0]
+    assert bars['open'].tolist() == bars['close'].tolist() == [10.0, 20.0]
+    assert bars['price_snapshots'].tolist() == [1, 1]
+
+def test_vwap_falls_back_to_twap_without_volume():
+    bars = price_bars(
+        ['bitcoin'] * 3,
+        np.array(['2026-01-01T00:00:00', '2026-01-01T00:20:00', '2026-01-01T00:40:00'], dtype='datetime64[s]'),
+        [10.0, 13.0, 16.0],
+        [np.nan, np.nan, np.nan]
+    )
+    assert bars['volume'].tolist() == [0]
+    assert bars['vwap'].tolist() == bars['twap'].tolist() == [13.0]
+    assert (bars['high'][0], bars['low'][0]) == (16.0, 10.0)
+
+def test_hourly_and_daily_bars_match_separate_rollups():
+    coin_ids, timestamps, prices, volumes = snapshots()
+    hourly, daily = hourly_and_daily_bars(coin_ids, timestamps, prices, volumes)
+    for combined, bucket_seconds in ((hourly, HOUR), (daily, DAY)):
+        separate = price_bars(coin_ids, timestamps, prices, volumes, bucket_seconds)
+        for column in separate:
+            assert combined[column].tolist() == separate[column].tolist()
+
+    rows = bars_to_rows(daily, 'day')
+    assert rows[0]['day'] == '2026-01-01'
+    assert set(rows[0]) == {'coin_id', 'day', 'open', 'high', 'low', 'close', 'vwap', 'twap', 'volume', 'price_snapshots'}
+
+# The SQL price_bars() of custom_db_functions.sql on an embedded PostgreSQL (pgserver)
+@pytest.fixture(scope = 'module')
+def database(postgres_server):
+    import psycopg
+    connection = psycopg.connect(create_coingecko_database(postgres_server, 'price_rollups'), autocommit = True)
+    connection.execute('SET search_path TO coingecko')
+    yield connection
+    connection.close()
+
+def insert_snapshots(database, coin_ids, timestamps, prices, volumes):
+    database.execute('TRUNCATE continuous_usd_prices')
+    with database.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO continuous_usd_prices (coin_id, created_at, api_last_updated, price, vol_24h) VALUES (%s, %s, %s, %s, %s)',
+            [(coin_id, timestamp, timestamp, price, None if np.isnan(volume) else int(volume))
+                for coin_id, timestamp, price, volume in zip(coin_ids, timestamps.astype(datetime.datetime), prices, volumes)]
+        )
+
+def assert_bars_match(bars, expected):
+    """Rollup bar columns against price_bars() rows ordered by coin_id, bucket_start"""
+    assert len(bars['coin_id']) == len(expected)
+    for i, row in enumerate(expected):
+        coin_id, bucket_start, open_price, high, low, close, vwap, twap, volume, count = row
+        assert bars['coin_id'][i] == coin_id
+        assert bars['bucket_start'][i] == np.datetime64(bucket_start, 's')
+        assert [bars['open'][i], bars['high'][i], bars['low'][i], bars['close'][i]] == pytest.approx([open_price, high, low, close])
+        assert bars['vwap'][i] == pytest.approx(vwap, rel = 1e-9)
+        assert bars['twap'][i] == pytest.approx(twap, rel = 1e-9)
+        assert abs(int(bars['volume'][i]) - volume) <= 1
+        assert bars['price_snapshots'][i] == count
+
+@pytest.mark.parametrize('bucket, bucket_seconds', [('hour', HOUR), ('day', DAY)])
+def test_rollup_matches_sql_price_bars(database, bucket, bucket_seconds):
+    coin_ids, timestamps, prices, volumes = snapshots()
+    insert_snapshots(database, coin_ids, timestamps, prices, volumes)
+    expected = database.execute(
+        "SELECT * FROM price_bars('continuous_usd_prices', %s, '2025-12-01', '2026-02-01') ORDER BY coin_id, bucket_start", (bucket,)
+    ).fetchall()
+    assert_bars_match(price_bars(coin_ids, timestamps, prices, volumes, bucket_seconds), expected)
+
+def test_window_after_a_long_gap_keeps_the_carried_over_interval(database):
+    # The coin was paused for three days, the interval into the window starts long before it
+    coin_ids = np.array(['bitcoin'] * 4)
+    timestamps = np.array(['2026-01-01T10:30:00', '2026-01-01T11:30:00', '2026-01-04T10:10:00', '2026-01-04T10:50:00'], dtype='datetime64[s]')
+    prices = np.array([10.0, 11.0, 14.0, 15.0])
+    volumes = np.array([24000.0, 24100.0, 30000.0, 30100.0])
+    insert_snapshots(database, coin_ids, timestamps, prices, volumes)
+    expected = database.execute(
+        "SELECT * FROM price_bars('continuous_usd_prices', 'hour', '2026-01-04T00:00:00', '2026-01-05T00:00:00') ORDER BY coin_id, bucket_start"
+    ).fetchall()
+
+    bars = price_bars(coin_ids, timestamps, prices, volumes, HOUR)
+    in_window = bars['bucket_start'] >= np.datetime64('2026-01-04T00:00:00', 's')
+    bars = {column: values[in_window] for column, values in bars.items()}
+    assert bars['volume'][0] > 1000 # a share of the 2.9 day interval's volume
+    assert_bars_match(bars, expected)
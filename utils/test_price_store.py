@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from utils.price_store import PriceStore
+
+def filled_store(capacity = 4, resolution = 60):
+    store = PriceStore(capacity, resolution)
+    for minute, price in enumerate([10.0, 11.0, 9.0, 12.0, 13.0, 14.0]):
+        store.add('bitcoin', 'usd', 1_000_020 + minute * 60, price)
+    store.add('ethereum', 'btc', 1_000_020, 0.05)
+    return store
+
+def test_ring_buffer_keeps_the_latest_capacity_slots():
+    store = filled_store()
+    timestamps, prices = store.series('bitcoin', 'usd')
+    assert prices.tolist() == [9.0, 12.0, 13.0, 14.0]
+    assert timestamps.tolist() == [1_000_020 + minute * 60 for minute in range(2, 6)]
+    assert store.latest('bitcoin', 'usd') == (1_000_320, 14.0)
+
+def test_price_in_the_same_slot_replaces_older_ignored():
+    store = PriceStore(4, 60)
+    assert store.add('bitcoin', 'usd', 1_000_020, 10.0)
+    assert store.add('bitcoin', 'usd', 1_000_050, 11.0)
+    assert not store.add('bitcoin', 'usd', 999_000, 12.0)
+    assert store.series('bitcoin', 'usd')[1].tolist() == [11.0]
+
+def test_add_rows_reads_iso_timestamps():
+    store = PriceStore(4, 60)
+    added = store.add_rows('usd', [
+        {'coin_id': 'bitcoin', 'api_last_updated': '2026-01-01T00:00:00Z', 'price': 1.0},
+        {'coin_id': 'bitcoin', 'api_last_updated': '2026-01-01T00:05:00+00:00', 'price': 2.0},
+        {'coin_id': 'bitcoin', 'api_last_updated': None, 'price': 3.0}
+    ])
+    assert added == 2
+    assert store.latest('bitcoin', 'usd') == (int(np.datetime64('2026-01-01T00:05:00', 's').astype(np.int64)), 2.0)
+
+def test_snapshot_and_load_round_trip(tmp_path):
+    store = filled_store()
+    path = str(tmp_path / 'prices.npy')
+    store.snapshot(path)
+
+    loaded = PriceStore.load(path, capacity = 4, resolution = 60)
+    assert len(loaded) == len(store) == 2
+    for coin_id, currency in (('bitcoin', 'usd'), ('ethereum', 'btc')):
+        for expected, actual in zip(store.series(coin_id, currency), loaded.series(coin_id, currency)):
+            assert actual.tolist() == expected.tolist()
+    assert loaded.ohlc('bitcoin', 'usd', 3600, now = 1_000_400) == store.ohlc('bitcoin', 'usd', 3600, now = 1_000_400)
+
+    # The loaded store keeps its ring buffers going and takes new coins
+    assert loaded.add('bitcoin', 'usd', 1_000_380, 15.0)
+    assert loaded.series('bitcoin', 'usd')[1].tolist() == [12.0, 13.0, 14.0, 15.0]
+    assert loaded.add('solana', 'usd', 1_000_380, 150.0)
+    assert len(loaded) == 3
+
+def test_load_without_a_usable_snapshot_starts_empty(tmp_path):
+    assert len(PriceStore.load(None)) == 0
+    assert len(PriceStore.load(str(tmp_path / 'missing.npy'))) == 0
+
+    path = str(tmp_path / 'prices.npy')
+    filled_store(capacity = 4).snapshot(path)
+    assert len(PriceStore.load(path, capacity = 8)) == 0
+
+    with open(path, 'wb') as file:
+        file.write(b'not a snapshot')
+    assert len(PriceStore.load(path, capacity = 4)) == 0
+
+def test_ohlc_twap_and_percent_change():
+    store = PriceStore(10, 60)
+    for timestamp, price in ((0, 10.0), (60, 20.0), (120, 15.0)):
+        store.add('bitcoin', 'usd', 1_000_000 + timestamp, price)
+    now = 1_000_180
+
+    assert store.ohlc('bitcoin', 'usd', 600, now = now) == {'open': 10.0, 'high': 20.0, 'low': 10.0, 'close': 15.0, 'count': 3}
+    assert store.twap('bitcoin', 'usd', 600, now = now) == pytest.approx(15.0)
+    assert store.percent_change('bitcoin', 'usd', 180, now = now) == pytest.approx(50.0)
+    assert store.percent_change('bitcoin', 'usd', 3600, now = now) is None
@@ -0,0 +1,67 @@
+import pytest
+from utils.batch_writer import BatchWriter
+from utils.snapshot_filter import SnapshotFilter
+from utils.testing import FakeStorage
+
+def snapshot(coin_id, api_last_updated):
+    return {'coin_id': coin_id, 'api_last_updated': api_last_updated, 'price': 1.0}
+
+def seeded_filter():
+    snapshots = SnapshotFilter()
+    snapshots.seed([
+        {'coin_id': 'bitcoin', 'currency': 'usd', 'api_last_updated': '2026-01-01T00:01:00'},
+        {'coin_id': 'ethereum', 'currency': 'usd', 'api_last_updated': None}
+    ])
+    return snapshots
+
+def test_unchanged_snapshots_are_skipped():
+    snapshots = seeded_filter()
+    rows = [
+        snapshot('bitcoin', '2026-01-01T00:01:00.000Z'), # same as stored, API form
+        snapshot('bitcoin', '2026-01-01T00:00:30+00:00'), # older
+        snapshot('ethereum', '2026-01-01T00:00:00Z'), # nothing stored with a timestamp
+        snapshot('solana', '2026-01-01T00:00:00Z'), # never stored
+        snapshot('bitcoin', None) # no timestamp to compare
+    ]
+    assert [row['coin_id'] for row in snapshots.changed('usd', rows)] == ['ethereum', 'solana', 'bitcoin']
+    assert (snapshots.checked, snapshots.skipped) == (5, 2)
+    assert snapshots.summary() == "2 of 5 snapshots unchanged (40% skipped)"
+
+    # Currencies are tracked separately
+    assert snapshots.changed('btc', [snapshot('bitcoin', '2026-01-01T00:01:00Z')]) != []
+
+def test_commit_remembers_written_snapshots():
+    snapshots = seeded_filter()
+    newer = snapshot('bitcoin', '2026-01-01T00:02:00Z')
+    assert snapshots.changed('usd', [newer]) == [newer]
+    # Not committed yet, the same snapshot is still a change
+    assert snapshots.changed('usd', [newer]) == [newer]
+
+    snapshots.commit('usd', [newer])
+    assert snapshots.changed('usd', [newer]) == []
+    # An older row written late doesn't move the stored timestamp back
+    snapshots.commit('usd', [snapshot('bitcoin', '2026-01-01T00:00:00Z')])
+    assert snapshots.changed('usd', [snapshot('bitcoin', '2026-01-01T00:01:30Z')]) == []
+
+def test_rows_of_a_failed_write_are_not_committed():
+    storage = FakeStorage(reject = lambda row: row['coin_id'] == 'bad')
+    writer = BatchWriter(storage, None, chunk_size = 2, retries = 0)
+    snapshots = SnapshotFilter()
+    writer.on_written = lambda table, rows: snapshots.commit('usd', rows)
+
+    rows = [snapshot('bitcoin', '2026-01-01T00:00:00Z'), snapshot('bad', '2026-01-01T00:00:00Z')]
+    writer.add_many('continuous_usd_prices', snapshots.changed('usd', rows))
+    writer.flush()
+    # The rejected row is tried again on the next run, the written one is skipped
+    assert [row['coin_id'] for row in snapshots.changed('usd', rows)] == ['bad']
+
+    storage.down = True
+    rows = [snapshot('bitcoin', '2026-01-01T00:05:00Z')]
+    writer.add_many('continuous_usd_prices', snapshots.changed('usd', rows))
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    assert snapshots.changed('usd', rows) == rows
+
+    storage.down = False
+    writer.flush()
+    assert snapshots.changed('usd', rows) == []
@@ -0,0 +1,75 @@
+from utils.batch_writer import BatchWriter
+from utils.testing import FakeStorage
+from utils.write_spool import WriteSpool, SpoolWriter, SpoolFlusher
+
+def price_rows(count, bad = ()):
+    return [{'coin_id': 'bad' if i in bad else f'coin-{i}', 'created_at': f'2026-01-01T00:{i:02d}:00', 'price': float(i)} for i in range(count)]
+
+def spool_with_rows(tmp_path, rows):
+    spool = WriteSpool(str(tmp_path / 'spool.sqlite'))
+    spool.append('continuous_usd_prices', rows)
+    return spool
+
+def test_spool_writer_queues_rows_until_flush(tmp_path):
+    spool = WriteSpool(str(tmp_path / 'spool.sqlite'))
+    writer = SpoolWriter(spool)
+    spooled = []
+    writer.on_written = lambda table, rows: spooled.extend(rows)
+    writer.add_many('continuous_usd_prices', price_rows(3))
+    assert spool.pending_rows() == 0
+
+    assert writer.flush() == {'continuous_usd_prices': 3}
+    assert spool.pending_rows() == 3
+    assert len(spooled) == 3
+    assert spool.oldest_pending('continuous_usd_prices') == '2026-01-01T00:00:00'
+
+def test_flush_once_writes_and_removes_rows(tmp_path):
+    spool = spool_with_rows(tmp_path, price_rows(5))
+    storage = FakeStorage()
+    flusher = SpoolFlusher(spool, BatchWriter(storage, None, chunk_size = 2))
+
+    assert flusher.flush_once()
+    assert flusher.rows_written == 5
+    assert spool.pending_rows() == 0
+    assert not flusher.flush_once()
+
+def test_rejected_rows_are_removed_the_others_written(tmp_path):
+    spool = spool_with_rows(tmp_path, price_rows(6, bad = (2,)))
+    storage = FakeStorage(reject = lambda row: row['coin_id'] == 'bad')
+    writer = BatchWriter(storage, None, chunk_size = 6)
+    flusher = SpoolFlusher(spool, writer)
+
+    assert flusher.flush_once()
+    assert flusher.rows_written == 5
+    assert writer.failed_rows == 1
+    assert spool.pending_rows() == 0
+
+def test_outage_keeps_unwritten_rows_in_the_spool(tmp_path):
+    spool = spool_with_rows(tmp_path, price_rows(10))
+    storage = FakeStorage(failures = [None, ConnectionError("reset")])
+    flusher = SpoolFlusher(spool, BatchWriter(storage, None, chunk_size = 4, retries = 0))
+
+    assert not flusher.flush_once()
+    assert flusher.failures == 1
+    assert flusher.rows_written == 4
+    assert spool.pending_rows() == 6
+    assert spool.oldest_pending('continuous_usd_prices') == '2026-01-01T00:04:00'
+    # Released with a backoff, not claimable right away
+    assert spool.claim(10) is None
+
+def test_transient_error_while_isolating_a_rejected_row_loses_no_rows(tmp_path):
+    spool = spool_with_rows(tmp_path, price_rows(8, bad = (0,)))
+    # The chunk is rejected, its first half is rejected again, then the connection drops
+    storage = FakeStorage(reject = lambda row: row['coin_id'] == 'bad', failures = [None, None, ConnectionError("reset")])
+    flusher = SpoolFlusher(spool, BatchWriter(storage, None, chunk_size = 8, retries = 0))
+    flusher.backoff_seconds = lambda: 0
+
+    assert not flusher.flush_once()
+    written = len(storage.tables.get('continuous_usd_prices', []))
+    assert written == flusher.rows_written
+    assert written + spool.pending_rows() == 8
+
+    assert flusher.flush_once()
+    coin_ids = sorted(row['coin_id'] for row in storage.tables['continuous_usd_prices'])
+    assert coin_ids == sorted(f'coin-{i}' for i in range(1, 8))
+    assert spool.pending_rows() == 0
@@ -1,6 +1,10 @@
 from functools import wraps
 from pprint import pprint
 import io
+import os
+import json
+import requests
+from storage.base import Storage
 
 def test_function(func, *args, **kwargs):
     """
@@ -34,4 +38,76 @@ def get_comma_separated_values(values):
     if not isinstance(values, list) and not isinstance(values, tuple):
         values = [values]
 
-    return ','.join(values)
\ No newline at end of file
+    return ','.join(values)
+
+# In-memory storage backend for the offline tests of the writers
+# failures are raised by the next write calls in order (None lets a call through),
+# while down every write fails with a ConnectionError (an outage), and rows
+# matching reject(row) fail their whole write with a ValueError (a constraint error).
+class FakeStorage(Storage):
+    name = 'fake'
+
+    def __init__(self, failures = None, reject = None):
+        self.tables = {}
+        self.failures = list(failures or [])
+        self.reject = reject
+        self.down = False
+        self.writes = 0 # write calls, failed ones included
+
+    def write(self, table, rows, upsert = False, ignore_duplicates = False):
+        self.writes += 1
+        failure = self.failures.pop(0) if self.failures else None
+        if failure:
+            raise failure
+        if self.down:
+            raise ConnectionError("database unavailable")
+        if self.reject and any(self.reject(row) for row in rows):
+            raise ValueError(f"Rejected row in {table}")
+        self.tables.setdefault(table, []).extend(rows)
+        return len(rows)
+
+    def is_transient(self, exception):
+        return isinstance(exception, (ConnectionError, TimeoutError))
+
+# Stand-ins for the requests session of CoinGeckoAPI, responses are served in order
+class FakeResponse:
+    def __init__(self, status_code = 200, content = None, headers = None):
+        self.status_code = status_code
+        self.content = content if isinstance(content, bytes) else json.dumps(content).encode('utf-8')
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}")
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = [] # (url, headers) of every get
+
+    def get(self, url, headers = None, timeout = None, stream = False):
+        self.requests.append((url, headers or {}))
+        return self.responses.pop(0)
+
+# A database with the coingecko schema and custom_db_functions.sql on the postgres_server
+# fixture (conftest.py), returns its URI. Each test module creates its own database.
+DB_SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db_scripts')
+
+def create_coingecko_database(server, name):
+    import psycopg
+    with psycopg.connect(server.get_uri(), autocommit = True) as connection:
+        connection.execute(f'CREATE DATABASE {name}')
+    with psycopg.connect(server.get_uri(name), autocommit = True) as connection:
+        connection.execute('CREATE SCHEMA coingecko')
+        connection.execute('SET search_path TO coingecko')
+        for script in ('coingecko_schema.sql', 'custom_db_functions.sql'):
+            with open(os.path.join(DB_SCRIPTS, script)) as file:
+                connection.execute(file.read())
+    return server.get_uri(name)
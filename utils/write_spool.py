@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# Durable local spool for database writes
+# Rows are appended to a SQLite (WAL) file and drained to the database by a
+# SpoolFlusher thread, so fetching never waits on the database and rows
+# survive database outages and restarts. Rows are claimed with a lease before
+# they are written and deleted afterwards: several processes can drain the same
+# spool, and rows of a process that died mid-write are retried (at least once).
+class WriteSpool:
+    def __init__(self, spool_file, lease_seconds = 120):
+        directory = os.path.dirname(os.path.abspath(spool_file))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.spool_file = spool_file
+        self.lease_seconds = lease_seconds
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(spool_file, timeout = 30, isolation_level = None, check_same_thread = False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=NORMAL')
+        self.__connection.execute("""
+            CREATE TABLE IF NOT EXISTS spool (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                upsert INTEGER NOT NULL,
+                ignore_duplicates INTEGER NOT NULL,
+                row TEXT NOT NULL,
+                available_at REAL NOT NULL
+            )
+        """)
+        self.__connection.execute('CREATE INDEX IF NOT EXISTS spool_available_at_idx ON spool (available_at, seq)')
+
+    def append(self, table, rows, upsert = False, ignore_duplicates = False):
+        """Durably queue rows for table, returns the number of rows queued"""
+        if not rows:
+            return 0
+        with self.__lock:
+            self.__connection.execute('BEGIN IMMEDIATE')
+            try:
+                self.__connection.executemany(
+                    'INSERT INTO spool (table_name, upsert, ignore_duplicates, row, available_at) VALUES (?, ?, ?, ?, 0)',
+                    [(table, int(upsert), int(ignore_duplicates), json.dumps(row)) for row in rows]
+                )
+                self.__connection.execute('COMMIT')
+            except BaseException:
+                self.__connection.execute('ROLLBACK')
+                raise
+        return len(rows)
+
+    def pending_rows(self):
+        with self.__lock:
+            return self.__connection.execute('SELECT COUNT(*) FROM spool').fetchone()[0]
+
+    def oldest_pending(self, table, column = 'created_at'):
+        """Smallest value of column (an ISO timestamp) over the rows of table still in the spool, or None"""
+        with self.__lock:
+            return self.__connection.execute(
+                'SELECT MIN(json_extract(row, ?)) FROM spool WHERE table_name = ?', (f'$.{column}', table)
+            ).fetchone()[0]
+
+    def claim(self, limit):
+        """
+            Lease up to limit of the oldest available rows that share a table and write mode
+            Returns (seqs, table, upsert, ignore_duplicates, rows), or None if nothing is available
+        """
+        with self.__lock:
+            now = time.time()
+            self.__connection.execute('BEGIN IMMEDIATE')
+            try:
+                first = self.__connection.execute(
+                    'SELECT table_name, upsert, ignore_duplicates FROM spool WHERE available_at <= ? ORDER BY seq LIMIT 1', (now,)
+                ).fetchone()
+                if not first:
+                    self.__connection.execute('COMMIT')
+                    return None
+
+                claimed = self.__connection.execute(
+                    'SELECT seq, row FROM spool WHERE available_at <= ? AND table_name = ? AND upsert = ? AND ignore_duplicates = ? ORDER BY seq LIMIT ?',
+                    (now,) + tuple(first) + (limit,)
+                ).fetchall()
+                seqs = [seq for seq, _ in claimed]
+                self.__connection.executemany('UPDATE spool SET available_at = ? WHERE seq = ?', [(now + self.lease_seconds, seq) for seq in seqs])
+                self.__connection.execute('COMMIT')
+            except BaseException:
+                self.__connection.execute('ROLLBACK')
+                raise
+
+        return seqs, first[0], bool(first[1]), bool(first[2]), [json.loads(row) for _, row in claimed]
+
+    def complete(self, seqs):
+        """Remove written rows"""
+        with self.__lock:
+            self.__connection.executemany('DELETE FROM spool WHERE seq = ?', [(seq,) for seq in seqs])
+
+    def release(self, seqs, retry_in = 0):
+        """Return claimed rows to the spool, available again after retry_in seconds"""
+        with self.__lock:
+            available_at = time.time() + retry_in
+            self.__connection.executemany('UPDATE spool SET available_at = ? WHERE seq = ?', [(available_at, seq) for seq in seqs])
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+# Drop-in for BatchWriter in the collectors: flush() appends the queued rows to the spool
+# and returns {table: rows spooled}, the SpoolFlusher writes them to the database
+# on_written(table, rows) is called once rows are durably spooled.
+class SpoolWriter:
+    def __init__(self, spool, log = None):
+        self.spool = spool
+        self.log = log
+        self.on_written = None
+        self.__pending = {} # (table, upsert, ignore_duplicates) -> rows
+
+    def add(self, table, row, upsert = False, ignore_duplicates = False):
+        self.__pending.setdefault((table, upsert, ignore_duplicates), []).append(row)
+
+    def add_many(self, table, rows, upsert = False, ignore_duplicates = False):
+        if rows:
+            self.__pending.setdefault((table, upsert, ignore_duplicates), []).extend(rows)
+
+    def pending_rows(self, table = None):
+        return sum(len(rows) for (pending_table, _, _), rows in self.__pending.items() if table in (None, pending_table))
+
+    def flush(self, table = None):
+        rows_spooled = {}
+        for key in list(self.__pending):
+            pending_table, upsert, ignore_duplicates = key
+            if table is not None and pending_table != table:
+                continue
+            rows = self.__pending.pop(key)
+            spooled = self.spool.append(pending_table, rows, upsert, ignore_duplicates)
+            rows_spooled[pending_table] = rows_spooled.get(pending_table, 0) + spooled
+            if self.on_written:
+                self.on_written(pending_table, rows)
+        return rows_spooled
+
+# Background thread draining a WriteSpool through a BatchWriter
+# Rows the database rejects (constraint or data errors) are isolated by the
+# BatchWriter's chunk splitting and logged, anything else (network errors,
+# timeouts, overload) is retried with exponential backoff without losing rows.
+class SpoolFlusher(threading.Thread):
+    def __init__(self, spool, writer, batch_size = 2000, idle_seconds = 1.0, max_backoff_seconds = 60):
+        super().__init__(name = 'SpoolFlusher', daemon = True)
+        self.spool = spool
+        self.writer = writer
+        self.batch_size = batch_size
+        self.idle_seconds = idle_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.rows_written = 0
+        self.failures = 0 # consecutive failed writes
+        self.__stop = threading.Event()
+
+    def run(self):
+        while not self.__stop.is_set():
+            if not self.flush_once():
+                self.__stop.wait(self.idle_seconds if self.failures == 0 else self.backoff_seconds())
+
+    def flush_once(self):
+        """Write one claimed batch, returns False if nothing was available or the write failed"""
+        claimed = self.spool.claim(self.batch_size)
+        if not claimed:
+            return False
+        seqs, table, upsert, ignore_duplicates, rows = claimed
+
+        # Rows the database rejects are isolated by the BatchWriter's chunk splitting, logged and
+        # removed, rows a transient error left unwritten go back to the spool for a later attempt
+        written, unwritten, error = self.writer.write_isolated(table, rows, upsert, ignore_duplicates)
+        unwritten_ids = {id(row) for row in unwritten}
+        self.spool.complete([seq for seq, row in zip(seqs, rows) if id(row) not in unwritten_ids])
+        self.rows_written += written
+        if error:
+            self.failures += 1
+            if self.failures == 1 and self.writer.log:
+                self.writer.log.error(f"Error writing spooled rows to {table}, {len(unwritten)} rows kept for a retry", error)
+            self.spool.release([seq for seq, row in zip(seqs, rows) if id(row) in unwritten_ids], self.backoff_seconds())
+            return False
+
+        self.failures = 0
+        return True
+
+    def is_transient(self, exception):
+        return self.writer.storage.is_transient(exception)
+
+    def backoff_seconds(self):
+        return min(self.max_backoff_seconds, 2 ** min(self.failures, 16))
+
+    def drain(self, timeout):
+        """Wait up to timeout seconds for the spool to empty, returns the number of rows left"""
+        deadline = time.monotonic() + timeout
+        pending = self.spool.pending_rows()
+        while pending and time.monotonic() < deadline and self.is_alive():
+            time.sleep(min(0.2, max(0.0, deadline - time.monotonic())))
+            pending = self.spool.pending_rows()
+        return pending
+
+    def stop(self, timeout = None):
+        self.__stop.set()
+        self.join(timeout)
+
+    def wait_for_capacity(self, max_pending_rows, timeout):
+        """Backpressure for producers: wait up to timeout seconds while the spool holds more than max_pending_rows"""
+        deadline = time.monotonic() + timeout
+        while self.spool.pending_rows() > max_pending_rows:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.2)
+        return True